@@ -1,13 +1,101 @@
 from fastapi import APIRouter, HTTPException, Query
-from aws_clients import apprunner_client, cloudwatch_client
-from datetime import datetime, timedelta
+from aws_clients import apprunner_client
+from aws_executor import run_aws
+from apprunner_restart import RestartJobManager
+from inventory_snapshot import snapshot
+from metrics_engine import metrics_engine
+from persistent_cache import persistent_cache
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import time
 
 router = APIRouter()
+restart_jobs = RestartJobManager(apprunner_client, persistent=persistent_cache)
+
+MAX_STALENESS_QUERY = Query(
+    None, ge=0, description="可接受的快照資料秒數；快照夠新時直接由記憶體回應，不呼叫 AWS"
+)
+
+
+async def _list_service_summaries(counter=None):
+    """
+    逐頁取得所有服務；botocore 沒有 apprunner list_services 的 paginator，
+    因此自行以 NextToken 翻頁，每頁各自經過 run_aws
+    """
+    summaries = []
+    token = None
+    while True:
+        params = {"MaxResults": 20}
+        if token:
+            params["NextToken"] = token
+        response = await run_aws("apprunner", apprunner_client.list_services, **params)
+        if counter is not None:
+            counter["calls"] += 1
+        summaries.extend(response["ServiceSummaryList"])
+        token = response.get("NextToken")
+        if not token:
+            return summaries
+
+
+async def _describe_services(summaries, known=None, counter=None):
+    """
+    同時對多個服務呼叫 describe_service（併發數由 aws_executor 的 apprunner 上限控制）；
+    known 中 UpdatedAt / Status 未變動的服務直接沿用，不再呼叫。
+    單一服務失敗（已刪除、AccessDenied、throttle）時以 list_services 的摘要加上 "error" 代替，
+    不影響其他服務。
+    """
+    known = known or {}
+
+    async def describe(summary):
+        old = known.get(summary["ServiceArn"])
+        if (
+            old is not None and "error" not in old
+            and old.get("UpdatedAt") == summary.get("UpdatedAt") and old["Status"] == summary["Status"]
+        ):
+            return old
+        if counter is not None:
+            counter["calls"] += 1
+        try:
+            response = await run_aws("apprunner", apprunner_client.describe_service, ServiceArn=summary["ServiceArn"])
+        except Exception as e:
+            return {**summary, "error": str(e)}
+        return response["Service"]
+
+    return await asyncio.gather(*[describe(summary) for summary in summaries])
+
+
+async def _fetch_service_inventory(collection):
+    """只對 UpdatedAt / Status 有變動的服務呼叫 describe_service"""
+    summaries = await _list_service_summaries()
+    services = await _describe_services(summaries, known=collection.items)
+    return {service["ServiceArn"]: service for service in services}
+
+
+def service_dimensions(service_arn):
+    """
+    App Runner 的 CloudWatch metrics 以 ServiceName + ServiceID 為 dimensions，
+    可直接由 ARN（arn:aws:apprunner:region:account:service/name/id）解析
+    """
+    parts = service_arn.split(":", 5)[-1].split("/")
+    if len(parts) < 3 or parts[0] != "service":
+        raise ValueError(f"Invalid App Runner service ARN: {service_arn}")
+    return [("ServiceName", parts[1]), ("ServiceID", parts[2])]
+
+
+snapshot.register(
+    "apprunner_services",
+    _fetch_service_inventory,
+    indexes={"status": lambda service: [service["Status"]]},
+)
 
 
 @router.get("/services", summary="列出所有 App Runner 服務")
-def list_apprunner_services():
-    services = apprunner_client.list_services()["ServiceSummaryList"]
+async def list_apprunner_services(max_staleness: Optional[float] = MAX_STALENESS_QUERY):
+    if snapshot.fresh("apprunner_services", max_staleness):
+        services = snapshot.collection("apprunner_services").query()
+    else:
+        services = await _list_service_summaries()
     return [
         {
             "ServiceName": s["ServiceName"],
@@ -27,53 +115,208 @@ def get_deployment_history(service_arn: str = Query(..., description="App Runner
 
 
 @router.get("/service/health", summary="取得服務健康狀態")
-def get_service_health(service_arn: str = Query(..., description="App Runner 服務 ARN")):
+def get_service_health(
+    service_arn: str = Query(..., description="App Runner 服務 ARN"),
+    max_staleness: Optional[float] = MAX_STALENESS_QUERY,
+):
     try:
-        response = apprunner_client.describe_service(ServiceArn=service_arn)
+        service = None
+        if snapshot.fresh("apprunner_services", max_staleness):
+            service = snapshot.collection("apprunner_services").items.get(service_arn)
+        if service is None:
+            service = apprunner_client.describe_service(ServiceArn=service_arn)["Service"]
         return {
-            "Status": response["Service"]["Status"],
-            "HealthStatus": response["Service"].get("HealthStatus", "Unknown"),
-            "ServiceUrl": response["Service"].get("ServiceUrl"),
+            "Status": service["Status"],
+            "HealthStatus": service.get("HealthStatus", "Unknown"),
+            "ServiceUrl": service.get("ServiceUrl"),
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# error-metrics 查詢的 series：(回傳名稱, MetricName, Stat)
+ERROR_METRIC_SERIES = [
+    ("Requests", "Requests", "Sum"),
+    ("2XXResponses", "2XXResponses", "Sum"),
+    ("4XXResponses", "4XXResponses", "Sum"),
+    ("5XXResponses", "5XXResponses", "Sum"),
+    ("RequestLatencyP50", "RequestLatency", "p50"),
+    ("RequestLatencyP90", "RequestLatency", "p90"),
+    ("RequestLatencyP99", "RequestLatency", "p99"),
+]
+
+
+def _error_metrics_response(service_arn, window):
+    """把 metrics 引擎的結果整理成對齊的 series；缺少的 bucket 計數補 0、延遲為 None"""
+    series = {}
+    for (name, _, stat), values in zip(ERROR_METRIC_SERIES, window.values):
+        series[name] = [(v or 0.0) for v in values] if stat == "Sum" else values
+
+    def rate(errors, requests):
+        return round(errors / requests, 4) if requests else None
+
+    requests = series["Requests"]
+    totals = {name: sum(series[name]) for name, _, stat in ERROR_METRIC_SERIES if stat == "Sum"}
+    totals["ErrorRate4XX"] = rate(totals["4XXResponses"], totals["Requests"])
+    totals["ErrorRate5XX"] = rate(totals["5XXResponses"], totals["Requests"])
+    start = window.buckets[0] if window.buckets else None
+    end = window.buckets[-1] + window.period if window.buckets else None
+    return {
+        "ServiceArn": service_arn,
+        "StartTime": datetime.fromtimestamp(start, timezone.utc).isoformat() if start is not None else None,
+        "EndTime": datetime.fromtimestamp(end, timezone.utc).isoformat() if end is not None else None,
+        "Period": window.period,
+        "Timestamps": window.timestamps(),
+        "Series": series,
+        "ErrorRate4XX": [rate(e, r) for e, r in zip(series["4XXResponses"], requests)],
+        "ErrorRate5XX": [rate(e, r) for e, r in zip(series["5XXResponses"], requests)],
+        "Totals": totals,
+        "upstream_calls": window.upstream_calls,
+    }
+
+
 @router.get("/service/error-metrics", summary="查詢錯誤率與請求失敗率")
-def get_error_metrics(
+async def get_error_metrics(
     service_arn: str = Query(..., description="App Runner 服務 ARN"),
-    minutes: int = Query(60, description="查詢過去幾分鐘內的錯誤率")
+    minutes: int = Query(60, ge=5, le=20160, description="查詢過去幾分鐘內的錯誤率"),
+    end_time: Optional[datetime] = Query(None, description="時間窗結束時間（ISO 8601），預設為現在"),
+    max_points: int = Query(120, ge=10, le=1440, description="每個 series 最多幾個 datapoint，用來決定 period"),
 ):
     try:
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(minutes=minutes)
-
-        metrics = cloudwatch_client.get_metric_statistics(
-            Namespace="AWS/AppRunner",
-            MetricName="4XXResponses",
-            Dimensions=[{"Name": "ServiceArn", "Value": service_arn}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=300,
-            Statistics=["Sum"]
-        )
-        return {
-            "MetricName": "4XXResponses",
-            "StartTime": start_time.isoformat(),
-            "EndTime": end_time.isoformat(),
-            "Datapoints": metrics.get("Datapoints", [])
-        }
+        dimensions = service_dimensions(service_arn)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        now = time.time()
+        end = min(end_time.replace(tzinfo=end_time.tzinfo or timezone.utc).timestamp() if end_time else now, now)
+        specs = [
+            ("AWS/AppRunner", metric_name, dimensions, stat)
+            for _, metric_name, stat in ERROR_METRIC_SERIES
+        ]
+        # 已結束的 bucket 由引擎快取，滑動時間窗或查詢過去的時間窗只會抓缺少的部分
+        window = await metrics_engine.query(specs, end - minutes * 60, end, period=60, max_points=max_points)
+        return _error_metrics_response(service_arn, window)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/service/restart", summary="重啟 App Runner 服務")
-def restart_apprunner_service(service_arn: str = Query(..., description="App Runner 服務 ARN")):
+@router.post("/service/restart", status_code=202, summary="重啟 App Runner 服務（背景工作）")
+async def restart_apprunner_service(service_arn: str = Query(..., description="App Runner 服務 ARN")):
+    job, created = await restart_jobs.submit(service_arn)
+    return {
+        "message": "Service restart started" if created else "Service restart already in progress",
+        "status_url": f"/apprunner/service/restart/{job['job_id']}",
+        **job,
+    }
+
+
+@router.get("/service/restart/{job_id}", summary="查詢重啟工作的狀態與各步驟耗時")
+async def get_restart_job(job_id: str):
+    job = await restart_jobs.get(job_id)
+    if job is None:
+        detail = f"Restart job {job_id} not found"
+        if restart_jobs.persistent is None:
+            # 未啟用持久化快取時工作只存在建立它的 worker
+            detail += " (without PERSISTENT_CACHE_PATH, jobs are only visible on the worker that created them)"
+        raise HTTPException(status_code=404, detail=detail)
+    return job
+
+
+@router.get("/service/restart-jobs", summary="列出重啟工作")
+async def list_restart_jobs(active_only: bool = Query(False, description="只列出進行中的工作")):
+    return {"jobs": await restart_jobs.list(active_only)}
+
+
+# dashboard 每個服務查詢的 metrics：(回傳欄位, MetricName, Stat)
+DASHBOARD_METRICS = [
+    ("requests", "Requests", "Sum"),
+    ("responses_2xx", "2XXResponses", "Sum"),
+    ("responses_4xx", "4XXResponses", "Sum"),
+    ("responses_5xx", "5XXResponses", "Sum"),
+    ("latency_avg_ms", "RequestLatency", "Average"),
+    ("latency_p99_ms", "RequestLatency", "p99"),
+]
+
+
+def _aggregate_dashboard_metrics(series):
+    """
+    把每分鐘的 series 彙總成整個時間窗的數值：計數相加、平均延遲以請求數加權；
+    p99 無法由各分鐘合併，取各分鐘 p99 的最大值（保守上界）。
+    """
+    metrics = {}
+    for field, _, stat in DASHBOARD_METRICS:
+        values = [v for v in series[field] if v is not None]
+        if stat == "Sum":
+            metrics[field] = sum(values)
+        elif stat == "Average":
+            weighted = [(v, n) for v, n in zip(series[field], series["requests"]) if v is not None and n]
+            weight = sum(n for _, n in weighted)
+            if weight:
+                metrics[field] = round(sum(v * n for v, n in weighted) / weight, 2)
+            else:
+                metrics[field] = round(sum(values) / len(values), 2) if values else None
+        else:
+            metrics[field] = round(max(values), 2) if values else None
+    return metrics
+
+
+@router.get("/dashboard", summary="所有 App Runner 服務的狀態與請求 / 錯誤 / 延遲總覽")
+async def get_apprunner_dashboard(
+    minutes: int = Query(60, ge=5, le=1440, description="統計過去幾分鐘的 metrics"),
+    max_staleness: Optional[float] = MAX_STALENESS_QUERY,
+):
     try:
-        apprunner_client.pause_service(ServiceArn=service_arn)
-        # 建議實務上可加入輪詢等待狀態切換完成
-        apprunner_client.resume_service(ServiceArn=service_arn)
-        return {"message": "Service restart triggered successfully"}
+        counter = {"calls": 0}
+        if snapshot.fresh("apprunner_services", max_staleness):
+            services = snapshot.collection("apprunner_services").query()
+        else:
+            summaries = await _list_service_summaries(counter)
+            services = await _describe_services(summaries, counter=counter)
+
+        # 以 60 秒 bucket 查詢再於本地彙總，已結束的 bucket 由 metrics 引擎快取，
+        # 重複輪詢只需補抓最新的 bucket
+        end = time.time()
+        specs = [
+            ("AWS/AppRunner", metric_name, service_dimensions(service["ServiceArn"]), stat)
+            for service in services
+            for _, metric_name, stat in DASHBOARD_METRICS
+        ]
+        window = await metrics_engine.query(specs, end - minutes * 60, end, period=60)
+        counter["calls"] += window.upstream_calls
+
+        dashboard = []
+        by_status = {}
+        for i, service in enumerate(services):
+            series = dict(zip(
+                (field for field, _, _ in DASHBOARD_METRICS),
+                window.values[i * len(DASHBOARD_METRICS):(i + 1) * len(DASHBOARD_METRICS)],
+            ))
+            metrics = _aggregate_dashboard_metrics(series)
+            requests = metrics["requests"]
+            metrics["error_rate_4xx"] = round(metrics["responses_4xx"] / requests, 4) if requests else None
+            metrics["error_rate_5xx"] = round(metrics["responses_5xx"] / requests, 4) if requests else None
+            by_status[service["Status"]] = by_status.get(service["Status"], 0) + 1
+            dashboard.append({
+                "ServiceName": service["ServiceName"],
+                "ServiceArn": service["ServiceArn"],
+                "Status": service["Status"],
+                "ServiceUrl": service.get("ServiceUrl"),
+                "UpdatedAt": service["UpdatedAt"].isoformat() if service.get("UpdatedAt") else None,
+                "metrics": metrics,
+                "error": service.get("error"),
+            })
+
+        buckets = window.buckets
+        return {
+            "start_time": datetime.fromtimestamp(buckets[0], timezone.utc).isoformat() if buckets else None,
+            "end_time": datetime.fromtimestamp(buckets[-1] + window.period, timezone.utc).isoformat() if buckets else None,
+            "services": dashboard,
+            "summary": {
+                "total": len(dashboard),
+                "by_status": by_status,
+                "errors": sum(1 for entry in dashboard if entry["error"]),
+            },
+            "upstream_calls": counter["calls"],
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
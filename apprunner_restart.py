@@ -0,0 +1,251 @@
+"""
+App Runner 服務重啟工作（背景執行）
+
+pause_service 送出後服務會進入 OPERATION_IN_PROGRESS，必須等到 PAUSED 才能 resume，
+整個過程可能要數分鐘。這裡把重啟做成背景 asyncio 工作：端點立即回傳 job ID，
+工作以 describe_service 輪詢（指數退避），依序經過 pausing → paused → resuming → running，
+輪詢之間不佔用任何 thread，可同時進行大量重啟。
+
+工作在建立它的 process 內執行。啟用持久化快取（PERSISTENT_CACHE_PATH）時，每次狀態變化都寫入磁碟，
+任何 uvicorn worker 都能查詢或列出其他 worker 的工作，同一服務也不會在兩個 worker 同時重啟；
+未啟用時工作只存在建立它的 worker，多個 workers 下查詢可能落在其他 worker 而回傳 404。
+
+環境變數：
+- APPRUNNER_RESTART_TIMEOUT：單一步驟等待狀態切換的上限秒數（預設 900）
+- APPRUNNER_RESTART_POLL_INITIAL / APPRUNNER_RESTART_POLL_MAX：輪詢間隔的起始與上限秒數（預設 2 / 30）
+- APPRUNNER_RESTART_PERSIST_TTL：工作在持久化快取中保留的秒數（預設 86400）
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from aws_executor import run_aws
+
+logger = logging.getLogger(__name__)
+
+RESTART_TIMEOUT = float(os.getenv("APPRUNNER_RESTART_TIMEOUT", 900))
+POLL_INITIAL = float(os.getenv("APPRUNNER_RESTART_POLL_INITIAL", 2))
+POLL_MAX = float(os.getenv("APPRUNNER_RESTART_POLL_MAX", 30))
+POLL_BACKOFF = 1.5
+MAX_FINISHED_JOBS = 500
+PERSIST_TTL = float(os.getenv("APPRUNNER_RESTART_PERSIST_TTL", 86400))
+PERSIST_NAMESPACE = "apprunner_restart"
+PERSIST_VERSION = 1
+
+ACTIVE_STATES = ("queued", "waiting", "pausing", "paused", "resuming")
+
+
+class RestartFailed(Exception):
+    pass
+
+
+class RestartJob:
+    def __init__(self, service_arn, clock=time.time):
+        self.id = uuid.uuid4().hex
+        self.service_arn = service_arn
+        self.state = "queued"
+        self.error = None
+        self.polls = 0
+        self._clock = clock
+        self.created_at = clock()
+        self.finished_at = None
+        # 每個狀態第一次進入的時間，用來算出各步驟花費的秒數
+        self.transitions = [("queued", self.created_at)]
+        self.task = None
+
+    @property
+    def done(self):
+        return self.state not in ACTIVE_STATES
+
+    def set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.transitions.append((state, self._clock()))
+        if self.done:
+            self.finished_at = self._clock()
+
+    def to_dict(self):
+        steps = {}
+        for (state, started), (_, ended) in zip(self.transitions, self.transitions[1:]):
+            steps[state] = round(steps.get(state, 0) + ended - started, 3)
+        if not self.done:
+            state, started = self.transitions[-1]
+            steps[state] = round(steps.get(state, 0) + self._clock() - started, 3)
+        end = self.finished_at if self.finished_at is not None else self._clock()
+        return {
+            "job_id": self.id,
+            "service_arn": self.service_arn,
+            "state": self.state,
+            "done": self.done,
+            "error": self.error,
+            "polls": self.polls,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round(end - self.created_at, 3),
+            "step_seconds": steps,
+        }
+
+
+class RestartJobManager:
+    """
+    管理 App Runner 重啟工作；同一服務同時只會有一個進行中的工作，
+    重複送出會回傳既有的工作。完成的工作保留最近 MAX_FINISHED_JOBS 筆供查詢。
+
+    persistent：選用的 PersistentCache，工作狀態寫入磁碟供其他 worker 查詢；
+    工作以 dict（to_dict 的格式）回傳，本機與其他 worker 的工作格式相同。
+    """
+
+    def __init__(self, client, timeout=RESTART_TIMEOUT, poll_initial=POLL_INITIAL, poll_max=POLL_MAX,
+                 sleep=asyncio.sleep, clock=time.time, persistent=None):
+        self.client = client
+        self.timeout = timeout
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self._sleep = sleep
+        self._clock = clock
+        self.persistent = persistent
+        self.jobs = OrderedDict()
+        self._active = {}
+
+    async def submit(self, service_arn):
+        """建立（或取得進行中的）重啟工作，立即回傳 (工作 dict, 是否新建立)"""
+        job = self._active.get(service_arn)
+        if job is not None:
+            return job.to_dict(), False
+        if self.persistent is None:
+            return self._start(service_arn).to_dict(), True
+        # 其他 worker 可能已有同一服務進行中的工作；以 lease 避免兩個 worker 同時建立
+        async with self.persistent.lease(f"{PERSIST_NAMESPACE}:{service_arn}", ttl=30):
+            existing = await self._persisted_active(service_arn)
+            if existing is not None:
+                return existing, False
+            job = self._start(service_arn)
+            await self._persist(job)
+            return job.to_dict(), True
+
+    def _start(self, service_arn):
+        job = RestartJob(service_arn, self._clock)
+        self.jobs[job.id] = job
+        self._active[service_arn] = job
+        job.task = asyncio.create_task(self._run(job))
+        self._trim()
+        return job
+
+    async def get(self, job_id):
+        """回傳工作 dict；本機沒有時查詢持久化快取（其他 worker 建立的工作）"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.persistent is None:
+            return None
+        entry = await self.persistent.call(self.persistent.get, PERSIST_NAMESPACE, f"job:{job_id}", PERSIST_VERSION)
+        return entry[0] if entry else None
+
+    async def list(self, active_only=False):
+        jobs = {}
+        if self.persistent is not None:
+            rows = await self.persistent.call(
+                self.persistent.get_range, PERSIST_NAMESPACE, "job:", "job;", PERSIST_VERSION
+            )
+            jobs = {job["job_id"]: job for _, job, _ in rows}
+        # 本機的工作比磁碟上的快照新
+        jobs.update((job.id, job.to_dict()) for job in self.jobs.values())
+        result = sorted(jobs.values(), key=lambda job: job["created_at"])
+        return [job for job in result if not job["done"]] if active_only else result
+
+    async def _persisted_active(self, service_arn):
+        entry = await self.persistent.call(
+            self.persistent.get, PERSIST_NAMESPACE, f"service:{service_arn}", PERSIST_VERSION
+        )
+        if entry is None:
+            return None
+        job = await self.get(entry[0])
+        return job if job is not None and not job["done"] else None
+
+    async def _persist(self, job):
+        """寫入工作目前的狀態；進行中的工作另外記錄 服務 -> 工作，供其他 worker 避免重複重啟"""
+        if self.persistent is None:
+            return
+        items = [(f"job:{job.id}", job.to_dict(), PERSIST_TTL)]
+        if not job.done:
+            # 建立工作的 worker 異常結束時，最晚在所有步驟逾時後允許重新送出
+            items.append((f"service:{job.service_arn}", job.id, 3 * self.timeout + 60))
+        try:
+            await self.persistent.call(self.persistent.put_many, PERSIST_NAMESPACE, items, PERSIST_VERSION)
+            if job.done:
+                await self.persistent.call(
+                    self.persistent.delete, PERSIST_NAMESPACE, f"service:{job.service_arn}"
+                )
+        except Exception as e:
+            # 持久化失敗不影響重啟本身，本機仍可查詢
+            logger.warning("Failed to persist App Runner restart job %s: %s", job.id, e)
+
+    async def _set_state(self, job, state):
+        job.set_state(state)
+        await self._persist(job)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    async def _status(self, job):
+        response = await run_aws("apprunner", self.client.describe_service, ServiceArn=job.service_arn)
+        job.polls += 1
+        return response["Service"]["Status"]
+
+    async def _wait_until(self, job, targets, previous=()):
+        """
+        以指數退避輪詢 describe_service，直到狀態進入 targets。
+        previous 為操作送出前的狀態：pause / resume 剛送出時 describe_service 可能仍短暫回報舊狀態，
+        視為切換尚未開始而繼續輪詢（仍受逾時限制），不當成失敗。
+        """
+        deadline = self._clock() + self.timeout
+        delay = self.poll_initial
+        while True:
+            status = await self._status(job)
+            if status in targets:
+                return status
+            if status != "OPERATION_IN_PROGRESS" and status not in previous:
+                raise RestartFailed(f"unexpected service status {status} while waiting for {'/'.join(targets)}")
+            if self._clock() + delay > deadline:
+                raise RestartFailed(f"timed out after {self.timeout:.0f}s waiting for {'/'.join(targets)}")
+            await self._sleep(delay)
+            delay = min(delay * POLL_BACKOFF, self.poll_max)
+
+    async def _run(self, job):
+        try:
+            # 服務若正在進行其他操作（例如部署），先等它結束
+            await self._set_state(job, "waiting")
+            status = await self._wait_until(job, ("RUNNING", "PAUSED"))
+            if status == "RUNNING":
+                await self._set_state(job, "pausing")
+                await run_aws("apprunner", self.client.pause_service, ServiceArn=job.service_arn)
+                await self._wait_until(job, ("PAUSED",), previous=("RUNNING",))
+            job.set_state("paused")
+            await self._set_state(job, "resuming")
+            await run_aws("apprunner", self.client.resume_service, ServiceArn=job.service_arn)
+            await self._wait_until(job, ("RUNNING",), previous=("PAUSED",))
+            await self._set_state(job, "running")
+        except asyncio.CancelledError:
+            job.error = "cancelled"
+            await self._set_state(job, "failed")
+            raise
+        except Exception as e:
+            logger.warning("App Runner restart %s failed: %s", job.service_arn, e)
+            job.error = str(e)
+            await self._set_state(job, "failed")
+        finally:
+            self._active.pop(job.service_arn, None)
+            job.task = None
+
+    async def shutdown(self):
+        """取消所有進行中的工作（應用程式結束時呼叫）"""
+        tasks = [job.task for job in self._active.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
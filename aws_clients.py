@@ -1,6 +1,24 @@
-import os
-from dotenv import load_dotenv
-import boto3
+import time
+
+# 在 import boto3 / botocore 之前記錄，import_ms 才包含它們的載入成本
+_IMPORT_STARTED_AT = time.perf_counter()
+
+import os  # noqa: E402
+import resource  # noqa: E402
+import threading  # noqa: E402
+from collections import OrderedDict  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
+import boto3  # noqa: E402
+import botocore.session  # noqa: E402
+from botocore.config import Config  # noqa: E402
+from botocore.credentials import (  # noqa: E402
+    CredentialProvider,
+    CredentialResolver,
+    DeferredRefreshableCredentials,
+)
+
+from aws_executor import MAX_WORKERS, parse_service_limits  # noqa: E402
+from rate_limiter import rate_limiter  # noqa: E402
 
 load_dotenv()
 
@@ -9,17 +27,347 @@ AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 
+# botocore 預設為 legacy 重試、每個 client 10 條連線；thread pool 較大時會出現 "Connection pool is full"
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "adaptive")
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", 8))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", 5))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", 30))
+# fan-out（跨帳號 / region）的 client 使用較短的逾時與較少的嘗試次數：fan_out 逾時只會放棄等待，
+# 無法中止 thread 上的 boto3 呼叫，要靠 botocore 自己在逾時附近結束，慢的帳號才不會佔滿 thread pool
+AWS_FANOUT_CONNECT_TIMEOUT = float(os.getenv("AWS_FANOUT_CONNECT_TIMEOUT", 3))
+AWS_FANOUT_READ_TIMEOUT = float(os.getenv("AWS_FANOUT_READ_TIMEOUT", 6))
+AWS_FANOUT_MAX_ATTEMPTS = int(os.getenv("AWS_FANOUT_MAX_ATTEMPTS", 2))
+# 預設與 thread pool 相同大小，每個 thread 都能拿到連線
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", MAX_WORKERS))
+AWS_POOL_CONNECTIONS = parse_service_limits(os.getenv("AWS_POOL_CONNECTIONS", ""), "AWS_POOL_CONNECTIONS")
+
+# 多 region / 多帳號：AWS_REGIONS 為 fan-out 端點預設查詢的 regions，
+# AWS_ACCOUNT_ROLES 為 "名稱=role ARN" 清單，以 AWS_ACCESS_KEY_ID 的身分 assume role 存取其他帳號
+AWS_REGIONS = [r.strip() for r in os.getenv("AWS_REGIONS", AWS_REGION).split(",") if r.strip()]
+AWS_DEFAULT_ACCOUNT = os.getenv("AWS_DEFAULT_ACCOUNT_NAME", "default")
+AWS_ASSUME_ROLE_DURATION = int(os.getenv("AWS_ASSUME_ROLE_DURATION", 3600))
+AWS_ASSUME_ROLE_SESSION_NAME = os.getenv("AWS_ASSUME_ROLE_SESSION_NAME", "cjc101-starscout")
+# client_pool 最多保留的 (帳號, region) registry 數，超過時移除最久未使用的
+AWS_CLIENT_POOL_MAX_REGISTRIES = int(os.getenv("AWS_CLIENT_POOL_MAX_REGISTRIES", 128))
+
+
+def _parse_account_roles(raw):
+    """解析 "prod=arn:aws:iam::111111111111:role/Monitor,staging=..." 格式的設定字串"""
+    roles = {}
+    for item in (raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, role_arn = item.partition("=")
+        if not sep or not name.strip() or not role_arn.strip().startswith("arn:"):
+            raise RuntimeError(f"Invalid AWS_ACCOUNT_ROLES entry: {item!r}")
+        roles[name.strip()] = role_arn.strip()
+    return roles
+
+
+AWS_ACCOUNT_ROLES = _parse_account_roles(os.getenv("AWS_ACCOUNT_ROLES", ""))
+
 
 if not AWS_ACCESS_KEY or not AWS_SECRET_KEY:
     raise RuntimeError("AWS_ACCESS_KEY and AWS_SECRET_KEY must be set in environment variables or in the .env file")
 
+
+def _current_rss_bytes():
+    """目前行程的 RSS（Linux 讀 /proc，其他平台退回 peak RSS）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_bytes()
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 bytes
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class ClientRegistry:
+    """
+    延遲建立的 boto3 client 註冊表
+
+    所有 client 共用同一個 boto3 Session（因此共用 botocore 的 loader 與
+    service model 快取），第一次使用時才建立並快取，之後重複使用。
+    config 為所有 client 共用的 botocore Config，pool_connections 可依服務覆寫連線池大小；
+    region_name 未指定時使用 Session 的 region。
+    """
+
+    def __init__(self, session, config=None, pool_connections=None, region_name=None):
+        self._session = session
+        self.region_name = region_name
+        self._config = config
+        self._pool_connections = dict(pool_connections or {})
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._event_hooks = []
+
+    def register_event_hook(self, event_name, handler):
+        """
+        在所有 client 註冊 botocore event hook（例如 "before-call"），
+        已建立的 client 立即套用，之後建立的 client 建立時套用。
+        """
+        with self._lock:
+            self._event_hooks.append((event_name, handler))
+            for client in self._clients.values():
+                client.meta.events.register(event_name, handler)
+
+    def client_config(self, service_name):
+        pool_size = self._pool_connections.get(service_name)
+        if pool_size is None:
+            return self._config
+        override = Config(max_pool_connections=pool_size)
+        return self._config.merge(override) if self._config is not None else override
+
+    def get(self, service_name):
+        client = self._clients.get(service_name)
+        if client is not None:
+            return client
+        # boto3 Session 建立 client 不是 thread-safe，需要上鎖
+        with self._lock:
+            client = self._clients.get(service_name)
+            if client is None:
+                rss_before = _current_rss_bytes()
+                started = time.perf_counter()
+                client = self._session.client(
+                    service_name, region_name=self.region_name, config=self.client_config(service_name)
+                )
+                for event_name, handler in self._event_hooks:
+                    client.meta.events.register(event_name, handler)
+                self._stats[service_name] = {
+                    "created_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "rss_delta_bytes": _current_rss_bytes() - rss_before,
+                }
+                self._clients[service_name] = client
+        return client
+
+    def loaded_services(self):
+        return sorted(self._clients)
+
+    def stats(self):
+        return {
+            "loaded_clients": self.loaded_services(),
+            "clients": dict(self._stats),
+            "pool_connections": {
+                name: client.meta.config.max_pool_connections for name, client in list(self._clients.items())
+            },
+        }
+
+
+class _StaticProvider(CredentialProvider):
+    """回傳固定 credentials 物件（可為 refreshable）的 credential provider"""
+
+    METHOD = "assume-role"
+    CANONICAL_NAME = "assume-role"
+
+    def __init__(self, credentials):
+        super().__init__()
+        self._credentials = credentials
+
+    def load(self):
+        return self._credentials
+
+
+class AssumedRole:
+    """
+    以 STS AssumeRole 取得另一個帳號的暫時憑證。
+
+    包成 botocore 的 refreshable credentials：第一次使用時才呼叫 STS，
+    之後快取到快過期（botocore 在到期前 15 分鐘更新），同一帳號的所有 region 與服務共用。
+    """
+
+    def __init__(self, sts_client, role_arn, session_name, duration, loader=None):
+        self._sts_client = sts_client
+        self.role_arn = role_arn
+        self.session_name = session_name
+        self.duration = duration
+        self._loader = loader
+        self.refreshes = 0
+        self.expires_at = None
+        self.credentials = DeferredRefreshableCredentials(self._refresh, method="assume-role")
+
+    def _refresh(self):
+        response = self._sts_client.assume_role(
+            RoleArn=self.role_arn, RoleSessionName=self.session_name, DurationSeconds=self.duration
+        )
+        credentials = response["Credentials"]
+        self.refreshes += 1
+        self.expires_at = credentials["Expiration"]
+        return {
+            "access_key": credentials["AccessKeyId"],
+            "secret_key": credentials["SecretAccessKey"],
+            "token": credentials["SessionToken"],
+            "expiry_time": credentials["Expiration"].isoformat(),
+        }
+
+    def session(self):
+        botocore_session = botocore.session.get_session()
+        if self._loader is not None:
+            # 與預設帳號共用 loader，service model 不重複載入
+            botocore_session.register_component("data_loader", self._loader)
+        # 以只有 assume role 的 credential resolver 取代預設的搜尋鏈（環境變數、設定檔等）
+        resolver = CredentialResolver([_StaticProvider(self.credentials)])
+        botocore_session.register_component("credential_provider", resolver)
+        return boto3.session.Session(botocore_session=botocore_session)
+
+    def stats(self):
+        return {
+            "role_arn": self.role_arn,
+            "refreshes": self.refreshes,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+        }
+
+
+class ClientPool:
+    """
+    依 (帳號, region) 管理 ClientRegistry。
+
+    預設帳號使用 AWS_ACCESS_KEY_ID 的 Session，其他帳號以 AssumedRole 的 Session；
+    每個帳號一個 Session、每個 (帳號, region) 一個 registry，都在第一次使用時才建立。
+    這些 registry 供 fan-out 使用，client 以 config（較短的逾時與嘗試次數）建立，
+    預設帳號與 region 也不與 default_registry 共用 client。
+    event hooks 套用到 default_registry 與所有 registry。
+    registry 最多保留 max_registries 個，超過時移除最久未使用的（使用中的 client 不受影響）。
+    """
+
+    def __init__(self, default_account, default_registry, base_session, roles, config=None, pool_connections=None,
+                 max_registries=AWS_CLIENT_POOL_MAX_REGISTRIES):
+        self.default_account = default_account
+        self.default_region = default_registry.region_name or base_session.region_name
+        self._base_session = base_session
+        self._roles = dict(roles)
+        self._config = config
+        self._pool_connections = pool_connections
+        self._sessions = {default_account: base_session}
+        self._assumed = {}
+        self._default_registry = default_registry
+        self._registries = OrderedDict()
+        self._max_registries = max_registries
+        self._event_hooks = []
+        self._lock = threading.RLock()
+
+    def accounts(self):
+        return [self.default_account, *self._roles]
+
+    def _session_for(self, account):
+        session = self._sessions.get(account)
+        if session is None:
+            role_arn = self._roles.get(account)
+            if role_arn is None:
+                raise KeyError(f"Unknown AWS account: {account}")
+            sts_client = self._default_registry.get("sts")
+            assumed = AssumedRole(
+                sts_client, role_arn, AWS_ASSUME_ROLE_SESSION_NAME, AWS_ASSUME_ROLE_DURATION,
+                loader=self._base_session._session.get_component("data_loader"),
+            )
+            session = assumed.session()
+            self._assumed[account] = assumed
+            self._sessions[account] = session
+        return session
+
+    def registry(self, account=None, region=None):
+        key = (account or self.default_account, region or self.default_region)
+        with self._lock:
+            registry = self._registries.get(key)
+            if registry is not None:
+                self._registries.move_to_end(key)
+                return registry
+            registry = ClientRegistry(
+                self._session_for(key[0]), config=self._config,
+                pool_connections=self._pool_connections, region_name=key[1],
+            )
+            for event_name, handler in self._event_hooks:
+                registry.register_event_hook(event_name, handler)
+            self._registries[key] = registry
+            while len(self._registries) > self._max_registries:
+                self._registries.popitem(last=False)
+        return registry
+
+    def client(self, service_name, account=None, region=None):
+        return self.registry(account, region).get(service_name)
+
+    def register_event_hook(self, event_name, handler):
+        with self._lock:
+            self._event_hooks.append((event_name, handler))
+            registries = [self._default_registry, *self._registries.values()]
+        for registry in registries:
+            registry.register_event_hook(event_name, handler)
+
+    def stats(self):
+        return {
+            "accounts": self.accounts(),
+            "registries": sorted(f"{account}/{region}" for account, region in list(self._registries)),
+            "max_registries": self._max_registries,
+            "assumed_roles": {account: assumed.stats() for account, assumed in list(self._assumed.items())},
+        }
+
+
+class LazyClient:
+    """
+    client 的代理物件，屬性存取時才向 registry 取得真正的 client。
+
+    讓既有的 `from aws_clients import ec2_client` 寫法維持不變，
+    但 import 時不會建立任何 client。
+    """
+
+    __slots__ = ("_registry", "_service_name")
+
+    def __init__(self, registry, service_name):
+        self._registry = registry
+        self._service_name = service_name
+
+    @property
+    def service_name(self):
+        return self._service_name
+
+    def resolve(self):
+        return self._registry.get(self._service_name)
+
+    def __getattr__(self, name):
+        return getattr(self._registry.get(self._service_name), name)
+
+    def __repr__(self):
+        return f"<LazyClient {self._service_name}>"
+
+
+session = boto3.session.Session(
+    aws_access_key_id=AWS_ACCESS_KEY,
+    aws_secret_access_key=AWS_SECRET_KEY,
+    region_name=AWS_REGION,
+)
+client_config = Config(
+    retries={"mode": AWS_RETRY_MODE, "total_max_attempts": AWS_MAX_ATTEMPTS},
+    connect_timeout=AWS_CONNECT_TIMEOUT,
+    read_timeout=AWS_READ_TIMEOUT,
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+)
+fanout_config = client_config.merge(Config(
+    retries={"mode": AWS_RETRY_MODE, "total_max_attempts": AWS_FANOUT_MAX_ATTEMPTS},
+    connect_timeout=AWS_FANOUT_CONNECT_TIMEOUT,
+    read_timeout=AWS_FANOUT_READ_TIMEOUT,
+))
+registry = ClientRegistry(session, config=client_config, pool_connections=AWS_POOL_CONNECTIONS, region_name=AWS_REGION)
+client_pool = ClientPool(
+    AWS_DEFAULT_ACCOUNT, registry, session, AWS_ACCOUNT_ROLES,
+    config=fanout_config, pool_connections=AWS_POOL_CONNECTIONS,
+)
+# 未經 run_aws 排隊的呼叫（例如 paginator 的後續頁面）在 thread 上依各 API 的速率限制等待
+client_pool.register_event_hook("before-call.*.*", rate_limiter.before_call)
+
+
 def create_boto3_client(service_name):
-    return boto3.client(
-        service_name,
-        aws_access_key_id=AWS_ACCESS_KEY,
-        aws_secret_access_key=AWS_SECRET_KEY,
-        region_name=AWS_REGION,
-    )
+    return LazyClient(registry, service_name)
+
+
+def get_client(service_name):
+    """取得（必要時建立）指定服務的 boto3 client"""
+    return registry.get(service_name)
+
 
 # 目前已包含的服務 clients
 ec2_client = create_boto3_client("ec2")
@@ -56,10 +404,27 @@ polly_client = create_boto3_client("polly")
 rekognition_client = create_boto3_client("rekognition")
 comprehend_client = create_boto3_client("comprehend")
 
-# Bedrock client (錯誤處理)
-try:
-    bedrock_client = create_boto3_client("bedrock")
-except Exception as e:
-    bedrock_client = None
-    print(f"Failed to initialize Bedrock client: {e}")
+# Bedrock client（延遲建立，實際使用時才會檢查服務是否可用）
+bedrock_client = create_boto3_client("bedrock")
+
+_IMPORT_FINISHED_AT = time.perf_counter()
+_ready_at = None
+
+
+def mark_ready():
+    """應用程式啟動完成時呼叫，用來計算 import 到 ready 的時間"""
+    global _ready_at
+    if _ready_at is None:
+        _ready_at = time.perf_counter()
+
 
+def startup_stats():
+    """啟動時間與記憶體使用量，用於比較調整前後的冷啟動成本"""
+    return {
+        "import_ms": round((_IMPORT_FINISHED_AT - _IMPORT_STARTED_AT) * 1000, 3),
+        "import_to_ready_ms": round((_ready_at - _IMPORT_STARTED_AT) * 1000, 3) if _ready_at else None,
+        "rss_bytes": _current_rss_bytes(),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        **registry.stats(),
+        "client_pool": client_pool.stats(),
+    }
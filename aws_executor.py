@@ -0,0 +1,114 @@
+"""
+共用的 AWS 非同步執行層
+
+boto3 為同步 I/O，直接在 `async def` handler 裡呼叫會卡住整個 event loop。
+這裡提供一個有上限的 thread pool，並依 AWS 服務限制同時進行中的呼叫數量，
+讓一個慢的 Cost Explorer 呼叫不會拖慢同一個 worker 上的其他請求。
+
+環境變數：
+- AWS_EXECUTOR_MAX_WORKERS：thread pool 大小（預設 32）
+- AWS_SERVICE_CONCURRENCY：各服務同時呼叫上限，例如 "ce=4,ec2=16,cloudwatch=16"
+- AWS_DEFAULT_SERVICE_CONCURRENCY：未指定服務的預設上限（預設 8）
+
+各 AWS API 的速率限制見 rate_limiter.py。
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limiter import client_operation, rate_limiter
+
+DEFAULT_MAX_WORKERS = 32
+DEFAULT_SERVICE_CONCURRENCY = 8
+
+
+def parse_service_limits(raw, setting="AWS_SERVICE_CONCURRENCY"):
+    """解析 "ce=4,ec2=16" 格式的設定字串"""
+    limits = {}
+    for item in (raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.partition("=")
+        try:
+            limits[name.strip()] = max(1, int(value))
+        except ValueError:
+            raise RuntimeError(f"Invalid {setting} entry: {item!r}")
+    return limits
+
+
+MAX_WORKERS = int(os.getenv("AWS_EXECUTOR_MAX_WORKERS", DEFAULT_MAX_WORKERS))
+SERVICE_LIMITS = parse_service_limits(os.getenv("AWS_SERVICE_CONCURRENCY", "ce=4"))
+DEFAULT_LIMIT = int(os.getenv("AWS_DEFAULT_SERVICE_CONCURRENCY", DEFAULT_SERVICE_CONCURRENCY))
+
+_executor = None
+_semaphores = {}
+
+
+def get_executor():
+    """取得（必要時建立）共用的 thread pool"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="aws")
+    return _executor
+
+
+def _get_semaphore(service):
+    # 每個 event loop 各自一組 semaphore，避免跨 loop 共用 asyncio 物件
+    loop = asyncio.get_running_loop()
+    key = (id(loop), service)
+    semaphore = _semaphores.get(key)
+    if semaphore is None:
+        name = service.partition("@")[0]
+        semaphore = asyncio.Semaphore(SERVICE_LIMITS.get(name, DEFAULT_LIMIT))
+        _semaphores[key] = semaphore
+    return semaphore
+
+
+async def run_aws(service, fn, *args, **kwargs):
+    """
+    在共用 thread pool 上執行同步的 boto3 呼叫。
+
+    service 為 AWS 服務名稱（例如 "ec2"、"ce"），用來套用各服務的同時呼叫上限；
+    超過上限的呼叫會在 event loop 上排隊，不會佔用 thread。
+    加上 "@範圍"（例如 "ec2@prod/eu-west-1"）時該範圍各自一組上限，跨 region fan-out 不互相排隊。
+    fn 為 boto3 client 方法且該 API 有速率限制時，先在 event loop 上等待 token。
+    """
+    loop = asyncio.get_running_loop()
+    operation = client_operation(fn)
+    if operation is not None and await rate_limiter.acquire_async(*operation):
+        call = functools.partial(rate_limiter.admitted, fn, *args, **kwargs)
+    else:
+        call = functools.partial(fn, *args, **kwargs)
+    async with _get_semaphore(service):
+        return await loop.run_in_executor(get_executor(), call)
+
+
+async def iter_pages(service, pages):
+    """在 thread pool 上逐頁取得 boto3 paginator 的結果，不阻塞 event loop"""
+    page_iter = iter(pages)
+    while True:
+        page = await run_aws(service, next, page_iter, None)
+        if page is None:
+            return
+        yield page
+
+
+def executor_stats():
+    """目前 thread pool 與各服務上限設定"""
+    return {
+        "max_workers": MAX_WORKERS,
+        "default_service_limit": DEFAULT_LIMIT,
+        "service_limits": dict(SERVICE_LIMITS),
+    }
+
+
+def shutdown_executor():
+    """關閉 thread pool（應用程式結束時呼叫）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    _semaphores.clear()
@@ -0,0 +1,108 @@
+"""
+跨帳號 / 跨 region 的並行查詢
+
+fan_out 對每個 (帳號, region) 同時執行同一個查詢，各自有逾時上限；
+某個 region 逾時或失敗時仍回傳其他 region 的結果，並在 targets 中標記狀態，
+因此整體耗時約等於最慢的 region，而不是各 region 耗時的總和。
+
+逾時由 asyncio.wait_for 實作，只會取消等待中的 coroutine（之後的分頁不再送出），
+已在 thread pool 上執行的 boto3 呼叫不會被中止，會繼續佔用 thread 直到它自己結束。
+因此 client_pool 的 client 以較短的 connect / read timeout 與較少的嘗試次數建立
+（AWS_FANOUT_CONNECT_TIMEOUT / AWS_FANOUT_READ_TIMEOUT / AWS_FANOUT_MAX_ATTEMPTS），
+單一呼叫最多約「嘗試次數 x (connect + read timeout)」秒，慢的帳號不會長時間佔滿 thread pool。
+
+環境變數：
+- AWS_FANOUT_TIMEOUT：每個 (帳號, region) 的逾時秒數（預設 20）
+"""
+
+import asyncio
+import functools
+import os
+import time
+
+import boto3
+from fastapi import HTTPException
+
+from aws_clients import AWS_REGIONS, client_pool
+from aws_executor import run_aws
+
+FANOUT_TIMEOUT = float(os.getenv("AWS_FANOUT_TIMEOUT", 20))
+
+@functools.lru_cache(maxsize=None)
+def _available_regions(service_name):
+    """botocore 內建 endpoint 資料中該 service 的 regions（不呼叫 AWS）"""
+    return frozenset(boto3.session.Session().get_available_regions(service_name))
+
+
+def resolve_accounts(accounts=None):
+    """未指定時為所有設定的帳號；帳號不存在時回 400"""
+    known = client_pool.accounts()
+    accounts = list(dict.fromkeys(accounts or known))
+    unknown = [account for account in accounts if account not in known]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown accounts: {', '.join(unknown)}")
+    return accounts
+
+
+def resolve_targets(accounts=None, regions=None, service_name="ec2"):
+    """
+    將查詢參數轉成 [(帳號, region)]；未指定時為所有設定的帳號與 AWS_REGIONS。
+    region 只接受 AWS_REGIONS 或 service 實際存在的 region，否則回 400：
+    每個 (帳號, region) 都會建立 client、同時呼叫上限與速率限制，不能由任意字串建立。
+    """
+    accounts = resolve_accounts(accounts)
+    regions = list(dict.fromkeys(regions or AWS_REGIONS))
+    allowed = _available_regions(service_name).union(AWS_REGIONS)
+    invalid = [region for region in regions if region not in allowed]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown regions for {service_name}: {', '.join(invalid)}")
+    return [(account, region) for account in accounts for region in regions]
+
+
+def scope(account, region):
+    """run_aws / iter_pages 的 service 後綴，每個 (帳號, region) 各自一組同時呼叫上限"""
+    return f"{account}/{region}"
+
+
+async def pool_client(service_name, account, region):
+    """
+    取得 (帳號, region) 的 client。第一次使用時要建立 session（assume role）與載入 service model，
+    在 thread pool 上執行，不阻塞 event loop。
+    """
+    return await run_aws(
+        f"{service_name}@{scope(account, region)}", client_pool.client, service_name, account, region
+    )
+
+
+async def fan_out(targets, fetch, timeout=None):
+    """
+    對每個 (帳號, region) 同時執行 `fetch(account, region)`。
+
+    回傳 (results, report)：results 為 {(帳號, region): 結果}，只包含成功的 target；
+    report 為每個 target 的 {account, region, status (ok / error / timeout), elapsed_ms, error}。
+    逾時的 target 只是不再等待，thread 上進行中的 boto3 呼叫會在 client 的逾時設定內自行結束。
+    """
+    timeout = FANOUT_TIMEOUT if timeout is None else timeout
+
+    async def run(account, region):
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(fetch(account, region), timeout)
+            status, error = "ok", None
+        except asyncio.TimeoutError:
+            result, status, error = None, "timeout", f"No response within {timeout:g}s"
+        except Exception as e:
+            result, status, error = None, "error", str(e)
+        return result, {
+            "account": account,
+            "region": region,
+            "status": status,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "error": error,
+        }
+
+    outcomes = await asyncio.gather(*(run(account, region) for account, region in targets))
+    results = {
+        target: result for target, (result, entry) in zip(targets, outcomes) if entry["status"] == "ok"
+    }
+    return results, [entry for _, entry in outcomes]
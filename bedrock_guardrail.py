@@ -1,65 +1,183 @@
-from fastapi import APIRouter, Query
-from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
 from datetime import datetime, timedelta
-from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from aws_clients import cloudtrail_client
+from guardrail_ingest import CloudTrailIngestor, default_checkpoint_store
+from guardrail_store import get_event_store, parse_timestamp
 import csv
 import io
+import itertools
+import json
+import os
+import zlib
 
 router = APIRouter(prefix="/guardrail", tags=["Bedrock Guardrail"])
 
-# 模擬資料（實際應整合 CloudTrail 或 Bedrock 審計事件）
+# 開發用的模擬資料，只在 GUARDRAIL_MOCK_EVENTS=1 時寫入，避免與 CloudTrail 匯入的真實事件混在一起
+MOCK_EVENTS_ENABLED = os.getenv("GUARDRAIL_MOCK_EVENTS", "").lower() in ("1", "true", "yes")
 MOCK_EVENTS = [
     {"id": "event001", "user": "userA", "resource": "model-1", "timestamp": "2025-06-20T14:30:00Z", "reason": "toxicity"},
     {"id": "event002", "user": "userB", "resource": "model-1", "timestamp": "2025-06-21T10:15:00Z", "reason": "jailbreak"},
     {"id": "event003", "user": "userA", "resource": "model-2", "timestamp": "2025-06-22T09:50:00Z", "reason": "bias"},
     {"id": "event004", "user": "userC", "resource": "model-1", "timestamp": "2025-06-23T01:12:00Z", "reason": "toxicity"},
 ]
+if MOCK_EVENTS_ENABLED:
+    get_event_store().ingest(MOCK_EVENTS)
+
+cloudtrail_ingestor = CloudTrailIngestor(cloudtrail_client, checkpoints=default_checkpoint_store())
+
+
+class GuardrailEvent(BaseModel):
+    id: str
+    user: str
+    resource: str
+    timestamp: datetime
+    reason: str
+
+
+def _parse_range(start, end):
+    try:
+        return (
+            parse_timestamp(start) if start else None,
+            parse_timestamp(end) if end else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time range: {e}")
+
+# 寫入事件
+@router.post("/events", summary="寫入 Guardrail 介入事件")
+def ingest_guardrail_events(events: List[GuardrailEvent]):
+    ingested = get_event_store().ingest(event.model_dump() for event in events)
+    return {"ingested": ingested, "total_events": len(get_event_store())}
 
 # 查詢所有事件
 @router.get("/events", summary="查詢所有 Guardrail 介入事件")
-def get_all_guardrail_events():
-    return MOCK_EVENTS
+def get_all_guardrail_events(
+    start: Optional[str] = Query(None, description="起始時間（ISO 8601，含）"),
+    end: Optional[str] = Query(None, description="結束時間（ISO 8601，不含）"),
+    limit: int = Query(1000, ge=1, le=10000, description="最多回傳幾筆"),
+):
+    start_ts, end_ts = _parse_range(start, end)
+    return list(itertools.islice(get_event_store().iter_events(start_ts, end_ts), limit))
 
 # 依使用者統計介入次數
 @router.get("/events/group-by-user", summary="依使用者統計介入次數")
-def count_events_by_user():
-    result = {}
-    for e in MOCK_EVENTS:
-        result[e["user"]] = result.get(e["user"], 0) + 1
-    return result
+def count_events_by_user(
+    start: Optional[str] = Query(None, description="起始時間（ISO 8601，含）"),
+    end: Optional[str] = Query(None, description="結束時間（ISO 8601，不含）"),
+):
+    return get_event_store().count_by("user", *_parse_range(start, end))
 
 # 依資源統計介入次數
 @router.get("/events/group-by-resource", summary="依資源統計介入次數")
-def count_events_by_resource():
-    result = {}
-    for e in MOCK_EVENTS:
-        result[e["resource"]] = result.get(e["resource"], 0) + 1
-    return result
+def count_events_by_resource(
+    start: Optional[str] = Query(None, description="起始時間（ISO 8601，含）"),
+    end: Optional[str] = Query(None, description="結束時間（ISO 8601，不含）"),
+):
+    return get_event_store().count_by("resource", *_parse_range(start, end))
+
+# 依介入原因統計次數
+@router.get("/events/group-by-reason", summary="依介入原因統計次數")
+def count_events_by_reason(
+    start: Optional[str] = Query(None, description="起始時間（ISO 8601，含）"),
+    end: Optional[str] = Query(None, description="結束時間（ISO 8601，不含）"),
+):
+    return get_event_store().count_by("reason", *_parse_range(start, end))
 
 # 介入事件時間趨勢
 @router.get("/events/trend", summary="介入事件時間趨勢")
 def trend_by_day(days: int = 7):
     cutoff = datetime.utcnow() - timedelta(days=days)
-    result = {}
-    for e in MOCK_EVENTS:
-        ts = datetime.strptime(e["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
-        if ts >= cutoff:
-            key = ts.strftime("%Y-%m-%d")
-            result[key] = result.get(key, 0) + 1
-    return result
-
-# 匯出事件為 CSV 或 JSON
-@router.get("/events/export", summary="匯出事件（JSON 或 CSV）")
-def export_events(format: str = Query("json", enum=["json", "csv"])):
-    if format == "json":
-        return JSONResponse(content=MOCK_EVENTS)
-    else:
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=MOCK_EVENTS[0].keys())
+    return get_event_store().count_by_day(parse_timestamp(cutoff))
+
+EXPORT_FIELDS = ["id", "user", "resource", "timestamp", "reason"]
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+def export_chunks(events, format, compress=False, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """
+    將事件逐批編碼成 CSV / NDJSON / JSON，約每 chunk_bytes 輸出一次；
+    記憶體用量只與 chunk 大小有關，與匯出筆數無關。
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31：gzip 格式
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS) if format == "csv" else None
+
+    def flush():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    if writer:
         writer.writeheader()
-        for e in MOCK_EVENTS:
+    elif format == "json":
+        buffer.write("[")
+    first = True
+    for e in events:
+        if writer:
             writer.writerow(e)
-        return JSONResponse(content={"csv": output.getvalue()})
+        elif format == "json":
+            buffer.write(("" if first else ",") + json.dumps(e))
+        else:
+            buffer.write(json.dumps(e) + "\n")
+        first = False
+        if buffer.tell() >= chunk_bytes:
+            chunk = flush()
+            if chunk:
+                yield chunk
+    if format == "json":
+        buffer.write("]")
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+# 匯出事件（串流輸出 CSV / NDJSON / JSON）
+@router.get("/events/export", summary="匯出事件（CSV、NDJSON 或 JSON，串流輸出）")
+def export_events(
+    format: str = Query("json", enum=["json", "csv", "ndjson"]),
+    start: Optional[str] = Query(None, description="起始時間（ISO 8601，含）"),
+    end: Optional[str] = Query(None, description="結束時間（ISO 8601，不含）"),
+    user: Optional[str] = Query(None, description="只匯出指定使用者的事件"),
+    resource: Optional[str] = Query(None, description="只匯出指定資源的事件"),
+    gzip: bool = Query(False, description="以 gzip 壓縮回應（Content-Encoding: gzip）"),
+):
+    start_ts, end_ts = _parse_range(start, end)
+    events = get_event_store().iter_events(start_ts, end_ts, user=user, resource=resource)
+    headers = {"Content-Disposition": f'attachment; filename="guardrail-events.{format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_chunks(events, format, compress=gzip),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+# 從 CloudTrail 匯入事件
+@router.post("/ingest/cloudtrail", summary="從 CloudTrail 增量匯入 Guardrail 介入事件")
+async def ingest_from_cloudtrail():
+    try:
+        return await cloudtrail_ingestor.run()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to ingest CloudTrail events: {e}")
+
+# 匯入狀態
+@router.get("/ingest/status", summary="CloudTrail 匯入檢查點與最近一次執行結果")
+def get_ingest_status():
+    return {
+        "checkpoint": cloudtrail_ingestor.checkpoints.load(),
+        "last_run": cloudtrail_ingestor.last_run,
+        "total_events": len(get_event_store()),
+    }
 
 # 查詢自訂規則（示範）
 @router.get("/rules", summary="查詢自訂 Guardrail 規則")
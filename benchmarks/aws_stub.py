@@ -0,0 +1,363 @@
+"""
+離線的 AWS 替身（benchmark / load test 共用）
+
+在 botocore 的 before-send 攔截請求、回傳依各服務協定（EC2 / query XML、JSON）編碼的回應，
+因此 boto3 的序列化、簽章、重試與回應解析都照常執行，只有網路被換掉：
+- SyntheticFleet：fleet 規模的合成資料（EC2 instances、狀態、App Runner 服務、每日成本）；
+- AwsStub：固定延遲 + 抖動、依 (服務, operation) 的伺服器端速率上限與隨機 throttle，
+  並記錄每個 operation 的呼叫次數。
+
+使用方式：
+    stub = AwsStub(SyntheticFleet(instances=5000), latency=0.02)
+    stub.install(client_pool)   # 或任何有 register_event_hook 的 ClientRegistry
+"""
+
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import parse_qs
+
+from botocore.awsrequest import AWSResponse
+
+INSTANCE_TYPES = ["t3.micro", "t3.medium", "m6i.large", "m6i.xlarge", "c6i.2xlarge", "r6i.large"]
+STATES = [("running", 16)] * 9 + [("stopped", 80)]
+TEAMS = ["search", "ads", "payments", "ml", "platform", "data"]
+COST_SERVICES = [
+    "Amazon Elastic Compute Cloud - Compute", "Amazon Simple Storage Service", "Amazon Relational Database Service",
+    "AWS Lambda", "Amazon CloudWatch", "Amazon DynamoDB", "AWS App Runner", "Amazon Bedrock",
+    "Amazon Elastic Load Balancing", "Amazon ElastiCache", "Amazon Virtual Private Cloud", "AWS Key Management Service",
+]
+
+THROTTLE_ERRORS = {
+    "ec2": (503, b"<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded."
+                 b"</Message></Error></Errors><RequestID>stub</RequestID></Response>"),
+    "query": (400, b"<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code><Message>Rate exceeded"
+                   b"</Message></Error><RequestId>stub</RequestId></ErrorResponse>"),
+    "json": (400, b'{"__type": "ThrottlingException", "message": "Rate exceeded"}'),
+}
+PROTOCOLS = {"ec2": "ec2", "cloudwatch": "query", "sts": "query"}
+
+
+def _iso(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _parse_iso(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+class SyntheticFleet:
+    """固定 seed 的合成資料；EC2 回應片段預先產生，避免替身本身的成本干擾量測"""
+
+    def __init__(self, instances=5000, apprunner_services=50, cost_services=len(COST_SERVICES), seed=7):
+        rng = random.Random(seed)
+        self.launch_base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.instances = []
+        for i in range(instances):
+            state, code = rng.choice(STATES)
+            self.instances.append({
+                "id": f"i-{i:017x}",
+                "type": rng.choice(INSTANCE_TYPES),
+                "state": state,
+                "code": code,
+                "launch": self.launch_base + timedelta(minutes=rng.randrange(500000)),
+                "ip": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+                "vpc": f"vpc-{rng.randrange(8):08x}",
+                "team": rng.choice(TEAMS),
+                "event": rng.random() < 0.02,
+            })
+        self.instance_xml = [self._instance_xml(instance) for instance in self.instances]
+        self.status_xml = [self._status_xml(instance) for instance in self.instances]
+        self.services = [
+            {
+                "ServiceName": f"svc-{i:03d}",
+                "ServiceId": f"{i:032x}",
+                "ServiceArn": f"arn:aws:apprunner:us-east-1:123456789012:service/svc-{i:03d}/{i:032x}",
+                "ServiceUrl": f"svc-{i:03d}.us-east-1.awsapprunner.com",
+                "CreatedAt": self.launch_base.timestamp(),
+                "UpdatedAt": self.launch_base.timestamp() + i,
+                "Status": "RUNNING" if i % 10 else "PAUSED",
+            }
+            for i in range(apprunner_services)
+        ]
+        self.cost_services = (COST_SERVICES * (cost_services // len(COST_SERVICES) + 1))[:cost_services]
+        self.cost_services = [
+            name if i < len(COST_SERVICES) else f"{name} #{i // len(COST_SERVICES)}"
+            for i, name in enumerate(self.cost_services)
+        ]
+
+    @staticmethod
+    def _instance_xml(instance):
+        return (
+            f"<item><instanceId>{instance['id']}</instanceId><instanceType>{instance['type']}</instanceType>"
+            f"<instanceState><code>{instance['code']}</code><name>{instance['state']}</name></instanceState>"
+            f"<launchTime>{_iso(instance['launch'])}</launchTime><privateIpAddress>{instance['ip']}</privateIpAddress>"
+            f"<vpcId>{instance['vpc']}</vpcId><tagSet><item><key>Name</key><value>{instance['id']}</value></item>"
+            f"<item><key>team</key><value>{instance['team']}</value></item></tagSet></item>"
+        )
+
+    @staticmethod
+    def _status_xml(instance):
+        events = ""
+        if instance["event"]:
+            not_before = _iso(datetime.now(timezone.utc) + timedelta(days=3))
+            events = (
+                f"<eventsSet><item><code>system-reboot</code><description>scheduled reboot</description>"
+                f"<notBefore>{not_before}</notBefore></item></eventsSet>"
+            )
+        ok = "ok" if instance["state"] == "running" else "not-applicable"
+        return (
+            f"<item><instanceId>{instance['id']}</instanceId><availabilityZone>us-east-1a</availabilityZone>"
+            f"<instanceState><code>{instance['code']}</code><name>{instance['state']}</name></instanceState>"
+            f"<systemStatus><status>{ok}</status></systemStatus><instanceStatus><status>{ok}</status></instanceStatus>"
+            f"{events}</item>"
+        )
+
+    def matches(self, instance, filters):
+        for name, values in filters.items():
+            if name == "instance-state-name" and instance["state"] not in values:
+                return False
+            if name == "instance-type" and instance["type"] not in values:
+                return False
+            if name == "vpc-id" and instance["vpc"] not in values:
+                return False
+            if name == "tag:team" and instance["team"] not in values:
+                return False
+            if name == "tag:Name" and instance["id"] not in values:
+                return False
+        return True
+
+    def daily_cost(self, service_index, day):
+        """每個服務每天的成本：基準 + 成長趨勢 + 週末較低 + 固定雜訊"""
+        base = 5.0 + (service_index * 37 % 400) / 10
+        t = (day - date(2024, 1, 1)).days
+        weekly = 1.0 if day.weekday() < 5 else 0.6
+        noise = (zlib.crc32(f"{service_index}:{day}".encode()) % 1000) / 1000 - 0.5
+        return max(0.0, base * (1 + 0.001 * t) * weekly + noise)
+
+
+class AwsStub:
+    def __init__(self, fleet, latency=0.0, jitter=0.0, throttle_rate=None, throttle_fraction=0.0, seed=11):
+        self.fleet = fleet
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.throttle_fraction = throttle_fraction
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.calls = Counter()
+        self.throttled = Counter()
+
+    def install(self, registry):
+        registry.register_event_hook("before-send.*.*", self.send)
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.calls), Counter(self.throttled)
+
+    def _throttle(self, key):
+        with self._lock:
+            self.calls[key] += 1
+            if self.throttle_fraction and self._rng.random() < self.throttle_fraction:
+                self.throttled[key] += 1
+                return True
+            if not self.throttle_rate:
+                return False
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(key, (self.throttle_rate, now))
+            tokens = min(self.throttle_rate, tokens + (now - updated) * self.throttle_rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if not allowed:
+                self.throttled[key] += 1
+            return not allowed
+
+    def send(self, request, event_name, **kwargs):
+        _, service, operation = event_name.split(".", 2)
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self._rng.random() * self.jitter)
+        protocol = PROTOCOLS.get(service, "json")
+        if self._throttle((service, operation)):
+            status, body = THROTTLE_ERRORS[protocol]
+            return AWSResponse(request.url, status, {}, _Body(body))
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode()
+        if protocol == "json":
+            params = json.loads(body or b"{}")
+        else:
+            params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        handler = getattr(self, f"_{service.replace('-', '_')}_{operation}", None)
+        if handler is None:
+            return AWSResponse(request.url, 400, {}, _Body(
+                json.dumps({"__type": "UnsupportedOperation", "message": f"{service}.{operation}"}).encode()
+                if protocol == "json" else
+                f"<Response><Errors><Error><Code>UnsupportedOperation</Code><Message>{service}.{operation}"
+                f"</Message></Error></Errors><RequestID>stub</RequestID></Response>".encode()
+            ))
+        return AWSResponse(request.url, 200, {}, _Body(handler(params)))
+
+    # --- EC2 ---
+
+    @staticmethod
+    def _ec2_filters(params):
+        filters = {}
+        for key, value in params.items():
+            if key.startswith("Filter.") and key.endswith(".Name"):
+                prefix = key[:-len("Name")]
+                filters[value] = [v for k, v in params.items() if k.startswith(prefix + "Value.")]
+        return filters
+
+    @staticmethod
+    def _page(params, total, default_size):
+        start = int(params.get("NextToken", 0))
+        size = int(params.get("MaxResults", default_size))
+        end = min(start + size, total)
+        token = f"<nextToken>{end}</nextToken>" if end < total else ""
+        return start, end, token
+
+    def _ec2_DescribeInstances(self, params):
+        filters = self._ec2_filters(params)
+        indexes = [i for i, instance in enumerate(self.fleet.instances) if self.fleet.matches(instance, filters)]
+        start, end, token = self._page(params, len(indexes), 1000)
+        reservations = "".join(
+            f"<item><reservationId>r-{i:017x}</reservationId><instancesSet>"
+            + "".join(self.fleet.instance_xml[j] for j in indexes[i:min(i + 10, end)])
+            + "</instancesSet></item>"
+            for i in range(start, end, 10)
+        )
+        return (
+            f"<DescribeInstancesResponse><requestId>stub</requestId><reservationSet>{reservations}</reservationSet>"
+            f"{token}</DescribeInstancesResponse>"
+        ).encode()
+
+    def _ec2_DescribeInstanceStatus(self, params):
+        ids = {value for key, value in params.items() if key.startswith("InstanceId.")}
+        indexes = [
+            i for i, instance in enumerate(self.fleet.instances) if not ids or instance["id"] in ids
+        ]
+        start, end, token = self._page(params, len(indexes), 1000)
+        statuses = "".join(self.fleet.status_xml[i] for i in indexes[start:end])
+        return (
+            f"<DescribeInstanceStatusResponse><requestId>stub</requestId>"
+            f"<instanceStatusSet>{statuses}</instanceStatusSet>{token}</DescribeInstanceStatusResponse>"
+        ).encode()
+
+    # --- CloudWatch ---
+
+    def _cloudwatch_GetMetricData(self, params):
+        start = int(_parse_iso(params["StartTime"]).timestamp())
+        end = int(_parse_iso(params["EndTime"]).timestamp())
+        results = []
+        n = 1
+        while f"MetricDataQueries.member.{n}.Id" in params:
+            prefix = f"MetricDataQueries.member.{n}."
+            period = int(params.get(prefix + "MetricStat.Period", 60))
+            seed = zlib.crc32("|".join(
+                value for key, value in params.items() if key.startswith(prefix + "MetricStat.Metric.")
+            ).encode())
+            first = start - start % period
+            timestamps = range(first, end, period)
+            results.append(
+                f"<member><Id>{params[prefix + 'Id']}</Id><StatusCode>Complete</StatusCode><Timestamps>"
+                + "".join(f"<member>{_iso(datetime.fromtimestamp(t, timezone.utc))}</member>" for t in timestamps)
+                + "</Timestamps><Values>"
+                + "".join(f"<member>{(seed + t // period) % 1000 / 10}</member>" for t in timestamps)
+                + "</Values></member>"
+            )
+            n += 1
+        return (
+            "<GetMetricDataResponse><GetMetricDataResult><MetricDataResults>" + "".join(results)
+            + "</MetricDataResults></GetMetricDataResult>"
+            "<ResponseMetadata><RequestId>stub</RequestId></ResponseMetadata></GetMetricDataResponse>"
+        ).encode()
+
+    # --- Cost Explorer ---
+
+    def _cost_explorer_GetCostAndUsage(self, params):
+        start = date.fromisoformat(params["TimePeriod"]["Start"])
+        end = date.fromisoformat(params["TimePeriod"]["End"])
+        metrics = params.get("Metrics", ["UnblendedCost"])
+        group_by = params.get("GroupBy", [])
+        monthly = params.get("Granularity") == "MONTHLY"
+        periods = []
+        day = start
+        while day < end:
+            if monthly:
+                next_month = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+                period_end = min(next_month, end)
+            else:
+                period_end = day + timedelta(days=1)
+            periods.append((day, period_end))
+            day = period_end
+
+        def amounts(period_start, period_end):
+            days = [period_start + timedelta(days=i) for i in range((period_end - period_start).days)]
+            return [sum(self.fleet.daily_cost(s, d) for d in days) for s in range(len(self.fleet.cost_services))]
+
+        def metric_values(amount):
+            return {metric: {"Amount": f"{amount:.6f}", "Unit": "USD"} for metric in metrics}
+
+        results = []
+        for period_start, period_end in periods:
+            per_service = amounts(period_start, period_end)
+            entry = {
+                "TimePeriod": {"Start": period_start.isoformat(), "End": period_end.isoformat()},
+                "Estimated": False,
+            }
+            if not group_by:
+                entry["Total"] = metric_values(sum(per_service))
+                entry["Groups"] = []
+            else:
+                key = group_by[0]
+                if key["Type"] == "TAG":
+                    names = [f"{key['Key']}${team}" for team in TEAMS]
+                    values = [sum(per_service[i::len(TEAMS)]) for i in range(len(TEAMS))]
+                else:
+                    names, values = self.fleet.cost_services, per_service
+                entry["Total"] = {}
+                entry["Groups"] = [
+                    {"Keys": [name], "Metrics": metric_values(value)} for name, value in zip(names, values)
+                ]
+            results.append(entry)
+        return json.dumps({"ResultsByTime": results, "DimensionValueAttributes": []}).encode()
+
+    # --- App Runner ---
+
+    def _apprunner_ListServices(self, params):
+        start = int(params.get("NextToken", 0))
+        end = min(start + int(params.get("MaxResults", 20)), len(self.fleet.services))
+        response = {"ServiceSummaryList": self.fleet.services[start:end]}
+        if end < len(self.fleet.services):
+            response["NextToken"] = str(end)
+        return json.dumps(response).encode()
+
+    def _apprunner_DescribeService(self, params):
+        for service in self.fleet.services:
+            if service["ServiceArn"] == params["ServiceArn"]:
+                return json.dumps({"Service": {**service, "InstanceConfiguration": {"Cpu": "1024", "Memory": "2048"}}}).encode()
+        return json.dumps({"Service": {}}).encode()
+
+    # --- STS ---
+
+    def _sts_AssumeRole(self, params):
+        expiration = _iso(datetime.now(timezone.utc) + timedelta(seconds=int(params.get("DurationSeconds", 3600))))
+        return (
+            "<AssumeRoleResponse><AssumeRoleResult><Credentials><AccessKeyId>ASIASTUB</AccessKeyId>"
+            "<SecretAccessKey>stub</SecretAccessKey><SessionToken>stub</SessionToken>"
+            f"<Expiration>{expiration}</Expiration></Credentials><AssumedRoleUser><Arn>{params['RoleArn']}</Arn>"
+            "<AssumedRoleId>stub</AssumedRoleId></AssumedRoleUser></AssumeRoleResult></AssumeRoleResponse>"
+        ).encode()
@@ -0,0 +1,168 @@
+"""
+Benchmark：CloudTrail → Guardrail 事件匯入
+
+1. 以 botocore Stubber 模擬 lookup_events 分頁回應，量測匯入速度（events/sec）；
+   第二次執行只應送出一次查詢、不重複下載。
+2. 匯入到已有大量事件的儲存（例如先前匯入的歷史），新事件與儲存尾端部分重疊；
+   速度應與空的儲存相近，不會每一批都重建整個儲存。
+3. 以會在中途失敗的假 client 驗證檢查點：失敗後重新執行會補完缺口，且不重複寫入。
+
+執行方式：
+    python benchmarks/bench_cloudtrail_ingest.py --events 50000 --existing 500000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3  # noqa: E402
+from botocore.stub import ANY, Stubber  # noqa: E402
+
+from aws_executor import shutdown_executor  # noqa: E402
+from guardrail_ingest import CheckpointStore, CloudTrailIngestor  # noqa: E402
+from guardrail_store import ColumnarEventStore  # noqa: E402
+from bench_guardrail_store import synthetic_events  # noqa: E402
+
+PAGE_SIZE = 50  # lookup_events 每頁上限
+
+
+def synthetic_records(count, intervened_ratio=0.5, end=None):
+    """由新到舊產生 CloudTrail 紀錄，約一半為 guardrail 介入"""
+    end = end or datetime.now(timezone.utc) - timedelta(seconds=5)
+    records = []
+    for i in range(count):
+        intervened = (i % 100) < intervened_ratio * 100
+        detail = {
+            "eventName": "ApplyGuardrail",
+            "userIdentity": {"arn": f"arn:aws:iam::123456789012:user/user{i % 200}"},
+            "requestParameters": {"guardrailIdentifier": f"gr-{i % 7}"},
+            "responseElements": {
+                "action": "GUARDRAIL_INTERVENED" if intervened else "NONE",
+                "assessments": [{"contentPolicy": {"filters": [{"type": "VIOLENCE", "action": "BLOCKED"}]}}],
+            },
+        }
+        records.append({
+            "EventId": f"ev-{i:08d}",
+            "EventName": "ApplyGuardrail",
+            "EventTime": end - timedelta(seconds=i),
+            "Username": f"user{i % 200}",
+            "CloudTrailEvent": json.dumps(detail),
+        })
+    return records
+
+
+def stubbed_client(records):
+    client = boto3.client(
+        "cloudtrail", region_name="us-east-1", aws_access_key_id="bench", aws_secret_access_key="bench"
+    )
+    stubber = Stubber(client)
+    pages = [records[i:i + PAGE_SIZE] for i in range(0, len(records), PAGE_SIZE)] or [[]]
+    for i, page in enumerate(pages):
+        response = {"Events": page}
+        expected = {"LookupAttributes": ANY, "StartTime": ANY, "EndTime": ANY}
+        if i + 1 < len(pages):
+            response["NextToken"] = f"token-{i + 1}"
+        if i > 0:
+            expected["NextToken"] = f"token-{i}"
+        stubber.add_response("lookup_events", response, expected)
+    return client, stubber
+
+
+class FlakyCloudTrail:
+    """依 StartTime / EndTime 篩選資料的假 client，可在第 N 頁拋出錯誤"""
+
+    def __init__(self, records, fail_on_page=None):
+        self.records = records
+        self.fail_on_page = fail_on_page
+        self.pages_served = 0
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, StartTime, EndTime, **kwargs):
+        selected = [r for r in self.records if StartTime <= r["EventTime"] <= EndTime]
+        for i in range(0, len(selected), PAGE_SIZE):
+            self.pages_served += 1
+            if self.fail_on_page is not None and self.pages_served == self.fail_on_page:
+                self.fail_on_page = None
+                raise RuntimeError("injected ThrottlingException")
+            yield {"Events": selected[i:i + PAGE_SIZE]}
+
+
+async def throughput(count, checkpoint_path):
+    records = synthetic_records(count)
+    store = ColumnarEventStore()
+    checkpoints = CheckpointStore(checkpoint_path)
+    client, stubber = stubbed_client(records)
+    with stubber:
+        ingestor = CloudTrailIngestor(client, store, checkpoints, lookback_days=1)
+        first = await ingestor.run()
+    print(f"first run:  {first['scanned']:,} scanned, {first['ingested']:,} ingested, "
+          f"{first['pages']} pages, {first['events_per_second']:,.0f} events/s")
+
+    client, stubber = stubbed_client([])
+    with stubber:
+        second = await CloudTrailIngestor(client, store, checkpoints).run()
+    print(f"second run: {second['scanned']} scanned, {second['pages']} pages (should not re-download history)")
+    return first["ingested"] == len(store)
+
+
+async def prefilled_throughput(count, existing, checkpoint_path):
+    records = synthetic_records(count)
+    store = ColumnarEventStore()
+    # 最近 30 天的既有事件，尾端與這次匯入的時間範圍重疊
+    store.ingest(synthetic_events(existing, days=30))
+    client, stubber = stubbed_client(records)
+    with stubber:
+        run = await CloudTrailIngestor(client, store, CheckpointStore(checkpoint_path), lookback_days=1).run()
+    timestamps = [event["timestamp"] for event in store.iter_events()]
+    ok = len(store) == existing + run["ingested"] and timestamps == sorted(timestamps)
+    print(f"prefilled:  {run['ingested']:,} ingested into {existing:,} existing events in {run['seconds']:.2f} s, "
+          f"{run['events_per_second']:,.0f} events/s, ordered={ok}")
+    return ok
+
+
+async def resume_check(count, checkpoint_path):
+    records = synthetic_records(count)
+    expected = sum(1 for r in records if "GUARDRAIL_INTERVENED" in r["CloudTrailEvent"])
+    store = ColumnarEventStore()
+    checkpoints = CheckpointStore(checkpoint_path)
+    client = FlakyCloudTrail(records, fail_on_page=max(2, count // PAGE_SIZE // 2))
+    try:
+        await CloudTrailIngestor(client, store, checkpoints, lookback_days=1).run()
+    except RuntimeError:
+        print(f"resume:     failed mid-run after {len(store):,} events, pending={bool(checkpoints.load().get('pending'))}")
+    await CloudTrailIngestor(client, store, checkpoints, lookback_days=1).run()
+    ids = [e["id"] for e in store.iter_events()]
+    ok = len(ids) == len(set(ids)) == expected
+    print(f"resume:     {len(ids):,} events after retry, expected {expected:,}, duplicates={len(ids) - len(set(ids))}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=50_000)
+    parser.add_argument("--existing", type=int, default=500_000, help="預先寫入儲存的事件數")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        ok = asyncio.run(throughput(args.events, os.path.join(tmp, "throughput.json")))
+        ok &= asyncio.run(prefilled_throughput(args.events, args.existing, os.path.join(tmp, "prefilled.json")))
+        ok &= asyncio.run(resume_check(min(args.events, 5000), os.path.join(tmp, "resume.json")))
+        print(f"total {time.perf_counter() - started:.2f} s")
+    shutdown_executor()
+    if not ok:
+        print("FAIL: checkpoint did not prevent duplicates, or the store lost events or their order")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark：向量化成本分析（cost_analytics）
+
+產生 --services 個服務、--months 個月的合成每日成本（趨勢 + 星期幾效果 + 雜訊 + 偶發突增），
+量測矩陣建立、預測、rolling z-score 異常偵測與月對月加總的耗時。
+
+正確性以同一份 store 的原始每日資料、不經過 NumPy 矩陣的純 Python 計算比對：
+每日與每月總額用 billing_helper 原本使用的 DailyCostStore.daily_totals / monthly_totals，
+預測以正規方程式擬合同一個模型（線性趨勢 + 星期幾效果），異常偵測以逐服務迴圈計算。
+
+執行方式：
+    python benchmarks/bench_cost_analytics.py --services 300 --months 13
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from cost_analytics import MIN_SEASONAL_DAYS, CostAnalytics, forecast, monthly_sums, rolling_zscores  # noqa: E402
+from cost_store import DailyCostStore, add_months  # noqa: E402
+
+
+def synthetic_store(services, months, today, seed=7):
+    rng = random.Random(seed)
+    store = DailyCostStore(fetch_page=None, group_by=[])
+    start = add_months(today.replace(day=1), -(months - 1))
+    day = start
+    while day <= today:
+        t = (day - start).days
+        weekly = 1.0 if day.weekday() < 5 else 0.55
+        # 約 0.2% 的服務日成本突增為 4 倍，讓異常偵測有可比對的結果
+        store._rows[day] = {
+            f"service-{i:03d}": max(0.0, (5 + i % 40) * (1 + 0.002 * t * (i % 3)) * weekly + rng.gauss(0, 0.5))
+            * (4 if rng.random() < 0.002 else 1)
+            for i in range(services)
+        }
+        day += timedelta(days=1)
+    store.version += 1
+    return store, start
+
+
+def service_rows(store, start, end):
+    """由 store 的原始每日資料（不經過矩陣）組出每個服務的每日成本清單"""
+    days = list(store.iter_days(start, end))
+    services = sorted({service for _, amounts in days for service in amounts})
+    return [[amounts.get(service, 0.0) for _, amounts in days] for service in services]
+
+
+def loop_zscores(rows, window):
+    """逐服務、逐日的 Python 迴圈版本，作為比較基準"""
+    flagged = 0
+    for row in rows:
+        for j in range(window, len(row)):
+            past = row[j - window:j]
+            mean = sum(past) / window
+            std = math.sqrt(max(sum(v * v for v in past) / window - mean * mean, 0.0))
+            std = max(std, 0.05 * abs(mean) + 1e-9)
+            if abs(row[j] - mean) / std >= 3:
+                flagged += 1
+    return flagged
+
+
+def _solve(a, b):
+    """高斯消去法（部分選主元）解 a x = b"""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(n):
+            if r != col and m[col][col]:
+                factor = m[r][col] / m[col][col]
+                m[r] = [x - factor * y for x, y in zip(m[r], m[col])]
+    return [m[i][n] / m[i][i] if m[i][i] else 0.0 for i in range(n)]
+
+
+def loop_forecast(totals, first_weekday, horizon):
+    """
+    以純 Python 正規方程式對每日總成本擬合與 forecast 相同的模型；
+    最小平方法對 y 是線性的，所以結果應等於各服務預測的加總（資料皆為正值，不受截 0 影響）
+    """
+    n = len(totals)
+    columns = 1 if n < 2 else (2 if n < MIN_SEASONAL_DAYS else 8)
+
+    def features(t):
+        weekday = (first_weekday + t) % 7
+        return ([1.0, float(t)] + [1.0 if weekday == d else 0.0 for d in range(1, 7)])[:columns]
+
+    rows = [features(t) for t in range(n)]
+    a = [[sum(x[i] * x[j] for x in rows) for j in range(columns)] for i in range(columns)]
+    b = [sum(x[i] * y for x, y in zip(rows, totals)) for i in range(columns)]
+    coef = _solve(a, b)
+    return [sum(c * v for c, v in zip(coef, features(n + k))) for k in range(horizon)]
+
+
+def check(label, ok, detail):
+    print(f"  {'OK  ' if ok else 'FAIL'} {label}: {detail}")
+    return ok
+
+
+def timed(label, fn, repeat=20):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<36}{best * 1000:>10.3f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=300)
+    parser.add_argument("--months", type=int, default=13)
+    parser.add_argument("--window", type=int, default=28)
+    args = parser.parse_args()
+
+    today = date.today()
+    store, start = synthetic_store(args.services, args.months, today)
+    analytics = CostAnalytics(store, history_months=args.months)
+    end = today + timedelta(days=1)
+
+    print(f"{args.services} services x {(end - start).days} days (best of 20):")
+    timed("build matrix (cold)", lambda: (setattr(analytics, "_cache_key", None), analytics.matrix(start, end)))
+    matrix = timed("build matrix (cached)", lambda: analytics.matrix(start, end))
+    history_start = today - timedelta(days=90)
+    history = matrix.window(history_start, today)
+    timed("forecast 30 days (90-day history)", lambda: forecast(history, 30))
+    timed("forecast 30 days (full history)", lambda: forecast(matrix, 30))
+    z, mean = timed(f"rolling z-score ({args.window}-day window)", lambda: rolling_zscores(matrix.values, args.window))
+    timed("monthly sums", lambda: monthly_sums(matrix))
+
+    vectorized = int(np.count_nonzero(np.abs(np.nan_to_num(z)) >= 3))
+    started = time.perf_counter()
+    looped = loop_zscores(service_rows(store, start, end), args.window)
+    print(f"  {'python loop z-score (baseline)':<36}{(time.perf_counter() - started) * 1000:>10.3f} ms")
+
+    # 與同一份 store 資料的純 Python 計算比對
+    print("correctness against pure-Python results on the same store rows:")
+    daily = [amount for _, amount in store.daily_totals(start, end)]
+    monthly = [amount for _, _, amount in store.monthly_totals(start, end)]
+    expected_forecast = loop_forecast(
+        [amount for _, amount in store.daily_totals(history_start, today)], history_start.weekday(), 30
+    )
+    results = [
+        check("daily totals vs DailyCostStore.daily_totals",
+              np.allclose(matrix.values.sum(axis=0), daily), f"{len(daily)} days"),
+        check("monthly sums vs DailyCostStore.monthly_totals",
+              np.allclose(monthly_sums(matrix)[1].sum(axis=0), monthly), f"{len(monthly)} months"),
+        check("30-day forecast vs normal equations",
+              np.allclose(forecast(history, 30)[0].sum(axis=0), expected_forecast, rtol=1e-6),
+              f"total {sum(expected_forecast):,.2f}"),
+        check("rolling z-score vs python loop", vectorized == looped,
+              f"vectorized flagged {vectorized}, loop flagged {looped}"),
+    ]
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
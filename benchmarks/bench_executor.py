@@ -0,0 +1,98 @@
+"""
+Benchmark：同步 boto3 呼叫 vs aws_executor.run_aws
+
+模擬 N 個慢的 Cost Explorer 呼叫同時進行，量測另一批快速 EC2 呼叫的延遲。
+直接在 coroutine 裡呼叫同步 client 時，p99 會隨著慢呼叫數量線性成長；
+改用 run_aws 後 p99 應維持固定。
+
+執行方式：
+    python benchmarks/bench_executor.py --slow 1 4 16 --probes 200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aws_executor import run_aws, shutdown_executor  # noqa: E402
+
+
+class SlowStubClient:
+    """以 time.sleep 模擬阻塞 I/O 的假 client"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def call(self):
+        time.sleep(self.latency)
+        return {"ok": True}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _run_scenario(mode, slow_count, probes, interval, slow_client, fast_client):
+    loop = asyncio.get_running_loop()
+
+    async def slow_call():
+        if mode == "blocking":
+            slow_client.call()
+        else:
+            await run_aws("ce", slow_client.call)
+
+    async def probe(scheduled_at):
+        if mode == "blocking":
+            fast_client.call()
+        else:
+            await run_aws("ec2", fast_client.call)
+        # 從「應該開始」的時間點起算，包含在 event loop 上排隊的時間
+        return loop.time() - scheduled_at
+
+    slow_tasks = [asyncio.create_task(slow_call()) for _ in range(slow_count)]
+    started = loop.time()
+    probe_tasks = []
+    for i in range(probes):
+        scheduled_at = started + i * interval
+        await asyncio.sleep(max(0.0, scheduled_at - loop.time()))
+        probe_tasks.append(asyncio.create_task(probe(scheduled_at)))
+    latencies = await asyncio.gather(*probe_tasks)
+    await asyncio.gather(*slow_tasks)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slow", type=int, nargs="+", default=[1, 4, 16], help="同時進行的慢呼叫數量")
+    parser.add_argument("--probes", type=int, default=200, help="快速呼叫次數")
+    parser.add_argument("--interval", type=float, default=0.005, help="快速呼叫的發送間隔（秒）")
+    parser.add_argument("--slow-latency", type=float, default=0.2, help="慢呼叫延遲（秒）")
+    parser.add_argument("--fast-latency", type=float, default=0.002, help="快速呼叫延遲（秒）")
+    args = parser.parse_args()
+
+    slow_client = SlowStubClient(args.slow_latency)
+    fast_client = SlowStubClient(args.fast_latency)
+
+    print(f"{'mode':<10}{'slow':>6}{'p50 (ms)':>12}{'p99 (ms)':>12}{'max (ms)':>12}")
+    for mode in ("blocking", "executor"):
+        for slow_count in args.slow:
+            latencies = asyncio.run(
+                _run_scenario(mode, slow_count, args.probes, args.interval, slow_client, fast_client)
+            )
+            print(
+                f"{mode:<10}{slow_count:>6}"
+                f"{statistics.median(latencies) * 1000:>12.2f}"
+                f"{percentile(latencies, 99) * 1000:>12.2f}"
+                f"{max(latencies) * 1000:>12.2f}"
+            )
+    shutdown_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark：逐台 get_metric_statistics vs 批次 get_metric_data
+
+使用假的 CloudWatch client（每次呼叫固定延遲），比較取得整個 fleet CPU 資料時
+的 API 呼叫次數與耗時。
+
+執行方式：
+    python benchmarks/bench_fleet_metrics.py --instances 100 500 2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aws_executor import run_aws, shutdown_executor  # noqa: E402
+from metric_batch import get_metric_data_batched, metric_query  # noqa: E402
+
+
+class StubCloudWatch:
+    """回傳固定資料的 CloudWatch 替身，記錄呼叫次數"""
+
+    def __init__(self, latency, points=12, page_size=100800):
+        self.latency = latency
+        self.points = points
+        self.page_size = page_size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _record_call(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+    def get_metric_statistics(self, **kwargs):
+        self._record_call()
+        now = kwargs["EndTime"]
+        return {
+            "Datapoints": [
+                {"Timestamp": now - timedelta(minutes=5 * i), "Average": 10.0 + i, "Unit": "Percent"}
+                for i in range(self.points)
+            ]
+        }
+
+    def get_metric_data(self, **kwargs):
+        self._record_call()
+        now = kwargs["EndTime"]
+        timestamps = [now - timedelta(minutes=5 * i) for i in range(self.points)]
+        return {
+            "MetricDataResults": [
+                {"Id": q["Id"], "Timestamps": timestamps, "Values": [10.0 + i for i in range(self.points)]}
+                for q in kwargs["MetricDataQueries"]
+            ]
+        }
+
+
+def _statistics_params(instance_id, start_time, end_time):
+    return dict(
+        Namespace="AWS/EC2",
+        MetricName="CPUUtilization",
+        Dimensions=[{"Name": "InstanceId", "Value": instance_id}],
+        StartTime=start_time,
+        EndTime=end_time,
+        Period=300,
+        Statistics=["Average"],
+    )
+
+
+async def per_instance_sequential(client, instance_ids, start_time, end_time):
+    for instance_id in instance_ids:
+        await run_aws("cloudwatch", client.get_metric_statistics, **_statistics_params(instance_id, start_time, end_time))
+
+
+async def per_instance_concurrent(client, instance_ids, start_time, end_time):
+    await asyncio.gather(*[
+        run_aws("cloudwatch", client.get_metric_statistics, **_statistics_params(instance_id, start_time, end_time))
+        for instance_id in instance_ids
+    ])
+
+
+async def batched(client, instance_ids, start_time, end_time):
+    queries = [
+        metric_query(f"m{i}", "AWS/EC2", "CPUUtilization", [("InstanceId", instance_id)], "Average", 300)
+        for i, instance_id in enumerate(instance_ids)
+    ]
+    await get_metric_data_batched(client, queries, start_time, end_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instances", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--latency", type=float, default=0.02, help="每次 API 呼叫的延遲（秒）")
+    args = parser.parse_args()
+
+    end_time = datetime.utcnow()
+    start_time = end_time - timedelta(hours=1)
+    strategies = [
+        ("per-instance sequential", per_instance_sequential),
+        ("per-instance concurrent", per_instance_concurrent),
+        ("get_metric_data batched", batched),
+    ]
+
+    print(f"{'strategy':<26}{'instances':>10}{'api calls':>11}{'wall (s)':>10}")
+    for count in args.instances:
+        instance_ids = [f"i-{n:017x}" for n in range(count)]
+        for name, strategy in strategies:
+            client = StubCloudWatch(args.latency)
+            started = time.perf_counter()
+            asyncio.run(strategy(client, instance_ids, start_time, end_time))
+            print(f"{name:<26}{count:>10}{client.calls:>11}{time.perf_counter() - started:>10.3f}")
+    shutdown_executor()
+
+
+if __name__ == "__main__":
+    main()
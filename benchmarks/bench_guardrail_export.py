@@ -0,0 +1,66 @@
+"""
+Benchmark：Guardrail 事件串流匯出的記憶體上限
+
+寫入大量合成事件後，以各種格式完整匯出一次，用 tracemalloc 量測匯出過程中的
+記憶體峰值（不含事件儲存本身），超過 --ceiling-mib 時以非零狀態結束。
+
+執行方式：
+    python benchmarks/bench_guardrail_export.py --events 1000000 --ceiling-mib 4
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+from bedrock_guardrail import export_chunks  # noqa: E402
+from guardrail_store import ColumnarEventStore  # noqa: E402
+from bench_guardrail_store import synthetic_events  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--ceiling-mib", type=float, default=4.0, help="匯出過程允許的記憶體峰值（MiB）")
+    parser.add_argument("--formats", nargs="+", default=["csv", "ndjson", "csv+gzip"])
+    args = parser.parse_args()
+
+    store = ColumnarEventStore()
+    batch = []
+    for event in synthetic_events(args.events):
+        batch.append(event)
+        if len(batch) >= 50_000:
+            store.ingest(batch)
+            batch = []
+    store.ingest(batch)
+    print(f"store: {len(store):,} events")
+
+    failed = False
+    print(f"{'format':<12}{'bytes':>16}{'seconds':>10}{'peak MiB':>10}")
+    for spec in args.formats:
+        fmt, _, compression = spec.partition("+")
+        tracemalloc.start()
+        started = time.perf_counter()
+        total = 0
+        for chunk in export_chunks(store.iter_events(), fmt, compress=compression == "gzip"):
+            total += len(chunk)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mib = peak / 1024 / 1024
+        failed |= peak_mib > args.ceiling_mib
+        print(f"{spec:<12}{total:>16,}{elapsed:>10.2f}{peak_mib:>10.2f}")
+
+    if failed:
+        print(f"FAIL: export peak memory exceeded {args.ceiling_mib} MiB")
+        sys.exit(1)
+    print(f"OK: every export stayed under {args.ceiling_mib} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark：Guardrail 事件儲存（ColumnarEventStore）vs 逐筆掃描 list
+
+產生大量合成事件，量測寫入速度、group-by / trend / 時間區間查詢延遲與記憶體，
+並與原本「每次請求掃描整個 list 並 strptime」的作法比較。
+
+執行方式：
+    python benchmarks/bench_guardrail_store.py --events 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from guardrail_store import ColumnarEventStore, parse_timestamp  # noqa: E402
+
+REASONS = ["toxicity", "jailbreak", "bias", "pii", "prompt-attack", "denied-topic"]
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def synthetic_events(count, days=365, users=5000, resources=50, seed=42):
+    """依時間遞增產生事件，模擬每日數千到數百萬筆的稽核資料"""
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    step = days * 86400 / count
+    for i in range(count):
+        ts = start + timedelta(seconds=i * step)
+        yield {
+            "id": f"event{i:08d}",
+            "user": f"user{rng.randrange(users)}",
+            "resource": f"model-{rng.randrange(resources)}",
+            "timestamp": ts.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "reason": rng.choice(REASONS),
+        }
+
+
+def timed(label, fn, repeat=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<40}{best * 1000:>12.3f} ms")
+    return result
+
+
+def list_scan_baseline(events, days):
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    by_user = {}
+    for e in events:
+        by_user[e["user"]] = by_user.get(e["user"], 0) + 1
+    trend = {}
+    for e in events:
+        ts = datetime.strptime(e["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
+        if ts >= cutoff:
+            key = ts.strftime("%Y-%m-%d")
+            trend[key] = trend.get(key, 0) + 1
+    return by_user, trend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=50_000, help="每次 ingest 的筆數")
+    parser.add_argument("--skip-baseline", action="store_true", help="略過逐筆掃描的比較")
+    args = parser.parse_args()
+
+    store = ColumnarEventStore()
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    batch = []
+    for event in synthetic_events(args.events):
+        batch.append(event)
+        if len(batch) >= args.batch:
+            store.ingest(batch)
+            batch = []
+    store.ingest(batch)
+    elapsed = time.perf_counter() - started
+    print(f"ingest: {len(store):,} events in {elapsed:.2f} s ({len(store) / elapsed:,.0f} events/s)")
+    print(f"store RSS growth: {(rss_bytes() - rss_before) / 1024 / 1024:.1f} MiB")
+
+    now = parse_timestamp(datetime.now(timezone.utc))
+    print("queries (best of 5):")
+    timed("group-by user", lambda: store.count_by("user"))
+    timed("group-by resource", lambda: store.count_by("resource"))
+    timed("group-by reason", lambda: store.count_by("reason"))
+    timed("trend 7 days", lambda: store.count_by_day(now - 7 * 86400))
+    timed("trend 90 days", lambda: store.count_by_day(now - 90 * 86400))
+    timed("group-by resource, last 1 day", lambda: store.count_by("resource", now - 86400, now))
+    timed("group-by reason, last 30 days", lambda: store.count_by("reason", now - 30 * 86400, now))
+    timed("group-by user, last 30 days", lambda: store.count_by("user", now - 30 * 86400, now))
+    timed("iterate last 1 hour", lambda: sum(1 for _ in store.iter_events(now - 3600, now)))
+
+    if not args.skip_baseline:
+        events = list(synthetic_events(args.events))
+        print("list scan baseline (group-by user + 7-day trend):")
+        timed("MOCK_EVENTS-style scan", lambda: list_scan_baseline(events, 7), repeat=1)
+
+
+if __name__ == "__main__":
+    main()
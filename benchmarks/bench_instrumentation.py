@@ -0,0 +1,97 @@
+"""
+Benchmark：instrumentation 的每請求額外成本
+
+直接以 ASGI 呼叫一個最小的 FastAPI 路由（不經過網路與 HTTP client），
+比較有無 PrometheusMiddleware 的每請求耗時，並量測 botocore hooks
+（before-call / after-call）每次 AWS 呼叫增加的耗時。
+
+執行方式：
+    python benchmarks/bench_instrumentation.py --requests 20000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI  # noqa: E402
+
+from instrumentation import PrometheusMiddleware, _after_call, _before_call, render  # noqa: E402
+
+
+def build_app(instrumented):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        return {"item_id": item_id}
+
+    if instrumented:
+        app.add_middleware(PrometheusMiddleware)
+    return app
+
+
+async def drive(app, count):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i):
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": f"/items/{i}", "raw_path": f"/items/{i}".encode(),
+            "query_string": b"", "root_path": "", "headers": [], "server": ("bench", 80), "client": ("bench", 1),
+        }
+
+    for i in range(200):
+        await app(scope(i), receive, send)
+    started = time.perf_counter()
+    for i in range(count):
+        await app(scope(i), receive, send)
+    return (time.perf_counter() - started) / count
+
+
+class _Model:
+    name = "DescribeInstances"
+
+    class service_model:
+        service_name = "ec2"
+
+
+def hook_overhead(count):
+    parsed = {"ResponseMetadata": {"RetryAttempts": 0}}
+    model = _Model()
+    started = time.perf_counter()
+    for _ in range(count):
+        context = {}
+        _before_call(model=model, context=context)
+        _after_call(parsed=parsed, context=context)
+    return (time.perf_counter() - started) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    plain = asyncio.run(drive(build_app(False), args.requests))
+    instrumented = asyncio.run(drive(build_app(True), args.requests))
+    hooks = hook_overhead(args.requests)
+
+    print(f"{args.requests:,} requests per run")
+    print(f"{'plain FastAPI':<28}{plain * 1e6:>10.2f} us/request")
+    print(f"{'with PrometheusMiddleware':<28}{instrumented * 1e6:>10.2f} us/request")
+    print(f"{'middleware overhead':<28}{(instrumented - plain) * 1e6:>10.2f} us/request")
+    print(f"{'botocore hooks':<28}{hooks * 1e6:>10.2f} us/call")
+    started = time.perf_counter()
+    size = len(render())
+    print(f"{'render /metrics':<28}{(time.perf_counter() - started) * 1000:>10.2f} ms ({size:,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
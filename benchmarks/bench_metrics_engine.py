@@ -0,0 +1,118 @@
+"""
+Benchmark：metrics 查詢引擎的 bucket 快取 vs 每次完整查詢
+
+以模擬時鐘重播 dashboard 輪詢（每 --interval 秒查詢一次過去 --minutes 分鐘、
+--series 條 series），比較快取前後的 get_metric_data 呼叫次數與抓取的 datapoint 數，
+並驗證兩者回傳的資料完全相同。另以 max_series 小於 --series 的引擎重播一次，
+確認單次查詢的 series 數超過 LRU 上限時結果仍與完整查詢相同（不會因淘汰而變成空的）。
+
+執行方式：
+    python benchmarks/bench_metrics_engine.py --series 60 --polls 360 --interval 10
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+from aws_executor import shutdown_executor  # noqa: E402
+from metrics_engine import MetricsEngine  # noqa: E402
+
+
+class SimulatedClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StubCloudWatch:
+    """每個 bucket 都有資料的 CloudWatch 替身；數值由 bucket 時間決定，方便比對"""
+
+    def __init__(self):
+        self.calls = 0
+        self.datapoints = 0
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime, **kwargs):
+        self.calls += 1
+        results = []
+        for q in MetricDataQueries:
+            period = q["MetricStat"]["Period"]
+            start = int(StartTime.timestamp())
+            end = int(EndTime.timestamp())
+            timestamps = [StartTime.fromtimestamp(t, timezone.utc) for t in range(start, end, period)]
+            results.append({
+                "Id": q["Id"],
+                "Timestamps": timestamps,
+                "Values": [float(t % 997) for t in range(start, end, period)],
+            })
+            self.datapoints += len(timestamps)
+        return {"MetricDataResults": results}
+
+
+def specs(count):
+    return [
+        ("AWS/AppRunner", "Requests", [("ServiceName", f"svc{i}"), ("ServiceID", f"id{i}")], "Sum")
+        for i in range(count)
+    ]
+
+
+async def replay(engine, clock, args):
+    queries = specs(args.series)
+    results = []
+    for _ in range(args.polls):
+        window = await engine.query(queries, clock.now - args.minutes * 60, clock.now, period=60)
+        results.append(window.values)
+        clock.now += args.interval
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=60)
+    parser.add_argument("--minutes", type=int, default=60, help="每次查詢的時間窗（分鐘）")
+    parser.add_argument("--polls", type=int, default=360)
+    parser.add_argument("--interval", type=float, default=10, help="輪詢間隔（模擬秒數）")
+    args = parser.parse_args()
+
+    start = 1_700_000_000
+    rows = []
+    outputs = []
+    strategies = [
+        ("no cache", -1, 1e10, args.series),
+        ("bucket cache", 60, 600, args.series),
+        ("LRU < series", 60, 600, max(1, args.series // 3)),
+    ]
+    for name, open_ttl, settle, max_series in strategies:
+        client = StubCloudWatch()
+        clock = SimulatedClock(start)
+        # settle 極大、open_ttl < 0：所有 bucket 都視為未結束且立即過期，等同每次完整查詢
+        engine = MetricsEngine(client, settle_seconds=settle, open_ttl=open_ttl, max_series=max_series, clock=clock)
+        started = time.perf_counter()
+        outputs.append(asyncio.run(replay(engine, clock, args)))
+        rows.append((name, client.calls, client.datapoints, time.perf_counter() - started))
+
+    print(f"{args.polls} polls x {args.series} series, {args.minutes}-minute window every {args.interval:g}s")
+    print(f"{'strategy':<16}{'api calls':>11}{'datapoints':>14}{'wall (s)':>10}")
+    for name, calls, datapoints, elapsed in rows:
+        print(f"{name:<16}{calls:>11,}{datapoints:>14,}{elapsed:>10.3f}")
+    shutdown_executor()
+
+    if outputs[0] != outputs[1]:
+        print("FAIL: cached results differ from uncached results")
+        sys.exit(1)
+    if outputs[0] != outputs[2]:
+        print("FAIL: results differ when a query spans more series than max_series")
+        sys.exit(1)
+    print("OK: cached results match uncached results, including with max_series < series")
+
+
+if __name__ == "__main__":
+    main()
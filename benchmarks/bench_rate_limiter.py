@@ -0,0 +1,136 @@
+"""
+Benchmark：重試模式與 client 端 token bucket 在 throttle 下的表現
+
+以真正的 botocore EC2 client 呼叫 DescribeInstances，但在 before-send 換成模擬的 AWS：
+伺服器端以 token bucket 限制每秒 --server-rate 個請求，超過時回傳 RequestLimitExceeded，
+每個請求有 --latency 秒的延遲。--concurrency 個 task 透過 run_aws 共送出 --calls 個呼叫，
+比較三種設定的成功數、成功吞吐量、成功呼叫的 p50 / p99 延遲與送到伺服器的請求數：
+
+- botocore 預設：legacy 重試、10 條連線、不限流；
+- adaptive 重試（專案的 client Config）；
+- adaptive 重試 + 各 API token bucket（rate_limiter）。
+
+執行方式：
+    python benchmarks/bench_rate_limiter.py --calls 400 --concurrency 64 --server-rate 50
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+from botocore.awsrequest import AWSResponse  # noqa: E402
+from botocore.config import Config  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+
+from aws_clients import ClientRegistry, client_config, session  # noqa: E402
+from aws_executor import run_aws, shutdown_executor  # noqa: E402
+from rate_limiter import rate_limiter  # noqa: E402
+
+THROTTLED = (
+    b"<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded.</Message>"
+    b"</Error></Errors><RequestID>bench</RequestID></Response>"
+)
+OK = b"<DescribeInstancesResponse><reservationSet/></DescribeInstancesResponse>"
+
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+class ThrottlingServer:
+    """每秒最多 rate 個請求的 AWS 替身，超過時回傳 throttle 錯誤"""
+
+    def __init__(self, rate, latency):
+        self.rate = rate
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.throttled = 0
+
+    def send(self, request, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            allowed = self.tokens >= 1
+            if allowed:
+                self.tokens -= 1
+            self.requests += 1
+            self.throttled += not allowed
+        return AWSResponse(request.url, 200 if allowed else 503, {}, _Body(OK if allowed else THROTTLED))
+
+
+async def scenario(name, config, limit, args):
+    server = ThrottlingServer(args.server_rate, args.latency)
+    registry = ClientRegistry(session, config=config)
+    registry.register_event_hook("before-call.*.*", rate_limiter.before_call)
+    registry.register_event_hook("before-send.*.*", server.send)
+    client = registry.get("ec2")
+    rate_limiter.configure({("ec2", "DescribeInstances"): (limit, limit)} if limit else {})
+
+    latencies = []
+    failures = 0
+    queue = asyncio.Queue()
+    for _ in range(args.calls):
+        queue.put_nowait(None)
+
+    async def worker():
+        nonlocal failures
+        while not queue.empty():
+            queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                await run_aws("ec2", client.describe_instances)
+                latencies.append(time.perf_counter() - started)
+            except ClientError:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else float("nan")
+
+    return name, len(latencies), failures, len(latencies) / elapsed, pct(0.5), pct(0.99), server.requests, server.throttled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--server-rate", type=float, default=50, help="模擬 AWS 每秒允許的請求數")
+    parser.add_argument("--latency", type=float, default=0.02, help="每個請求的模擬延遲（秒）")
+    args = parser.parse_args()
+
+    scenarios = [
+        ("botocore defaults", Config(retries={"mode": "legacy"}), None),
+        ("adaptive retries", client_config, None),
+        ("adaptive + token bucket", client_config, args.server_rate * 0.95),
+    ]
+    rows = [asyncio.run(scenario(name, config, limit, args)) for name, config, limit in scenarios]
+    shutdown_executor()
+
+    print(f"{args.calls} calls, {args.concurrency} concurrent callers, server allows {args.server_rate:g} req/s")
+    print(f"{'strategy':<26}{'ok':>6}{'failed':>8}{'ok/s':>8}{'p50 (s)':>9}{'p99 (s)':>9}{'sent':>7}{'throttled':>11}")
+    for name, ok, failed, throughput, p50, p99, sent, throttled in rows:
+        print(f"{name:<26}{ok:>6}{failed:>8}{throughput:>8.1f}{p50:>9.3f}{p99:>9.3f}{sent:>7}{throttled:>11}")
+
+
+if __name__ == "__main__":
+    main()
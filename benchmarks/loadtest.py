@@ -0,0 +1,347 @@
+"""
+離線 load test：在同一個 process 內以 httpx ASGITransport 對整個 FastAPI app 施壓
+
+AWS 由 aws_stub.AwsStub 取代（真正的 boto3 client，只攔截網路），可注入延遲與 throttle；
+合成 fleet 規模的資料：數千台 EC2、一年以上的每日成本、數百萬筆 Guardrail 事件。
+每個情境先量一次冷請求，再以 --concurrency 個 client 送出 --requests 個請求，記錄：
+吞吐量、p50 / p99 延遲、錯誤數、上游 AWS 呼叫次數（依 operation）與 peak RSS。
+
+結果可存成 baseline，之後的執行與 baseline 比較，延遲、吞吐量、上游呼叫次數或記憶體
+超出容許範圍時列出退化項目並以 exit code 1 結束。baseline 只和相同參數的執行比較。
+
+延遲與吞吐量不以絕對值比較：每個情境執行前，在同一個 process 內量測一個與 app 無關的固定純 Python
+工作，整次執行中最快的一次即為 reference_ms，baseline 存的是各情境相對於它的比值，換一台較快或較慢的
+機器大致仍可比較。合成資料建立後以 gc.freeze() 移出 GC 追蹤，避免大 heap 的 GC 造成雜訊。
+共用機器上的速度仍會漂移，而以模擬 AWS 延遲為主的情境不隨機器速度縮放，因此只以 p50 與吞吐量判定，
+容許範圍預設很寬（--tolerance 1.0，即 2 倍以內）；p99 由少數幾個請求決定，只列出不判定。
+上游呼叫次數與錯誤數與機器無關，嚴格比較。程式或參數改變後以 --save-baseline 重新產生 baseline。
+
+需要 httpx：pip install -r benchmarks/requirements.txt
+
+執行方式：
+    python benchmarks/loadtest.py                              # 與 benchmarks/baseline.json 比較
+    python benchmarks/loadtest.py --save-baseline              # 更新 baseline
+    python benchmarks/loadtest.py --only billing --latency 0.05 --throttle-rate 20
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# 比較時忽略小於這個毫秒數的延遲變化，避免極快的端點因量測雜訊（例如一次 GC）被判定退化
+MIN_LATENCY_DELTA_MS = 5.0
+# 同理，吞吐量換算成整個情境的耗時後，忽略小於這個毫秒數的變化；極快的情境整段只有約 100 ms
+MIN_ELAPSED_DELTA_MS = 250.0
+REFERENCE_RUNS = 10
+# 影響結果的參數；與 baseline 不同時不做比較
+COMPARABLE_ARGS = (
+    "instances", "apprunner_services", "cost_services", "guardrail_events", "accounts", "regions",
+    "latency", "jitter", "throttle_rate", "throttle_fraction", "requests", "concurrency",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instances", type=int, default=5000)
+    parser.add_argument("--apprunner-services", type=int, default=50)
+    parser.add_argument("--cost-services", type=int, default=60)
+    parser.add_argument("--guardrail-events", type=int, default=2_000_000)
+    parser.add_argument("--accounts", type=int, default=2, help="帳號數（含預設帳號），其餘以 assume role 存取")
+    parser.add_argument("--regions", default="us-east-1,us-west-2,eu-west-1")
+    parser.add_argument("--latency", type=float, default=0.02, help="每個 AWS 呼叫的模擬延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=0.01, help="延遲的隨機抖動上限（秒）")
+    parser.add_argument("--throttle-rate", type=float, default=None, help="每個 AWS API 每秒允許的請求數")
+    parser.add_argument("--throttle-fraction", type=float, default=0.0, help="隨機 throttle 的比例")
+    parser.add_argument("--requests", type=int, default=100, help="每個情境的請求數（乘上情境權重）")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", default=None, help="只執行名稱包含此字串的情境，例如 billing")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="把這次結果寫入 --baseline")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="延遲 / 吞吐量比值與記憶體的容許變化比例")
+    parser.add_argument("--output", default=None, help="另外把結果寫到這個 JSON 檔")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """在 import app 之前設定環境變數：假的憑證、帳號與 region，停用會碰到磁碟的功能"""
+    os.environ["AWS_ACCESS_KEY_ID"] = "loadtest"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "loadtest"
+    os.environ["AWS_REGION"] = args.regions.split(",")[0]
+    os.environ["AWS_REGIONS"] = args.regions
+    os.environ["AWS_ACCOUNT_ROLES"] = ",".join(
+        f"account{i}=arn:aws:iam::{100000000000 + i}:role/Monitor" for i in range(1, args.accounts)
+    )
+    # 壓力下單一請求可能超過預設的 fan-out 逾時，部分 region 被放棄會讓上游呼叫次數隨時間漂移
+    os.environ["AWS_FANOUT_TIMEOUT"] = "600"
+    for name in ("PERSISTENT_CACHE_PATH", "INVENTORY_SNAPSHOT_ENABLED", "AWS_API_RATE_LIMITS"):
+        os.environ.pop(name, None)
+
+
+def scenarios(fleet):
+    """(情境名稱, method, path, query 參數, 權重)；權重乘上 --requests 為該情境的請求數"""
+    instance_ids = [instance["id"] for instance in fleet.instances]
+    service_arn = fleet.services[0]["ServiceArn"] if fleet.services else "arn:aws:apprunner:us-east-1:1:service/a/b"
+    recent = (datetime.now(timezone.utc) - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return [
+        ("root.index", "GET", "/", None, 1.0),
+        ("ec2.instances", "GET", "/ec2/instances", None, 0.2),
+        ("ec2.instances_page", "GET", "/ec2/instances", {"limit": 100, "state": "running"}, 1.0),
+        ("ec2.fleet_instances", "GET", "/ec2/fleet/instances", {"state": "running"}, 0.1),
+        ("ec2.fleet_status", "GET", "/ec2/fleet/status", None, 0.2),
+        ("ec2.fleet_status_ids", "GET", "/ec2/fleet/status", {"instance_ids": instance_ids[:300]}, 0.5),
+        ("ec2.fleet_metrics", "GET", "/ec2/fleet/metrics",
+         {"instance_ids": instance_ids[:500], "metrics": ["CPUUtilization", "NetworkIn"]}, 0.5),
+        ("ec2.cpu_utilization", "GET", f"/ec2/cpu-utilization/{instance_ids[0]}", {"hours": 24}, 1.0),
+        ("billing.daily_cost", "GET", "/billing/daily-cost", {"days": 30}, 1.0),
+        ("billing.current_month_cost", "GET", "/billing/current-month-cost", None, 1.0),
+        ("billing.months_trend", "GET", "/billing/months-trend", {"months": 12}, 1.0),
+        ("billing.cost_by_tag", "GET", "/billing/cost-by-tag", {"tag_key": "team"}, 1.0),
+        ("billing.cost_forecast", "GET", "/billing/cost-forecast", {"days": 14}, 1.0),
+        ("billing.anomalies", "GET", "/billing/analytics/anomalies", {"days": 90}, 1.0),
+        ("billing.month_over_month", "GET", "/billing/analytics/month-over-month", None, 1.0),
+        ("billing.saving_tips", "GET", "/billing/saving-tips", None, 1.0),
+        ("billing.accounts_current_month", "GET", "/billing/accounts/current-month-cost", None, 1.0),
+        ("apprunner.dashboard", "GET", "/apprunner/dashboard", {"minutes": 60}, 0.5),
+        ("apprunner.error_metrics", "GET", "/apprunner/service/error-metrics",
+         {"service_arn": service_arn, "minutes": 1440}, 1.0),
+        ("guardrail.group_by_user", "GET", "/bedrock/guardrail/events/group-by-user", None, 0.5),
+        ("guardrail.group_by_reason_range", "GET", "/bedrock/guardrail/events/group-by-reason", {"start": recent}, 1.0),
+        ("guardrail.trend", "GET", "/bedrock/guardrail/events/trend", {"days": 30}, 1.0),
+        ("guardrail.events_page", "GET", "/bedrock/guardrail/events", {"start": recent, "limit": 1000}, 1.0),
+        ("guardrail.export_csv", "GET", "/bedrock/guardrail/events/export", {"format": "csv", "start": recent}, 0.1),
+        ("ops.metrics", "GET", "/metrics", None, 1.0),
+    ]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def reference_workload(rows):
+    json.loads(json.dumps(rows))
+    sorted(rows, key=lambda row: (-row["value"], row["name"]))
+
+
+def reference_ms():
+    """
+    與 app 無關的固定純 Python 工作（JSON 編解碼 + 排序）的最短耗時，代表這台機器目前的速度；
+    取最短而非中位數，並在量測期間停用 GC，不受其他 process 與 heap 大小影響
+    """
+    rows = [{"id": i, "name": f"item-{i % 997}", "value": (i * 7919) % 1000 / 10} for i in range(5000)]
+    best = float("inf")
+    gc.disable()
+    try:
+        for _ in range(REFERENCE_RUNS):
+            started = time.perf_counter()
+            reference_workload(rows)
+            best = min(best, (time.perf_counter() - started) * 1000)
+    finally:
+        gc.enable()
+    return best
+
+
+def with_ratios(row, reference):
+    """加上相對於 reference_ms 的比值，baseline 以比值比較"""
+    return {
+        **row,
+        "p50_ratio": round(row["p50_ms"] / reference, 4),
+        "p99_ratio": round(row["p99_ms"] / reference, 4),
+        # 每個 reference 工作的時間內完成幾個請求
+        "throughput_ratio": round(row["throughput_rps"] * reference / 1000, 4),
+    }
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round((peak if platform.system() == "Darwin" else peak * 1024) / 2**20, 1)
+
+
+async def run_scenario(client, stub, method, path, params, count, concurrency):
+    before, before_throttled = stub.snapshot()
+
+    started = time.perf_counter()
+    response = await client.request(method, path, params=params)
+    cold_ms = (time.perf_counter() - started) * 1000
+    status_codes = {str(response.status_code): 1}
+
+    latencies = []
+    remaining = count
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            request_started = time.perf_counter()
+            reply = await client.request(method, path, params=params)
+            latencies.append((time.perf_counter() - request_started) * 1000)
+            key = str(reply.status_code)
+            status_codes[key] = status_codes.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, count))))
+    elapsed = time.perf_counter() - started
+
+    after, after_throttled = stub.snapshot()
+    upstream = {f"{service}.{operation}": n for (service, operation), n in (after - before).items()}
+    latencies.sort()
+    return {
+        "requests": count,
+        "cold_ms": round(cold_ms, 2),
+        "throughput_rps": round(count / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "errors": sum(n for code, n in status_codes.items() if not code.startswith("2")),
+        "status_codes": status_codes,
+        "upstream_calls": sum(upstream.values()),
+        "upstream_by_operation": dict(sorted(upstream.items())),
+        "throttled": sum((after_throttled - before_throttled).values()),
+        "response_bytes": len(response.content),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def run(args, app, stub, fleet):
+    import httpx
+
+    results = {}
+    references = [reference_ms()]
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=300) as client:
+            for name, method, path, params, weight in scenarios(fleet):
+                if args.only and args.only not in name:
+                    continue
+                count = max(1, int(args.requests * weight))
+                references.append(reference_ms())
+                row = results[name] = await run_scenario(
+                    client, stub, method, path, params, count, args.concurrency
+                )
+                print(
+                    f"{name:<34}{row['throughput_rps']:>9.1f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+                    f"{row['cold_ms']:>10.1f}{row['upstream_calls']:>8}{row['throttled']:>6}{row['errors']:>6}"
+                    f"{row['peak_rss_mb']:>9.1f}{references[-1]:>8.2f}",
+                    flush=True,
+                )
+    # 取整次執行中最快的一次，代表這台機器的速度；較慢的量測只是當下被其他 process 拖慢
+    reference = min(references)
+    return reference, {name: with_ratios(row, reference) for name, row in results.items()}
+
+
+def compare(results, baseline, tolerance, reference):
+    """回傳退化項目的說明清單；延遲與吞吐量以相對於 reference_ms 的比值比較"""
+    regressions = []
+    latency_noise = MIN_LATENCY_DELTA_MS / reference
+    elapsed_noise = MIN_ELAPSED_DELTA_MS / reference
+    for name, current in results.items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        limit = base["p50_ratio"] * (1 + tolerance) + latency_noise
+        if current["p50_ratio"] > limit:
+            regressions.append(f"{name}: p50_ratio {current['p50_ratio']} > {base['p50_ratio']} (limit {limit:.4f})")
+        # 以 reference 為單位的整段耗時比較，才能套用與延遲相同的雜訊下限
+        base_elapsed = base["requests"] / base["throughput_ratio"]
+        if current["requests"] / current["throughput_ratio"] > base_elapsed * (1 + tolerance) + elapsed_noise:
+            regressions.append(
+                f"{name}: throughput_ratio {current['throughput_ratio']} < {base['throughput_ratio']}"
+            )
+        # 上游呼叫次數與錯誤數在相同參數下是確定的，任何增加都視為退化
+        for field in ("upstream_calls", "errors"):
+            if current[field] > base[field]:
+                regressions.append(f"{name}: {field} {current[field]} > {base[field]}")
+    base_rss = baseline.get("peak_rss_mb")
+    current_rss = max((row["peak_rss_mb"] for row in results.values()), default=0)
+    if base_rss and current_rss > base_rss * (1 + tolerance):
+        regressions.append(f"peak_rss_mb {current_rss} > {base_rss}")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+
+    from aws_clients import client_pool  # noqa: E402
+    from aws_stub import AwsStub, SyntheticFleet  # noqa: E402
+    from bench_guardrail_store import synthetic_events  # noqa: E402
+    from guardrail_store import get_event_store  # noqa: E402
+    import main as app_main  # noqa: E402
+
+    started = time.perf_counter()
+    fleet = SyntheticFleet(args.instances, args.apprunner_services, args.cost_services)
+    get_event_store().ingest(synthetic_events(args.guardrail_events, days=400))
+    stub = AwsStub(fleet, args.latency, args.jitter, args.throttle_rate, args.throttle_fraction)
+    stub.install(client_pool)
+    # 合成資料與 app 的物件不再變動，移出 GC 追蹤，情境中的 GC 不必掃描數百萬個物件
+    gc.collect()
+    gc.freeze()
+    print(
+        f"fleet: {args.instances} instances, {args.apprunner_services} App Runner services, "
+        f"{args.cost_services} cost services, {len(get_event_store()):,} guardrail events "
+        f"({time.perf_counter() - started:.1f}s to build, peak RSS {peak_rss_mb()} MB)"
+    )
+    print(
+        f"{'scenario':<34}{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}{'cold ms':>10}"
+        f"{'aws':>8}{'thr':>6}{'err':>6}{'rss MB':>9}{'ref ms':>8}"
+    )
+    reference, results = asyncio.run(run(args, app_main.app, stub, fleet))
+    print(f"reference workload: {reference:.2f} ms (latency / throughput are compared as ratios to this)")
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "args": {name: getattr(args, name) for name in COMPARABLE_ARGS},
+        },
+        "reference_ms": round(reference, 4),
+        "peak_rss_mb": peak_rss_mb(),
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if "reference_ms" not in baseline:
+        print("baseline has absolute timings only; regenerate it with --save-baseline")
+        sys.exit(2)
+    if baseline["meta"]["args"] != report["meta"]["args"]:
+        print("baseline was recorded with different parameters; not comparing")
+        print(f"  baseline: {baseline['meta']['args']}")
+        sys.exit(2)
+    print(f"reference workload: baseline {baseline['reference_ms']:.2f} ms, this run {reference:.2f} ms")
+    regressions = compare(results, baseline, args.tolerance, reference)
+    if regressions:
+        print(f"FAIL: {len(regressions)} regressions against {args.baseline}")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"OK: no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
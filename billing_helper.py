@@ -1,42 +1,128 @@
 from fastapi import APIRouter, HTTPException, Query
+from botocore.exceptions import BotoCoreError, ClientError
 from aws_clients import cost_explorer_client
+from aws_executor import run_aws
+from aws_fanout import fan_out, pool_client, resolve_accounts, scope
+from query_cache import AsyncTTLCache
+from persistent_cache import persistent_cache
+from cost_store import PERSIST_PREFIX as COST_PERSIST_PREFIX, DailyCostStore, add_months
+from cost_analytics import CostAnalytics, forecast, monthly_sums, percent_change, rolling_zscores
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
+import asyncio
+import json
+import os
+
+import numpy as np
 
 router = APIRouter()
 
+# Cost Explorer 資料一天只更新數次，依 granularity 設定快取秒數
+COST_CACHE_TTL = {
+    "HOURLY": int(os.getenv("COST_CACHE_TTL_HOURLY", 900)),
+    "DAILY": int(os.getenv("COST_CACHE_TTL_DAILY", 3 * 3600)),
+    "MONTHLY": int(os.getenv("COST_CACHE_TTL_MONTHLY", 6 * 3600)),
+}
+cost_cache = AsyncTTLCache(max_entries=int(os.getenv("COST_CACHE_MAX_ENTRIES", 256)))
+
+REFRESH_QUERY = Query(False, description="略過快取，強制重新向 Cost Explorer 查詢")
+
 def format_date(date_obj):
     return date_obj.strftime("%Y-%m-%d")
 
+def _cost_query_key(params):
+    """將查詢參數正規化成快取 key（metrics / group-by 順序不影響結果）"""
+    return (
+        params["TimePeriod"]["Start"],
+        params["TimePeriod"]["End"],
+        params["Granularity"],
+        tuple(sorted(params["Metrics"])),
+        tuple(sorted((g["Type"], g["Key"]) for g in params.get("GroupBy", []))),
+        json.dumps(params.get("Filter"), sort_keys=True) if params.get("Filter") else None,
+        params.get("NextPageToken"),
+    )
+
+# Cost Explorer 只有 us-east-1 的 endpoint
+COST_EXPLORER_REGION = "us-east-1"
+
+async def query_cost_and_usage(refresh=False, account=None, **params):
+    """
+    經過快取的 get_cost_and_usage 呼叫，相同的同時查詢只會打一次 Cost Explorer；
+    account 為 AWS_ACCOUNT_ROLES 中的帳號名稱，省略時使用預設帳號
+    """
+    if account is None:
+        key = _cost_query_key(params)
+
+        async def call():
+            return await run_aws("ce", cost_explorer_client.get_cost_and_usage, **params)
+    else:
+        key = (account, *_cost_query_key(params))
+
+        async def call():
+            client = await pool_client("ce", account, COST_EXPLORER_REGION)
+            return await run_aws(f"ce@{scope(account, COST_EXPLORER_REGION)}", client.get_cost_and_usage, **params)
+    return await cost_cache.get_or_fetch(
+        key,
+        call,
+        ttl=COST_CACHE_TTL.get(params["Granularity"], COST_CACHE_TTL["DAILY"]),
+        refresh=refresh,
+    )
+
+# 依 SERVICE 分組的每日成本，daily-cost / current-month-cost / months-trend / cost-forecast 共用
+COST_STORE_OPEN_DAYS = int(os.getenv("COST_STORE_OPEN_DAYS", 3))
+COST_STORE_PREFETCH_DAYS = int(os.getenv("COST_STORE_PREFETCH_DAYS", 90))
+service_cost_store = DailyCostStore(
+    query_cost_and_usage,
+    group_by=[{"Type": "DIMENSION", "Key": "SERVICE"}],
+    open_days=COST_STORE_OPEN_DAYS,
+    open_ttl=COST_CACHE_TTL["DAILY"],
+    prefetch_days=COST_STORE_PREFETCH_DAYS,
+    persistent=persistent_cache,
+)
+# analytics 端點使用最近 13 個月（Cost Explorer 可查詢的範圍）的每日服務成本矩陣
+ANALYTICS_HISTORY_MONTHS = int(os.getenv("COST_ANALYTICS_HISTORY_MONTHS", 13))
+service_analytics = CostAnalytics(service_cost_store, history_months=ANALYTICS_HISTORY_MONTHS)
+# 依標籤分組的每日成本，每個 tag key 一份
+tag_cost_stores = {}
+
+def get_tag_cost_store(tag_key):
+    store = tag_cost_stores.get(tag_key)
+    if store is None:
+        store = DailyCostStore(
+            query_cost_and_usage,
+            group_by=[{"Type": "TAG", "Key": tag_key}],
+            open_days=COST_STORE_OPEN_DAYS,
+            open_ttl=COST_CACHE_TTL["DAILY"],
+            persistent=persistent_cache,
+        )
+        tag_cost_stores[tag_key] = store
+    return store
+
 @router.get("/daily-cost")
-async def get_daily_cost(days: Optional[int] = Query(7, ge=1, le=90, description="查詢過去幾天每日成本，預設7天")):
+async def get_daily_cost(
+    days: Optional[int] = Query(7, ge=1, le=90, description="查詢過去幾天每日成本，預設7天"),
+    refresh: bool = REFRESH_QUERY,
+):
     """
     查詢過去 N 天每日成本
     """
     try:
-        end_date = datetime.utcnow().date() + timedelta(days=1)  # AWS API EndDate 是 exclusive
+        today = datetime.utcnow().date()
+        end_date = today + timedelta(days=1)  # EndDate 是 exclusive
         start_date = end_date - timedelta(days=days)
 
-        response = cost_explorer_client.get_cost_and_usage(
-            TimePeriod={"Start": format_date(start_date), "End": format_date(end_date)},
-            Granularity="DAILY",
-            Metrics=["UnblendedCost"],
-        )
-
-        daily_costs = []
-        for result in response["ResultsByTime"]:
-            daily_costs.append({
-                "date": result["TimePeriod"]["Start"],
-                "amount": float(result["Total"]["UnblendedCost"]["Amount"]),
-                "unit": result["Total"]["UnblendedCost"]["Unit"]
-            })
+        await service_cost_store.ensure(start_date, end_date, today, refresh=refresh)
 
+        daily_costs = [
+            {"date": format_date(day), "amount": amount, "unit": service_cost_store.unit}
+            for day, amount in service_cost_store.daily_totals(start_date, end_date)
+        ]
         return {"daily_costs": daily_costs}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get daily cost: {e}")
 
 @router.get("/current-month-cost")
-async def get_current_month_cost():
+async def get_current_month_cost(refresh: bool = REFRESH_QUERY):
     """
     取得本月（從月初到今天）依服務分類的成本
     """
@@ -45,65 +131,111 @@ async def get_current_month_cost():
         start_of_month = today.replace(day=1)
         end_date = today + timedelta(days=1)  # EndDate 是 exclusive
 
-        response = cost_explorer_client.get_cost_and_usage(
-            TimePeriod={"Start": format_date(start_of_month), "End": format_date(end_date)},
-            Granularity="MONTHLY",
-            Metrics=["UnblendedCost"],
-            GroupBy=[{"Type": "DIMENSION", "Key": "SERVICE"}],
-        )
+        await service_cost_store.ensure(start_of_month, end_date, today, refresh=refresh)
 
-        results = []
-        for group in response["ResultsByTime"][0]["Groups"]:
-            service = group["Keys"][0]
-            amount = group["Metrics"]["UnblendedCost"]["Amount"]
-            unit = group["Metrics"]["UnblendedCost"]["Unit"]
-            results.append({"service": service, "amount": float(amount), "unit": unit})
-
-        total = float(response["ResultsByTime"][0]["Total"]["UnblendedCost"]["Amount"])
+        totals = service_cost_store.totals_by_group(start_of_month, end_date)
+        results = [
+            {"service": service, "amount": amount, "unit": service_cost_store.unit}
+            for service, amount in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        ]
+        total = sum(totals.values())
 
         return {"start_date": format_date(start_of_month), "end_date": format_date(today), "total_cost": total, "services": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get current month cost: {e}")
 
+async def _account_month_to_date(account, start, end, refresh):
+    """單一帳號本月依服務的成本（MONTHLY granularity，逐頁取得）"""
+    totals = {}
+    unit = "USD"
+    token = None
+    while True:
+        params = {
+            "TimePeriod": {"Start": format_date(start), "End": format_date(end)},
+            "Granularity": "MONTHLY",
+            "Metrics": ["UnblendedCost"],
+            "GroupBy": [{"Type": "DIMENSION", "Key": "SERVICE"}],
+        }
+        if token:
+            params["NextPageToken"] = token
+        response = await query_cost_and_usage(refresh=refresh, account=account, **params)
+        for result in response.get("ResultsByTime", []):
+            for group in result.get("Groups", []):
+                metric = group["Metrics"]["UnblendedCost"]
+                totals[group["Keys"][0]] = totals.get(group["Keys"][0], 0.0) + float(metric["Amount"])
+                unit = metric.get("Unit", unit)
+        token = response.get("NextPageToken")
+        if not token:
+            return totals, unit
+
+@router.get("/accounts/current-month-cost")
+async def get_accounts_current_month_cost(
+    account: Optional[List[str]] = Query(None, description="帳號名稱（AWS_ACCOUNT_ROLES），可重複指定；省略代表全部"),
+    top: int = Query(5, ge=1, le=50, description="每個帳號列出成本最高的幾個服務"),
+    timeout: Optional[float] = Query(None, gt=0, le=120, description="每個帳號的逾時秒數"),
+    refresh: bool = REFRESH_QUERY,
+):
+    """
+    同時查詢多個帳號本月（月初到今天）的成本；
+    逾時或失敗的帳號列在 targets 中，其他帳號照常回傳（partial = true）
+    """
+    # Cost Explorer 只有 us-east-1 一個 endpoint，只需要驗證帳號
+    targets = [(account_name, COST_EXPLORER_REGION) for account_name in resolve_accounts(account)]
+    today = datetime.utcnow().date()
+    start_of_month = today.replace(day=1)
+    end_date = today + timedelta(days=1)
+
+    results, report = await fan_out(
+        targets, lambda account_name, _: _account_month_to_date(account_name, start_of_month, end_date, refresh), timeout
+    )
+    accounts = []
+    for (account_name, _), (totals, unit) in results.items():
+        ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        accounts.append({
+            "account": account_name,
+            "total_cost": round(sum(totals.values()), 4),
+            "unit": unit,
+            "top_services": [{"service": service, "amount": round(amount, 4)} for service, amount in ranked[:top]],
+        })
+    accounts.sort(key=lambda item: item["total_cost"], reverse=True)
+    return {
+        "start_date": format_date(start_of_month),
+        "end_date": format_date(today),
+        "total_cost": round(sum(item["total_cost"] for item in accounts), 4),
+        "accounts": accounts,
+        "targets": [{k: v for k, v in entry.items() if k != "region"} for entry in report],
+        "partial": len(results) < len(targets),
+    }
+
 @router.get("/months-trend")
-async def get_months_trend(months: Optional[int] = Query(1, ge=1, le=12, description="查詢過去幾個月的成本趨勢，預設1個月")):
+async def get_months_trend(
+    months: Optional[int] = Query(1, ge=1, le=12, description="查詢過去幾個月的成本趨勢，預設1個月"),
+    refresh: bool = REFRESH_QUERY,
+):
     """
     取得過去 N 個月依月份的成本趨勢
     """
     try:
         today = datetime.utcnow().date()
         first_day_this_month = today.replace(day=1)
-
-        # 計算起始月份 (N個月前第一天)
-        year = first_day_this_month.year
-        month = first_day_this_month.month - months
-        while month <= 0:
-            month += 12
-            year -= 1
-        start_date = datetime(year, month, 1).date()
-
+        start_date = add_months(first_day_this_month, -months)  # N個月前第一天
         end_date = first_day_this_month
 
-        response = cost_explorer_client.get_cost_and_usage(
-            TimePeriod={"Start": format_date(start_date), "End": format_date(end_date)},
-            Granularity="MONTHLY",
-            Metrics=["UnblendedCost"],
-        )
-
-        trend = []
-        for result in response["ResultsByTime"]:
-            trend.append({
-                "start": result["TimePeriod"]["Start"],
-                "end": result["TimePeriod"]["End"],
-                "amount": float(result["Total"]["UnblendedCost"]["Amount"])
-            })
+        await service_cost_store.ensure(start_date, end_date, today, refresh=refresh)
 
+        trend = [
+            {"start": format_date(start), "end": format_date(end), "amount": amount}
+            for start, end, amount in service_cost_store.monthly_totals(start_date, end_date)
+        ]
         return {"trend": trend}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get months trend: {e}")
 
 @router.get("/cost-by-tag")
-async def get_cost_by_tag(tag_key: str = Query(..., description="查詢特定標籤鍵的成本")):
+async def get_cost_by_tag(
+    tag_key: str = Query(..., description="查詢特定標籤鍵的成本"),
+    refresh: bool = REFRESH_QUERY,
+):
     """
     依標籤 Key 查詢成本分佈
     """
@@ -112,67 +244,300 @@ async def get_cost_by_tag(tag_key: str = Query(..., description="查詢特定標
         start_of_month = today.replace(day=1)
         end_date = today + timedelta(days=1)
 
-        response = cost_explorer_client.get_cost_and_usage(
-            TimePeriod={"Start": format_date(start_of_month), "End": format_date(end_date)},
-            Granularity="MONTHLY",
-            Metrics=["UnblendedCost"],
-            GroupBy=[{"Type": "TAG", "Key": f"user:{tag_key}"}],
-        )
-
-        results = []
-        for group in response["ResultsByTime"][0]["Groups"]:
-            tag_value = group["Keys"][0]
-            amount = group["Metrics"]["UnblendedCost"]["Amount"]
-            unit = group["Metrics"]["UnblendedCost"]["Unit"]
-            results.append({"tag_value": tag_value, "amount": float(amount), "unit": unit})
+        store = get_tag_cost_store(f"user:{tag_key}")
+        await store.ensure(start_of_month, end_date, today, refresh=refresh)
 
-        total = float(response["ResultsByTime"][0]["Total"]["UnblendedCost"]["Amount"])
+        totals = store.totals_by_group(start_of_month, end_date)
+        results = [
+            {"tag_value": tag_value, "amount": amount, "unit": store.unit}
+            for tag_value, amount in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        ]
+        total = sum(totals.values())
 
         return {"tag_key": tag_key, "total_cost": total, "breakdown": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get cost by tag: {e}")
 
+def _history_window(matrix, today, history_days):
+    """不含今天（成本尚未完整）的最近 history_days 天"""
+    return matrix.window(today - timedelta(days=history_days), today)
+
 @router.get("/cost-forecast")
-async def cost_forecast(days: Optional[int] = Query(7, ge=1, le=30, description="預估未來幾天成本")):
+async def cost_forecast(
+    days: Optional[int] = Query(7, ge=1, le=30, description="預估未來幾天成本"),
+    history_days: int = Query(90, ge=7, le=365, description="用來擬合的歷史天數（不含今天）"),
+    refresh: bool = REFRESH_QUERY,
+):
     """
-    簡單的成本預估(未來幾天)：
-    用當月平均日成本乘以天數推估。
+    成本預估(未來幾天)：
+    以過去 history_days 天各服務的每日成本擬合線性趨勢與星期幾效果，預測後加總；
+    另外估計本月月底的總成本（本月已結束的天數 + 剩餘天數的預測）。
     """
     try:
         today = datetime.utcnow().date()
-        start_of_month = today.replace(day=1)
-        days_passed = (today - start_of_month).days + 1
-
-        response = cost_explorer_client.get_cost_and_usage(
-            TimePeriod={"Start": format_date(start_of_month), "End": format_date(today + timedelta(days=1))},
-            Granularity="DAILY",
-            Metrics=["UnblendedCost"],
-        )
+        matrix = await service_analytics.load(today, refresh=refresh)
+        history = _history_window(matrix, today, history_days)
 
-        daily_costs = [float(result["Total"]["UnblendedCost"]["Amount"]) for result in response["ResultsByTime"]]
-
-        avg_daily_cost = sum(daily_costs) / days_passed if days_passed > 0 else 0
-        forecast_cost = avg_daily_cost * days
+        next_month = add_months(today, 1)
+        remaining_days = (next_month - today).days
+        predicted, sigma = forecast(history, max(days, remaining_days))
+        daily_total = predicted.sum(axis=0)
+        forecast_cost = float(daily_total[:days].sum())
+        month_to_date = float(matrix.window(today.replace(day=1), today).values.sum())
 
+        top = np.argsort(-predicted[:, :days].sum(axis=1))[:10]
         return {
-            "avg_daily_cost": round(avg_daily_cost, 4),
+            "method": "linear trend + day-of-week",
+            "history_days": history.days,
+            "avg_daily_cost": round(forecast_cost / days, 4),
             "forecast_days": days,
             "forecast_cost": round(forecast_cost, 4),
+            "daily": [
+                {
+                    "date": format_date(today + timedelta(days=i)),
+                    "amount": round(float(amount), 4),
+                    "lower": round(max(float(amount) - 1.96 * sigma, 0.0), 4),
+                    "upper": round(float(amount) + 1.96 * sigma, 4),
+                }
+                for i, amount in enumerate(daily_total[:days])
+            ],
+            "month_end_estimate": round(month_to_date + float(daily_total[:remaining_days].sum()), 4),
+            "top_services": [
+                {"service": history.groups[i], "forecast_cost": round(float(predicted[i, :days].sum()), 4)}
+                for i in top if predicted[i, :days].sum() > 0
+            ],
+            "unit": service_cost_store.unit,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to forecast cost: {e}")
 
+@router.get("/analytics/anomalies")
+async def get_cost_anomalies(
+    days: int = Query(30, ge=1, le=365, description="檢查最近幾天的成本"),
+    window: int = Query(28, ge=7, le=90, description="計算基準（平均與標準差）的天數"),
+    threshold: float = Query(3.0, gt=0, description="z-score 絕對值超過多少視為異常"),
+    min_delta: float = Query(1.0, ge=0, description="與基準差距至少多少金額才標記，過濾小額波動"),
+    limit: int = Query(100, ge=1, le=1000),
+    refresh: bool = REFRESH_QUERY,
+):
+    """
+    依服務的每日成本異常：每天與前 window 天比較的 z-score（不含今天）
+    """
+    try:
+        today = datetime.utcnow().date()
+        matrix = await service_analytics.load(today, refresh=refresh)
+        history = _history_window(matrix, today, days + window)
+        z, mean = rolling_zscores(history.values, window)
+
+        recent = slice(max(window, history.days - days), history.days)
+        z_recent, mean_recent, values_recent = z[:, recent], mean[:, recent], history.values[:, recent]
+        with np.errstate(invalid="ignore"):
+            flagged = (np.abs(z_recent) >= threshold) & (np.abs(values_recent - mean_recent) >= min_delta)
+        rows, cols = np.nonzero(flagged)
+        order = np.argsort(-np.abs(z_recent[rows, cols]))[:limit]
+        offset = recent.start
+        anomalies = [
+            {
+                "date": format_date(history.day(offset + cols[k])),
+                "service": history.groups[rows[k]],
+                "amount": round(float(values_recent[rows[k], cols[k]]), 4),
+                "expected": round(float(mean_recent[rows[k], cols[k]]), 4),
+                "zscore": round(float(z_recent[rows[k], cols[k]]), 2),
+                "direction": "spike" if z_recent[rows[k], cols[k]] > 0 else "drop",
+            }
+            for k in order
+        ]
+        return {
+            "days": days,
+            "window": window,
+            "threshold": threshold,
+            "total_anomalies": int(flagged.sum()),
+            "anomalies": anomalies,
+            "unit": service_cost_store.unit,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to detect cost anomalies: {e}")
+
+@router.get("/analytics/month-over-month")
+async def get_month_over_month(
+    top: int = Query(10, ge=1, le=100, description="列出變化最大的前幾個服務"),
+    refresh: bool = REFRESH_QUERY,
+):
+    """
+    最近 13 個月的每月成本與月對月變化；本月另外與上月同期（相同天數）比較
+    """
+    try:
+        today = datetime.utcnow().date()
+        matrix = await service_analytics.load(today, refresh=refresh)
+        months, sums = monthly_sums(matrix)
+        totals = sums.sum(axis=0)
+        total_pct = percent_change(totals[1:], totals[:-1])
+
+        month_rows = []
+        for i, month in enumerate(months):
+            month_rows.append({
+                "month": month.strftime("%Y-%m"),
+                "amount": round(float(totals[i]), 4),
+                "delta": round(float(totals[i] - totals[i - 1]), 4) if i else None,
+                "delta_pct": _round_or_none(total_pct[i - 1]) if i else None,
+                "partial": month == today.replace(day=1),
+            })
+
+        # 服務變化：最近兩個完整月份
+        services = []
+        if len(months) >= 3:
+            current, previous = sums[:, -2], sums[:, -3]
+            delta = current - previous
+            pct = percent_change(current, previous)
+            for i in np.argsort(-np.abs(delta))[:top]:
+                if delta[i] == 0:
+                    break
+                services.append({
+                    "service": matrix.groups[i],
+                    "month": months[-2].strftime("%Y-%m"),
+                    "amount": round(float(current[i]), 4),
+                    "previous_amount": round(float(previous[i]), 4),
+                    "delta": round(float(delta[i]), 4),
+                    "delta_pct": _round_or_none(pct[i]),
+                })
+
+        # 本月到昨天為止 vs 上月同期
+        month_begin = today.replace(day=1)
+        elapsed = (today - month_begin).days
+        previous_begin = add_months(month_begin, -1)
+        current_mtd = float(matrix.window(month_begin, today).values.sum())
+        previous_mtd = float(matrix.window(
+            previous_begin, min(previous_begin + timedelta(days=elapsed), month_begin)
+        ).values.sum())
+        return {
+            "months": month_rows,
+            "services": services,
+            "month_to_date": {
+                "days": elapsed,
+                "amount": round(current_mtd, 4),
+                "previous_amount": round(previous_mtd, 4),
+                "delta": round(current_mtd - previous_mtd, 4),
+                "delta_pct": _round_or_none(percent_change(np.array(current_mtd), np.array(previous_mtd))),
+            },
+            "unit": service_cost_store.unit,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to compute month-over-month cost: {e}")
+
+def _round_or_none(value, digits=2):
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+@router.get("/cache/stats")
+async def get_cost_cache_stats():
+    """
+    Cost Explorer 查詢快取的命中 / 未命中 / 合併次數
+    """
+    return {
+        "ttl_seconds": COST_CACHE_TTL,
+        **cost_cache.stats(),
+        "service_store": service_cost_store.stats(),
+        "tag_stores": {key: store.stats() for key, store in tag_cost_stores.items()},
+    }
+
+@router.post("/cache/invalidate")
+async def invalidate_cost_cache():
+    """
+    清空 Cost Explorer 查詢快取與每日成本資料（含持久化快取），下次查詢會重新呼叫 API
+    """
+    cost_cache.invalidate()
+    if persistent_cache is not None:
+        await persistent_cache.call(persistent_cache.delete_prefix, COST_PERSIST_PREFIX)
+    service_cost_store.clear()
+    tag_cost_stores.clear()
+    return {"message": "Cost cache cleared"}
+
+# 各服務常見的節費方向，依實際成本佔比挑選
+SERVICE_SAVING_TIPS = {
+    "Amazon Elastic Compute Cloud - Compute": "評估 Savings Plans 或 Reserved Instances，並依 CPU 使用率調整過度配置的 EC2 實例。",
+    "EC2 - Other": "檢查未掛載的 EBS 卷、過舊的快照、未使用的 Elastic IP 與 NAT Gateway 流量。",
+    "Amazon Simple Storage Service": "審查 S3 存儲類型，以 Lifecycle 規則把冷資料轉到 Infrequent Access 或 Glacier。",
+    "Amazon Relational Database Service": "評估 RDS Reserved Instances，非上班時間停止開發用資料庫。",
+    "Amazon Elastic Container Service": "調整 task 的 CPU / 記憶體設定，評估 Fargate Spot。",
+    "AWS Lambda": "依實際用量調整 Lambda 記憶體設定，評估改用 Graviton（arm64）。",
+    "AWS App Runner": "調整 App Runner 的最小 instance 數與 auto scaling 設定。",
+    "Amazon Bedrock": "評估較小的模型、batch inference 或 provisioned throughput，並限制 prompt 長度。",
+    "Amazon CloudWatch": "設定 Log Group 保留天數，減少高解析度或不再使用的自訂 metrics。",
+    "Elastic Load Balancing": "合併或刪除沒有流量的 Load Balancer。",
+    "Amazon DynamoDB": "依流量模式比較 on-demand 與 provisioned capacity，並清除不需要的 GSI。",
+    "Amazon Virtual Private Cloud": "以 VPC Endpoint 取代經過 NAT Gateway 的 AWS 服務流量。",
+}
+
+GENERIC_SAVING_TIPS = [
+    "檢查並關閉未使用的 EC2 實例。",
+    "使用 Reserved Instances 或 Savings Plans 降低長期成本。",
+    "刪除未使用的 Elastic IP 和 EBS 卷。",
+    "利用自動化工具調整過度配置的資源。",
+    "定期審查 S3 存儲類型，選擇成本更低的選項。",
+]
+
 @router.get("/saving-tips")
-async def saving_tips():
+async def saving_tips(
+    days: int = Query(30, ge=7, le=90, description="依最近幾天的成本產生建議"),
+    refresh: bool = REFRESH_QUERY,
+):
     """
-    節約建議示範 (實際建議可更複雜，例如根據使用狀況)
+    依實際成本產生節約建議：成本佔比高的服務、與前一段期間相比成長快的服務，以及最近一週的成本異常。
+    沒有成本資料，或 Cost Explorer 無法使用（throttle、權限不足、逾時）時回傳一般性建議，並以 error 說明原因。
     """
-    tips = [
-        "檢查並關閉未使用的 EC2 實例。",
-        "使用 Reserved Instances 或 Savings Plans 降低長期成本。",
-        "刪除未使用的 Elastic IP 和 EBS 卷。",
-        "利用自動化工具調整過度配置的資源。",
-        "定期審查 S3 存儲類型，選擇成本更低的選項。",
-    ]
-    return {"saving_tips": tips}
+    try:
+        today = datetime.utcnow().date()
+        try:
+            matrix = await service_analytics.load(today, refresh=refresh)
+        except (ClientError, BotoCoreError, asyncio.TimeoutError) as e:
+            return {
+                "saving_tips": GENERIC_SAVING_TIPS, "details": [], "data_driven": False,
+                "error": f"Cost data unavailable: {str(e) or type(e).__name__}",
+            }
+        history = _history_window(matrix, today, days * 2)
+        recent = history.values[:, -days:].sum(axis=1)
+        previous = history.values[:, :-days].sum(axis=1) if history.days > days else np.zeros_like(recent)
+        total = float(recent.sum())
 
+        details = []
+        if total > 0:
+            share = recent / total
+            for i in np.argsort(-recent)[:5]:
+                service = history.groups[i]
+                if share[i] < 0.1 or service not in SERVICE_SAVING_TIPS:
+                    continue
+                details.append({
+                    "kind": "top_cost", "service": service, "amount": round(float(recent[i]), 2),
+                    "share": round(float(share[i]), 4),
+                    "tip": f"{service} 佔最近 {days} 天成本的 {share[i]:.0%}：{SERVICE_SAVING_TIPS[service]}",
+                })
+
+            growth = percent_change(recent, previous)
+            with np.errstate(invalid="ignore"):
+                growing = np.nonzero((growth >= 20) & (recent - previous >= 10))[0]
+            for i in growing[np.argsort(-(recent - previous)[growing])][:5]:
+                details.append({
+                    "kind": "growth", "service": history.groups[i], "amount": round(float(recent[i]), 2),
+                    "previous_amount": round(float(previous[i]), 2),
+                    "tip": f"{history.groups[i]} 最近 {days} 天成本較前 {days} 天增加 {growth[i]:.0f}%"
+                           f"（+{recent[i] - previous[i]:.2f} {service_cost_store.unit}），確認是否有新增資源或異常用量。",
+                })
+
+            z, mean = rolling_zscores(history.values, min(28, max(history.days - 7, 1)))
+            with np.errstate(invalid="ignore"):
+                spikes = (z[:, -7:] >= 3) & (history.values[:, -7:] - mean[:, -7:] >= 1)
+            for i, j in zip(*np.nonzero(spikes)):
+                day = history.day(history.days - 7 + j)
+                details.append({
+                    "kind": "anomaly", "service": history.groups[i], "date": format_date(day),
+                    "amount": round(float(history.values[i, history.days - 7 + j]), 2),
+                    "tip": f"{history.groups[i]} 在 {format_date(day)} 的成本 "
+                           f"{history.values[i, history.days - 7 + j]:.2f} 明顯高於平常（約 {mean[i, history.days - 7 + j]:.2f}），"
+                           f"請確認原因。",
+                })
+
+        if not details:
+            return {"saving_tips": GENERIC_SAVING_TIPS, "details": [], "data_driven": False}
+        return {"saving_tips": [d["tip"] for d in details], "details": details, "data_driven": True}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build saving tips: {e}")
@@ -0,0 +1,164 @@
+"""
+向量化的成本分析（NumPy）
+
+把 DailyCostStore 的每日成本轉成「群組（例如服務）x 天」的矩陣，所有群組一次計算：
+- forecast：線性趨勢 + 星期幾效果，以最小平方法一次擬合所有群組；
+- rolling_zscores：每個群組相對於前 N 天的 z-score，用來標記異常；
+- monthly_sums：依月份加總，計算月對月變化。
+
+矩陣依 store.version 快取，資料沒變動時不會重建；數百個服務、一年的資料，
+各項計算都在數毫秒內完成。
+"""
+
+from datetime import timedelta
+from typing import NamedTuple
+
+import numpy as np
+
+from cost_store import add_months, month_start
+
+# 歷史資料少於這個天數時不估計星期幾效果，只用趨勢
+MIN_SEASONAL_DAYS = 14
+
+
+class CostMatrix(NamedTuple):
+    """values[i, j]：groups[i] 在 start + j 天的成本"""
+    start: object
+    groups: list
+    values: np.ndarray
+
+    @property
+    def days(self):
+        return self.values.shape[1]
+
+    def day(self, index):
+        return self.start + timedelta(days=int(index))
+
+    def index(self, day):
+        return (day - self.start).days
+
+    def window(self, start, end):
+        """取出 [start, end) 的子矩陣（超出範圍的部分截掉）"""
+        lo = max(0, self.index(start))
+        hi = min(self.days, self.index(end))
+        return CostMatrix(self.day(lo), self.groups, self.values[:, lo:max(lo, hi)])
+
+
+def _design(first_weekday, count, offset, columns):
+    """截距、線性趨勢，以及星期二到星期日相對於星期一的效果"""
+    t = np.arange(offset, offset + count, dtype=float)
+    design = np.empty((count, 8))
+    design[:, 0] = 1.0
+    design[:, 1] = t
+    weekday = (first_weekday + np.arange(offset, offset + count)) % 7
+    design[:, 2:] = weekday[:, None] == np.arange(1, 7)[None, :]
+    return design[:, :columns]
+
+
+def forecast(matrix, horizon):
+    """
+    以線性趨勢 + 星期幾效果擬合每個群組，預測之後 horizon 天的成本。
+
+    回傳 (預測 [群組, horizon]（負值截為 0）, 總成本擬合殘差的標準差)。
+    歷史只有 1 天時只用平均值，少於 MIN_SEASONAL_DAYS 天時不估計星期幾效果。
+    """
+    values = matrix.values
+    n_groups, n_days = values.shape
+    if n_days == 0 or n_groups == 0:
+        return np.zeros((n_groups, horizon)), 0.0
+    columns = 1 if n_days < 2 else (2 if n_days < MIN_SEASONAL_DAYS else 8)
+    first_weekday = matrix.start.weekday()
+    design = _design(first_weekday, n_days, 0, columns)
+    coef, *_ = np.linalg.lstsq(design, values.T, rcond=None)
+    predicted = _design(first_weekday, horizon, n_days, columns) @ coef
+
+    residual = values.sum(axis=0) - (design @ coef).sum(axis=1)
+    dof = max(n_days - columns, 1)
+    sigma = float(np.sqrt(np.square(residual).sum() / dof))
+    return np.clip(predicted.T, 0.0, None), sigma
+
+
+def rolling_zscores(values, window, min_std_ratio=0.05):
+    """
+    每個群組每天相對於前 window 天（不含當天）的平均與 z-score。
+
+    回傳 (z, mean)，形狀與 values 相同；前 window 天沒有足夠歷史，為 nan。
+    標準差下限為平均值的 min_std_ratio 倍，避免幾乎不變的成本因微小波動被放大。
+    """
+    n_groups, n_days = values.shape
+    z = np.full(values.shape, np.nan)
+    mean = np.full(values.shape, np.nan)
+    if n_days <= window:
+        return z, mean
+    sums = np.zeros((n_groups, n_days + 1))
+    squares = np.zeros((n_groups, n_days + 1))
+    np.cumsum(values, axis=1, out=sums[:, 1:])
+    np.cumsum(values * values, axis=1, out=squares[:, 1:])
+    count = n_days - window
+    window_mean = (sums[:, window:window + count] - sums[:, :count]) / window
+    window_var = (squares[:, window:window + count] - squares[:, :count]) / window - window_mean * window_mean
+    std = np.sqrt(np.maximum(window_var, 0.0))
+    np.maximum(std, min_std_ratio * np.abs(window_mean) + 1e-9, out=std)
+    mean[:, window:] = window_mean
+    z[:, window:] = (values[:, window:] - window_mean) / std
+    return z, mean
+
+
+def month_boundaries(matrix):
+    """回傳 (各月份月初, 各月份在矩陣中的起始欄位)"""
+    months = []
+    month = month_start(matrix.start)
+    end = matrix.day(matrix.days)
+    while month < end:
+        months.append(month)
+        month = add_months(month, 1)
+    starts = [max(0, matrix.index(m)) for m in months]
+    return months, np.array(starts, dtype=int)
+
+
+def monthly_sums(matrix):
+    """回傳 (各月份月初, 每個群組每月的成本 [群組, 月份])"""
+    months, starts = month_boundaries(matrix)
+    if not months:
+        return months, np.zeros((len(matrix.groups), 0))
+    return months, np.add.reduceat(matrix.values, starts, axis=1)
+
+
+def percent_change(current, previous):
+    """向量化的變化百分比；前期為 0 時為 nan"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(previous > 0, (current - previous) / previous * 100, np.nan)
+
+
+class CostAnalytics:
+    """以 DailyCostStore 為資料來源，快取轉換後的成本矩陣"""
+
+    def __init__(self, store, history_months=13):
+        self.store = store
+        self.history_months = history_months
+        self._cache_key = None
+        self._matrix = None
+
+    def history_start(self, today):
+        return add_months(month_start(today), -(self.history_months - 1))
+
+    async def load(self, today, refresh=False):
+        """確保歷史資料已載入，回傳從 history_start 到今天（含）的矩陣"""
+        start = self.history_start(today)
+        end = today + timedelta(days=1)
+        await self.store.ensure(start, end, today, refresh=refresh)
+        return self.matrix(start, end)
+
+    def matrix(self, start, end):
+        key = (start, end, self.store.version)
+        if key == self._cache_key:
+            return self._matrix
+        rows = list(self.store.iter_days(start, end))
+        groups = sorted({group for _, amounts in rows for group in amounts})
+        index = {group: i for i, group in enumerate(groups)}
+        values = np.zeros((len(groups), len(rows)))
+        for j, (_, amounts) in enumerate(rows):
+            if amounts:
+                values[[index[g] for g in amounts], j] = list(amounts.values())
+        self._cache_key, self._matrix = key, CostMatrix(start, groups, values)
+        return self._matrix
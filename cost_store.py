@@ -0,0 +1,210 @@
+"""
+增量式的每日成本資料集
+
+以「日期 x 群組（例如 SERVICE）」保存 Cost Explorer 的每日成本，
+只會向上游查詢缺少的日期，或是仍可能被 AWS 修正的近幾天（open days）。
+各 billing 端點都從這份資料在記憶體內彙總，不再各自呼叫 Cost Explorer。
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+METRIC = "UnblendedCost"
+# 持久化快取中每日成本資料的格式版本
+PERSIST_VERSION = 1
+PERSIST_PREFIX = "cost_rows:"
+# 已結束的日期成本不再變動，持久化保存到超出 13 個月的查詢範圍為止
+PERSIST_CLOSED_TTL = 400 * 86400
+
+
+def _parse_date(value):
+    return date.fromisoformat(value)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    """回傳 day 所在月份往前 / 往後 months 個月的第一天"""
+    index = day.year * 12 + (day.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class DailyCostStore:
+    """
+    fetch_page：async callable，參數為 Cost Explorer 的 get_cost_and_usage 參數，
+    外加 refresh 旗標，回傳 API response。
+
+    persistent：選用的 PersistentCache，每日資料會寫入磁碟供其他 worker 與重啟後使用，
+    並以 lease 確保同時只有一個 worker 向 Cost Explorer 查詢同一份資料。
+    """
+
+    def __init__(self, fetch_page, group_by, open_days=3, open_ttl=3 * 3600, prefetch_days=0, clock=time.time,
+                 persistent=None):
+        self._fetch_page = fetch_page
+        self.group_by = group_by
+        self.open_days = open_days
+        self.open_ttl = open_ttl
+        self.prefetch_days = prefetch_days
+        self._clock = clock
+        self._rows = {}  # date -> {group key: amount}
+        self._fetched_at = {}  # date -> epoch seconds
+        self.unit = "USD"
+        self.upstream_calls = 0
+        # 每次資料變動就遞增，供衍生資料（例如分析用的矩陣）判斷是否需要重建
+        self.version = 0
+        self._lock = None
+        self.persistent = persistent
+        self.persist_namespace = PERSIST_PREFIX + ",".join(f"{g['Type']}={g['Key']}" for g in group_by)
+        self.persisted_loads = 0
+
+    def _is_stale(self, day, today, now):
+        fetched_at = self._fetched_at.get(day)
+        if fetched_at is None:
+            return True
+        # 近幾天的成本仍可能變動，超過 open_ttl 就重新查詢
+        return day > today - timedelta(days=self.open_days) and now - fetched_at > self.open_ttl
+
+    def missing_days(self, start, end, today, refresh=False):
+        now = self._clock()
+        days = []
+        day = start
+        while day < end:
+            if refresh or self._is_stale(day, today, now):
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    async def ensure(self, start, end, today, refresh=False):
+        """確保 [start, end) 的每日資料都已載入，必要時以一次查詢補齊"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            missing = self.missing_days(start, end, today, refresh)
+            if not missing:
+                return
+            if self.persistent is None:
+                await self._load(*self._fetch_range(missing, today), refresh)
+                return
+
+            if not refresh:
+                # 其他 worker 或重啟前已查詢過的資料直接從磁碟讀取
+                await self._load_persisted(missing[0], missing[-1] + timedelta(days=1))
+                missing = self.missing_days(start, end, today)
+                if not missing:
+                    return
+            async with self.persistent.lease(self.persist_namespace, ttl=120):
+                if not refresh:
+                    # 等待 lease 期間，持有者可能已經寫入需要的資料
+                    await self._load_persisted(missing[0], missing[-1] + timedelta(days=1))
+                    missing = self.missing_days(start, end, today)
+                    if not missing:
+                        return
+                fetch_start, fetch_end = self._fetch_range(missing, today)
+                await self._load(fetch_start, fetch_end, refresh)
+                await self._save_persisted(fetch_start, fetch_end, today)
+
+    def _fetch_range(self, missing, today):
+        fetch_start = missing[0]
+        if self.prefetch_days and not self._rows:
+            # 第一次載入時一併預取常用區間，之後的端點就不需要再查詢
+            fetch_start = min(fetch_start, today - timedelta(days=self.prefetch_days))
+        return fetch_start, missing[-1] + timedelta(days=1)
+
+    async def _load_persisted(self, start, end):
+        rows = await self.persistent.call(
+            self.persistent.get_range, self.persist_namespace, start.isoformat(), end.isoformat(), PERSIST_VERSION
+        )
+        for key, (groups, unit), stored_at in rows:
+            day = _parse_date(key)
+            if stored_at > self._fetched_at.get(day, 0):
+                self._rows[day] = groups
+                self._fetched_at[day] = stored_at
+                self.unit = unit
+        if rows:
+            self.persisted_loads += 1
+            self.version += 1
+
+    async def _save_persisted(self, start, end, today):
+        items = []
+        for day, groups in self.iter_days(start, end):
+            ttl = self.open_ttl if day > today - timedelta(days=self.open_days) else PERSIST_CLOSED_TTL
+            items.append((day.isoformat(), (groups, self.unit), ttl))
+        await self.persistent.call(self.persistent.put_many, self.persist_namespace, items, PERSIST_VERSION)
+
+    async def _load(self, start, end, refresh):
+        params = {
+            "TimePeriod": {"Start": start.isoformat(), "End": end.isoformat()},
+            "Granularity": "DAILY",
+            "Metrics": [METRIC],
+            "GroupBy": self.group_by,
+        }
+        loaded = {}
+        token = None
+        while True:
+            page_params = dict(params, NextPageToken=token) if token else params
+            response = await self._fetch_page(refresh=refresh, **page_params)
+            self.upstream_calls += 1
+            for result in response["ResultsByTime"]:
+                day = _parse_date(result["TimePeriod"]["Start"])
+                groups = loaded.setdefault(day, {})
+                for group in result.get("Groups", []):
+                    metric = group["Metrics"][METRIC]
+                    groups[group["Keys"][0]] = groups.get(group["Keys"][0], 0.0) + float(metric["Amount"])
+                    self.unit = metric.get("Unit", self.unit)
+            token = response.get("NextPageToken")
+            if not token:
+                break
+
+        now = self._clock()
+        day = start
+        while day < end:
+            self._rows[day] = loaded.get(day, {})
+            self._fetched_at[day] = now
+            day += timedelta(days=1)
+        self.version += 1
+
+    def iter_days(self, start, end):
+        """依序產生 [start, end) 每天的 (日期, {群組: 金額})，未載入的日期為空 dict"""
+        day = start
+        while day < end:
+            yield day, self._rows.get(day, {})
+            day += timedelta(days=1)
+
+    def daily_totals(self, start, end):
+        return [(day, sum(groups.values())) for day, groups in self.iter_days(start, end)]
+
+    def totals_by_group(self, start, end):
+        totals = defaultdict(float)
+        for _, groups in self.iter_days(start, end):
+            for key, amount in groups.items():
+                totals[key] += amount
+        return dict(totals)
+
+    def monthly_totals(self, start, end):
+        """回傳 [(月初, 下月初, 金額)]，start 需為月初"""
+        months = []
+        month = month_start(start)
+        while month < end:
+            next_month = add_months(month, 1)
+            total = sum(amount for _, amount in self.daily_totals(month, min(next_month, end)))
+            months.append((month, next_month, total))
+            month = next_month
+        return months
+
+    def clear(self):
+        self._rows.clear()
+        self._fetched_at.clear()
+        self.version += 1
+
+    def stats(self):
+        return {
+            "days_loaded": len(self._rows),
+            "first_day": min(self._rows).isoformat() if self._rows else None,
+            "last_day": max(self._rows).isoformat() if self._rows else None,
+            "upstream_calls": self.upstream_calls,
+            "persisted_loads": self.persisted_loads,
+        }
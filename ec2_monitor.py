@@ -1,107 +1,590 @@
 from fastapi import APIRouter, HTTPException, Query
-from aws_clients import ec2_client, cloudwatch_client
-from datetime import datetime, timedelta
+from fastapi.responses import StreamingResponse
+from botocore.exceptions import ClientError
+from botocore.paginate import TokenEncoder
+from aws_clients import ec2_client
+from aws_executor import iter_pages, run_aws
+from aws_fanout import fan_out, pool_client, resolve_targets, scope
+from inventory_snapshot import snapshot
+from metrics_engine import metrics_engine
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+import asyncio
+import json
+import re
+import time
 
 router = APIRouter()
 
+# describe_instance_status 每次最多可指定 100 個 instance ID
+STATUS_IDS_PER_CALL = 100
+# 整批 ID 中有不存在或格式錯誤的 ID 時，describe_instance_status 以這些錯誤拒絕整批
+INVALID_INSTANCE_ID_ERRORS = {"InvalidInstanceID.NotFound", "InvalidInstanceID.Malformed"}
+
+MAX_STALENESS_QUERY = Query(
+    None, ge=0, description="可接受的快照資料秒數；快照夠新時直接由記憶體回應，不呼叫 AWS"
+)
+
+# fleet 端點可查詢的 EC2 metrics 與對應的統計方式
+FLEET_METRICS = {
+    "CPUUtilization": "Average",
+    "NetworkIn": "Sum",
+    "NetworkOut": "Sum",
+    "DiskReadBytes": "Sum",
+    "DiskWriteBytes": "Sum",
+    "DiskReadOps": "Sum",
+    "DiskWriteOps": "Sum",
+}
+
+def _format_instance(instance):
+    return {
+        "InstanceId": instance["InstanceId"],
+        "InstanceType": instance.get("InstanceType"),
+        "State": instance["State"]["Name"],
+        "LaunchTime": instance["LaunchTime"].isoformat(),
+        "PublicIpAddress": instance.get("PublicIpAddress"),
+        "PrivateIpAddress": instance.get("PrivateIpAddress"),
+        "VpcId": instance.get("VpcId"),
+        "Tags": instance.get("Tags", []),
+    }
+
+def _parse_tag_filter(tag):
+    key, sep, value = tag.partition("=")
+    if not sep or not key:
+        raise HTTPException(status_code=400, detail="tag must be in key=value format")
+    return key, value
+
+def _build_instance_filters(states=None, instance_types=None, tags=None, vpc_ids=None):
+    """將查詢條件轉成 describe_instances 的 Filters，交給 AWS 端過濾"""
+    filters = []
+    if states:
+        filters.append({"Name": "instance-state-name", "Values": states})
+    if instance_types:
+        filters.append({"Name": "instance-type", "Values": instance_types})
+    if vpc_ids:
+        filters.append({"Name": "vpc-id", "Values": vpc_ids})
+    values_by_key = {}
+    for tag in tags or []:
+        key, value = _parse_tag_filter(tag)
+        values_by_key.setdefault(key, []).append(value)
+    for key, values in values_by_key.items():
+        filters.append({"Name": f"tag:{key}", "Values": values})
+    return filters
+
+def _paginate_instances(filters, page_size=None, cursor=None, client=ec2_client):
+    config = {}
+    if page_size:
+        config["PageSize"] = page_size
+    if cursor:
+        config["StartingToken"] = cursor
+    paginator = client.get_paginator("describe_instances")
+    return paginator.paginate(Filters=filters, PaginationConfig=config)
+
+_cursor_encoder = TokenEncoder()
+
+def _encode_cursor(page):
+    """把 AWS 的 NextToken 包成 paginator 可接受的 StartingToken"""
+    token = page.get("NextToken")
+    return _cursor_encoder.encode({"NextToken": token}) if token else None
+
+async def _stream_instances(pages, first_page, limit=None):
+    """
+    NDJSON：每收到一頁就輸出該頁的 instances，記憶體用量不隨 instance 數量成長；
+    指定 limit 時與 JSON 模式相同只輸出一頁，最後一行為 {"next_cursor": ...}
+    """
+    page = first_page
+    try:
+        while page is not None:
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    yield json.dumps(_format_instance(instance)) + "\n"
+            if limit:
+                yield json.dumps({"next_cursor": _encode_cursor(page)}) + "\n"
+                return
+            page = await anext(pages, None)
+        if limit:
+            yield json.dumps({"next_cursor": None}) + "\n"
+    except Exception as e:
+        # 已經開始回應就無法改 status code，以最後一行回報錯誤
+        yield json.dumps({"error": f"Failed to list EC2 instances: {e}"}) + "\n"
+
+def _query_snapshot_instances(states, instance_types, tags, vpc_ids):
+    """以快照索引過濾 instances，不呼叫 AWS"""
+    tag_values = [_parse_tag_filter(tag) for tag in tags or []]
+    instances = snapshot.collection("ec2_instances").query(state=states, instance_type=instance_types)
+    if tag_values:
+        # 與 AWS Filters 相同：同一個 key 的多個值為 OR，不同 key 之間為 AND
+        values_by_key = {}
+        for key, value in tag_values:
+            values_by_key.setdefault(key, set()).add(value)
+        tagged = None
+        for key, values in values_by_key.items():
+            ids = snapshot.collection("ec2_instances").lookup("tag", [(key, value) for value in values])
+            tagged = ids if tagged is None else tagged & ids
+        instances = [instance for instance in instances if instance["InstanceId"] in tagged]
+    if vpc_ids:
+        instances = [instance for instance in instances if instance.get("VpcId") in vpc_ids]
+    return instances
+
+async def _fetch_instance_inventory(collection):
+    instances = {}
+    async for page in iter_pages("ec2", _paginate_instances([])):
+        for reservation in page["Reservations"]:
+            for instance in reservation["Instances"]:
+                instances[instance["InstanceId"]] = _format_instance(instance)
+    return instances
+
+def _invalid_instance_ids(error, chunk):
+    """
+    從 InvalidInstanceID.NotFound / Malformed 的錯誤訊息取出屬於這批的 IDs，例如
+    "The instance IDs 'i-1, i-2' do not exist" 或 'Invalid id: "i-xyz"'
+    """
+    words = set(re.findall(r"[^\s'\",]+", error.response.get("Error", {}).get("Message", "")))
+    return {instance_id for instance_id in chunk if instance_id in words}
+
+async def describe_statuses(instance_ids=None, client=ec2_client, service="ec2"):
+    """
+    批次取得 instance status（狀態檢查與排程事件在同一個回應內）。
+
+    未指定 instance_ids 時以分頁取得全部（每頁 1000 筆）；
+    指定時每次呼叫最多 100 個 ID（API 限制），各批同時送出。
+    client / service 用於其他帳號或 region（client_pool 的 client 與 run_aws 的 service 名稱）。
+    回傳 ({instance id: status}, 上游呼叫次數)。
+    """
+    statuses = {}
+    upstream_calls = 0
+    if instance_ids is None:
+        paginator = client.get_paginator("describe_instance_status")
+        pages = paginator.paginate(IncludeAllInstances=True, PaginationConfig={"PageSize": 1000})
+        async for page in iter_pages(service, pages):
+            upstream_calls += 1
+            for status in page.get("InstanceStatuses", []):
+                statuses[status["InstanceId"]] = status
+        return statuses, upstream_calls
+
+    async def describe_chunk(chunk):
+        """
+        回傳 (pages, 呼叫次數)。整批中只要有一個 ID 不存在或格式錯誤 AWS 就拒絕整批，
+        此時從錯誤訊息取出無效的 ID 後重試其餘 ID；訊息中找不到時把這批對半切開再試，
+        單一無效 ID 直接略過（呼叫端會列在 not_found）。
+        """
+        try:
+            pages = []
+            async for page in iter_pages(service, client.get_paginator("describe_instance_status").paginate(
+                InstanceIds=chunk, IncludeAllInstances=True
+            )):
+                pages.append(page)
+            return pages, len(pages)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in INVALID_INSTANCE_ID_ERRORS:
+                raise
+            invalid = _invalid_instance_ids(e, chunk)
+            calls = len(pages) + 1
+
+        if invalid:
+            parts = [[i for i in chunk if i not in invalid]]
+        elif len(chunk) > 1:
+            parts = [chunk[:len(chunk) // 2], chunk[len(chunk) // 2:]]
+        else:
+            return [], calls
+        pages = []
+        for part_pages, part_calls in await asyncio.gather(*[describe_chunk(part) for part in parts if part]):
+            pages.extend(part_pages)
+            calls += part_calls
+        return pages, calls
+
+    chunks = [instance_ids[i:i + STATUS_IDS_PER_CALL] for i in range(0, len(instance_ids), STATUS_IDS_PER_CALL)]
+    for pages, calls in await asyncio.gather(*[describe_chunk(chunk) for chunk in chunks]):
+        upstream_calls += calls
+        for page in pages:
+            for status in page.get("InstanceStatuses", []):
+                statuses[status["InstanceId"]] = status
+    return statuses, upstream_calls
+
+async def _fetch_status_inventory(collection):
+    statuses, _ = await describe_statuses()
+    return statuses
+
+snapshot.register(
+    "ec2_instances",
+    _fetch_instance_inventory,
+    indexes={
+        "state": lambda instance: [instance["State"]],
+        "instance_type": lambda instance: [instance["InstanceType"]],
+        "tag": lambda instance: [(tag["Key"], tag["Value"]) for tag in instance["Tags"]],
+    },
+)
+snapshot.register("ec2_status", _fetch_status_inventory)
+
 @router.get("/instances")
-async def list_ec2_instances():
+async def list_ec2_instances(
+    state: Optional[List[str]] = Query(None, description="依狀態過濾，例如 running、stopped"),
+    instance_type: Optional[List[str]] = Query(None, description="依 instance type 過濾"),
+    tag: Optional[List[str]] = Query(None, description="依標籤過濾，格式 key=value，可重複指定"),
+    vpc_id: Optional[List[str]] = Query(None, description="依 VPC 過濾"),
+    limit: Optional[int] = Query(None, ge=5, le=1000, description="每頁筆數；指定時只回傳一頁並附上 next_cursor"),
+    cursor: Optional[str] = Query(None, description="上一頁回傳的 next_cursor"),
+    stream: bool = Query(False, description="以 NDJSON 串流輸出，每頁一到就送出"),
+    max_staleness: Optional[float] = MAX_STALENESS_QUERY,
+):
     """取得所有 EC2 instances 清單"""
     try:
-        response = ec2_client.describe_instances()
+        filters = _build_instance_filters(state, instance_type, tag, vpc_id)
+        if not limit and not cursor and snapshot.fresh("ec2_instances", max_staleness):
+            instances = _query_snapshot_instances(state, instance_type, tag, vpc_id)
+            if stream:
+                return StreamingResponse(
+                    (json.dumps(instance) + "\n" for instance in instances), media_type="application/x-ndjson"
+                )
+            return {"instances": instances, "next_cursor": None}
+
+        pages = iter_pages("ec2", _paginate_instances(filters, page_size=limit or 1000, cursor=cursor))
+
+        if stream:
+            # 先取第一頁，上游錯誤仍可回傳正確的 status code
+            first_page = await anext(pages, None)
+            return StreamingResponse(
+                _stream_instances(pages, first_page, limit), media_type="application/x-ndjson"
+            )
+
         instances = []
-        for reservation in response["Reservations"]:
-            for instance in reservation["Instances"]:
-                instances.append({
-                    "InstanceId": instance["InstanceId"],
-                    "InstanceType": instance.get("InstanceType"),
-                    "State": instance["State"]["Name"],
-                    "LaunchTime": instance["LaunchTime"].isoformat(),
-                    "PublicIpAddress": instance.get("PublicIpAddress"),
-                    "PrivateIpAddress": instance.get("PrivateIpAddress"),
-                    "Tags": instance.get("Tags", []),
-                })
-        return {"instances": instances}
+        next_cursor = None
+        async for page in pages:
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    instances.append(_format_instance(instance))
+            if limit:
+                next_cursor = _encode_cursor(page)
+                break
+        return {"instances": instances, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list EC2 instances: {e}")
 
+@router.get("/fleet/instances")
+async def list_fleet_instances(
+    account: Optional[List[str]] = Query(None, description="帳號名稱（AWS_ACCOUNT_ROLES），可重複指定；省略代表全部"),
+    region: Optional[List[str]] = Query(None, description="region，可重複指定；省略代表 AWS_REGIONS"),
+    state: Optional[List[str]] = Query(None, description="依狀態過濾，例如 running、stopped"),
+    instance_type: Optional[List[str]] = Query(None, description="依 instance type 過濾"),
+    tag: Optional[List[str]] = Query(None, description="依標籤過濾，格式 key=value，可重複指定"),
+    timeout: Optional[float] = Query(None, gt=0, le=120, description="每個帳號 / region 的逾時秒數"),
+):
+    """
+    同時查詢多個帳號與 region 的 EC2 instances 並合併；
+    逾時或失敗的 region 列在 targets 中，其他 region 的結果照常回傳（partial = true）
+    """
+    targets = resolve_targets(account, region)
+    filters = _build_instance_filters(state, instance_type, tag)
+
+    async def fetch(account_name, region_name):
+        client = await pool_client("ec2", account_name, region_name)
+        instances = []
+        async for page in iter_pages(f"ec2@{scope(account_name, region_name)}", _paginate_instances(
+            filters, page_size=1000, client=client
+        )):
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    instances.append({**_format_instance(instance), "Account": account_name, "Region": region_name})
+        return instances
+
+    started = time.perf_counter()
+    results, report = await fan_out(targets, fetch, timeout)
+    for entry in report:
+        entry["instances"] = len(results.get((entry["account"], entry["region"]), []))
+    return {
+        "instances": [instance for target in targets for instance in results.get(target, [])],
+        "targets": report,
+        "partial": len(results) < len(targets),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
 @router.get("/cpu-utilization/{instance_id}")
 async def get_instance_cpu_utilization(
     instance_id: str,
-    hours: int = Query(1, ge=1, le=24, description="過去多少小時的平均 CPU 利用率，預設 1 小時")
+    hours: int = Query(1, ge=1, le=24, description="過去多少小時的平均 CPU 利用率，預設 1 小時"),
+    max_points: Optional[int] = Query(None, ge=1, le=1440, description="回傳的 datapoint 上限，超過時放大 period"),
 ):
-    """取得指定 EC2 instance 過去 N 小時 CPU 利用率平均值"""
+    """取得指定 EC2 instance 過去 N 小時 CPU 利用率（最新值、平均值與 time series）"""
     try:
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(hours=hours)
-
-        metrics = cloudwatch_client.get_metric_statistics(
-            Namespace="AWS/EC2",
-            MetricName="CPUUtilization",
-            Dimensions=[{"Name": "InstanceId", "Value": instance_id}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=300,  # 5分鐘一個 datapoint
-            Statistics=["Average"],
-            Unit="Percent",
+        end = time.time()
+        window = await metrics_engine.query(
+            [("AWS/EC2", "CPUUtilization", [("InstanceId", instance_id)], "Average", "Percent")],
+            end - hours * 3600,
+            end,
+            period=300,  # 5分鐘一個 datapoint
+            max_points=max_points,
         )
-
-        datapoints = metrics.get("Datapoints", [])
-        if not datapoints:
+        points = [(ts, v) for ts, v in zip(window.timestamps(), window.values[0]) if v is not None]
+        if not points:
             return {"instance_id": instance_id, "cpu_utilization_percent": None, "message": "No data found"}
 
-        latest = max(datapoints, key=lambda x: x["Timestamp"])
+        latest_ts, latest = points[-1]
         return {
             "instance_id": instance_id,
-            "cpu_utilization_percent": round(latest["Average"], 2),
-            "timestamp": latest["Timestamp"].isoformat(),
-            "period_hours": hours
+            "cpu_utilization_percent": round(latest, 2),
+            "timestamp": latest_ts,
+            "period_hours": hours,
+            "average_percent": round(sum(v for _, v in points) / len(points), 2),
+            "period": window.period,
+            "datapoints": [{"timestamp": ts, "value": round(v, 2)} for ts, v in points],
+            "upstream_calls": window.upstream_calls,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get CPU utilization: {e}")
 
+def _format_status_checks(instance_id, status):
+    return {
+        "instance_id": instance_id,
+        "system_status": status["SystemStatus"]["Status"],
+        "instance_status": status["InstanceStatus"]["Status"],
+        "details": status.get("SystemStatus", {}).get("Details", []) + status.get("InstanceStatus", {}).get("Details", [])
+    }
+
 @router.get("/status-checks/{instance_id}")
-async def get_instance_status_checks(instance_id: str):
+async def get_instance_status_checks(
+    instance_id: str,
+    max_staleness: Optional[float] = MAX_STALENESS_QUERY,
+):
     """取得 EC2 instance 狀態檢查結果 (System & Instance status checks)"""
     try:
-        response = ec2_client.describe_instance_status(InstanceIds=[instance_id], IncludeAllInstances=True)
-        statuses = response.get("InstanceStatuses", [])
-        if not statuses:
+        if snapshot.fresh("ec2_status", max_staleness):
+            status = snapshot.collection("ec2_status").items.get(instance_id)
+        else:
+            response = await run_aws("ec2", ec2_client.describe_instance_status, InstanceIds=[instance_id], IncludeAllInstances=True)
+            statuses = response.get("InstanceStatuses", [])
+            status = statuses[0] if statuses else None
+        if status is None:
             return {"instance_id": instance_id, "status_checks": None, "message": "No status information found"}
 
-        status = statuses[0]
-        system_status = status["SystemStatus"]["Status"]
-        instance_status = status["InstanceStatus"]["Status"]
-
-        return {
-            "instance_id": instance_id,
-            "system_status": system_status,
-            "instance_status": instance_status,
-            "details": status.get("SystemStatus", {}).get("Details", []) + status.get("InstanceStatus", {}).get("Details", [])
-        }
+        return _format_status_checks(instance_id, status)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get instance status checks: {e}")
 
+def _format_events(status):
+    return [
+        {
+            "Code": event.get("Code"),
+            "Description": event.get("Description"),
+            "NotBefore": event.get("NotBefore").isoformat() if event.get("NotBefore") else None,
+            "NotAfter": event.get("NotAfter").isoformat() if event.get("NotAfter") else None,
+        }
+        for event in status.get("Events", [])
+    ]
+
 @router.get("/events/{instance_id}")
-async def get_instance_events(instance_id: str):
+async def get_instance_events(
+    instance_id: str,
+    max_staleness: Optional[float] = MAX_STALENESS_QUERY,
+):
     """查詢 EC2 instance 事件（如啟動、停止、重啟記錄）"""
     try:
-        response = ec2_client.describe_instance_status(InstanceIds=[instance_id], IncludeAllInstances=True)
-        statuses = response.get("InstanceStatuses", [])
-        if not statuses:
+        if snapshot.fresh("ec2_status", max_staleness):
+            status = snapshot.collection("ec2_status").items.get(instance_id)
+        else:
+            response = await run_aws("ec2", ec2_client.describe_instance_status, InstanceIds=[instance_id], IncludeAllInstances=True)
+            statuses = response.get("InstanceStatuses", [])
+            status = statuses[0] if statuses else None
+        if status is None:
             return {"instance_id": instance_id, "events": [], "message": "No status information found"}
 
-        events = statuses[0].get("Events", [])
-        event_list = []
-        for event in events:
-            event_list.append({
-                "Code": event.get("Code"),
-                "Description": event.get("Description"),
-                "NotBefore": event.get("NotBefore").isoformat() if event.get("NotBefore") else None,
-                "NotAfter": event.get("NotAfter").isoformat() if event.get("NotAfter") else None,
+        return {"instance_id": instance_id, "events": _format_events(status)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get instance events: {e}")
+
+def _summarize_statuses(statuses, event_window_days):
+    """
+    依狀態與排程事件彙總，給 on-call dashboard 使用；
+    NotBefore 已過的事件已經開始，計入 events_in_progress 而不是 events_upcoming
+    """
+    now = datetime.now(timezone.utc)
+    window_end = now + timedelta(days=event_window_days)
+    summary = {
+        "total": len(statuses),
+        "by_state": {},
+        "by_system_status": {},
+        "by_instance_status": {},
+        "impaired": 0,
+        "events_total": 0,
+        "events_upcoming": 0,
+        "events_in_progress": 0,
+        "events_by_code": {},
+    }
+    for status in statuses:
+        state = status.get("InstanceState", {}).get("Name", "unknown")
+        system_status = status["SystemStatus"]["Status"]
+        instance_status = status["InstanceStatus"]["Status"]
+        summary["by_state"][state] = summary["by_state"].get(state, 0) + 1
+        summary["by_system_status"][system_status] = summary["by_system_status"].get(system_status, 0) + 1
+        summary["by_instance_status"][instance_status] = summary["by_instance_status"].get(instance_status, 0) + 1
+        if "impaired" in (system_status, instance_status):
+            summary["impaired"] += 1
+        for event in status.get("Events", []):
+            # 已完成的事件描述會以 [Completed] 開頭
+            if (event.get("Description") or "").startswith("[Completed]"):
+                continue
+            summary["events_total"] += 1
+            summary["events_by_code"][event.get("Code")] = summary["events_by_code"].get(event.get("Code"), 0) + 1
+            not_before = event.get("NotBefore")
+            if not_before is None:
+                continue
+            if not_before <= now:
+                summary["events_in_progress"] += 1
+            elif not_before <= window_end:
+                summary["events_upcoming"] += 1
+    summary["event_window_days"] = event_window_days
+    return summary
+
+@router.get("/fleet/status")
+async def get_fleet_status(
+    instance_ids: Optional[List[str]] = Query(None, description="EC2 instance IDs，可重複指定；省略或 all 代表全部"),
+    event_window_days: int = Query(7, ge=1, le=90, description="彙總幾天內即將發生的排程事件"),
+    account: Optional[List[str]] = Query(None, description="帳號名稱（AWS_ACCOUNT_ROLES），指定 account 或 region 時跨帳號 / region 查詢"),
+    region: Optional[List[str]] = Query(None, description="region，可重複指定；與 account 搭配時省略代表 AWS_REGIONS"),
+    timeout: Optional[float] = Query(None, gt=0, le=120, description="跨帳號 / region 查詢時每個目標的逾時秒數"),
+    max_staleness: Optional[float] = MAX_STALENESS_QUERY,
+):
+    """
+    批次取得多台 EC2 的狀態檢查與排程事件，並附上彙總。
+    指定 account 或 region 時以 fan_out 同時查詢各 (帳號, region)，回應附上與 /fleet/instances 相同的 targets；
+    否則查詢預設帳號與 region（可使用盤點快照）。
+    """
+    ids = None if not instance_ids or "all" in instance_ids else list(dict.fromkeys(instance_ids))
+    if account or region:
+        return await _fleet_status_fan_out(resolve_targets(account, region), ids, event_window_days, timeout)
+    try:
+        upstream_calls = 0
+        if snapshot.fresh("ec2_status", max_staleness):
+            all_statuses = snapshot.collection("ec2_status").items
+            statuses = all_statuses if ids is None else {i: all_statuses[i] for i in ids if i in all_statuses}
+        else:
+            statuses, upstream_calls = await describe_statuses(ids)
+
+        instances = []
+        for instance_id, status in sorted(statuses.items()):
+            instances.append({
+                **_format_status_checks(instance_id, status),
+                "state": status.get("InstanceState", {}).get("Name"),
+                "events": _format_events(status),
             })
 
-        return {"instance_id": instance_id, "events": event_list}
+        return {
+            "instances": instances,
+            "not_found": [i for i in ids if i not in statuses] if ids is not None else [],
+            "summary": _summarize_statuses(statuses.values(), event_window_days),
+            "upstream_calls": upstream_calls,
+        }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get instance events: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get fleet status: {e}")
+
+async def _fleet_status_fan_out(targets, ids, event_window_days, timeout):
+    """
+    各 (帳號, region) 各自查詢狀態；指定的 instance IDs 只存在於其中一個 region，
+    其他 region 回報不存在的 ID 由 describe_statuses 略過，全部 region 都找不到的列在 not_found
+    """
+    async def fetch(account_name, region_name):
+        client = await pool_client("ec2", account_name, region_name)
+        return await describe_statuses(ids, client=client, service=f"ec2@{scope(account_name, region_name)}")
+
+    started = time.perf_counter()
+    results, report = await fan_out(targets, fetch, timeout)
+    statuses = []
+    found = set()
+    instances = []
+    upstream_calls = 0
+    for target in targets:
+        if target not in results:
+            continue
+        target_statuses, calls = results[target]
+        upstream_calls += calls
+        for instance_id, status in sorted(target_statuses.items()):
+            statuses.append(status)
+            found.add(instance_id)
+            instances.append({
+                **_format_status_checks(instance_id, status),
+                "state": status.get("InstanceState", {}).get("Name"),
+                "events": _format_events(status),
+                "account": target[0],
+                "region": target[1],
+            })
+    for entry in report:
+        entry["instances"] = len(results.get((entry["account"], entry["region"]), ({}, 0))[0])
+    return {
+        "instances": instances,
+        "not_found": [i for i in ids if i not in found] if ids is not None else [],
+        "summary": _summarize_statuses(statuses, event_window_days),
+        "upstream_calls": upstream_calls,
+        "targets": report,
+        "partial": len(results) < len(targets),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
 
+async def _instance_ids_by_tag(tag):
+    """依 "key=value" 標籤找出 instance IDs"""
+    filters = _build_instance_filters(tags=[tag])
+    instance_ids = []
+    upstream_calls = 0
+    async for page in iter_pages("ec2", _paginate_instances(filters)):
+        upstream_calls += 1
+        for reservation in page["Reservations"]:
+            instance_ids.extend(instance["InstanceId"] for instance in reservation["Instances"])
+    return instance_ids, upstream_calls
+
+@router.get("/fleet/metrics")
+async def get_fleet_metrics(
+    instance_ids: Optional[List[str]] = Query(None, description="EC2 instance IDs，可重複指定"),
+    tag: Optional[str] = Query(None, description="以標籤篩選 instances，格式 key=value"),
+    metrics: List[str] = Query(["CPUUtilization"], description=f"要查詢的 metrics：{', '.join(FLEET_METRICS)}"),
+    hours: int = Query(1, ge=1, le=24, description="查詢過去多少小時"),
+    period: int = Query(300, ge=60, le=3600, description="datapoint 間隔秒數（60 的倍數）"),
+    max_points: Optional[int] = Query(None, ge=1, le=1440, description="每個 series 的 datapoint 上限，超過時放大 period"),
+):
+    """
+    以 GetMetricData 批次取得多台 EC2 的 metrics time series（每次呼叫最多 500 個 metric）。
+    只查詢預設帳號與 region：series 快取與批次都在 metrics_engine 的 CloudWatch client 上，不經過 fan_out
+    """
+    unknown = [m for m in metrics if m not in FLEET_METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported metrics: {', '.join(unknown)}")
+    if period % 60:
+        raise HTTPException(status_code=400, detail="period must be a multiple of 60")
+    if not instance_ids and not tag:
+        raise HTTPException(status_code=400, detail="Either instance_ids or tag is required")
+    try:
+        upstream_calls = 0
+        ids = list(dict.fromkeys(instance_ids or []))
+        if tag:
+            tagged_ids, upstream_calls = await _instance_ids_by_tag(tag)
+            ids = list(dict.fromkeys(ids + tagged_ids))
+
+        end = time.time()
+        targets = [(instance_id, metric_name) for instance_id in ids for metric_name in metrics]
+        specs = [
+            ("AWS/EC2", metric_name, [("InstanceId", instance_id)], FLEET_METRICS[metric_name])
+            for instance_id, metric_name in targets
+        ]
+        window = await metrics_engine.query(specs, end - hours * 3600, end, period=period, max_points=max_points)
+
+        timestamps = window.timestamps()
+        instances = {instance_id: {} for instance_id in ids}
+        for (instance_id, metric_name), values in zip(targets, window.values):
+            points = [(ts, v) for ts, v in zip(timestamps, values) if v is not None]
+            instances[instance_id][metric_name] = {
+                "timestamps": [ts for ts, _ in points],
+                "values": [round(v, 4) for _, v in points],
+            }
+
+        return {
+            "start_time": timestamps[0] if timestamps else None,
+            "end_time": datetime.fromtimestamp(window.buckets[-1] + window.period, timezone.utc).isoformat()
+            if window.buckets else None,
+            "period": window.period,
+            "instances": instances,
+            "upstream_calls": upstream_calls + window.upstream_calls,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get fleet metrics: {e}")
@@ -0,0 +1,363 @@
+"""
+從 CloudTrail 匯入 Bedrock Guardrail 介入事件
+
+以 lookup_events（EventSource = bedrock.amazonaws.com）分頁讀取並逐頁解析。CloudTrail 由新到舊
+回傳，分批寫入會讓每一批都比儲存的尾端還舊而需要重排，所以整個區間讀完後才一次寫入
+guardrail 事件儲存，儲存只需依時間附加。檢查點（checkpoint）記錄已匯入到哪裡，每次只抓上次之後的新事件。
+
+檢查點必須和它描述的事件儲存一起存活，不能出現「檢查點說已匯入、儲存卻是空的」而遺失歷史：
+- 設定 GUARDRAIL_CHECKPOINT_PATH 或 PERSISTENT_CACHE_PATH 時，PersistentCheckpointStore 把每次匯入的
+  事件與檢查點寫在同一個 SQLite transaction。重新啟動或另一個 uvicorn worker 先載入這些事件再從檢查點
+  接著匯入，不必重新下載整個 lookback 區間；各 worker 以 lease 輪流匯入。
+- 都未設定時檢查點在記憶體內、跟著目前的事件儲存走，重新啟動或 set_event_store 換掉儲存時從 lookback 起重新匯入。
+
+CloudTrail 由新到舊回傳事件，所以一次執行中途失敗時，會記錄已處理到的最舊時間點；
+下次執行先補完該段缺口，再往後抓新事件，不會重複下載或重複寫入。
+
+環境變數：
+- GUARDRAIL_INGEST_LOOKBACK_DAYS：第一次執行往回抓幾天（預設 7，CloudTrail 最多 90 天）
+- GUARDRAIL_CHECKPOINT_PATH：保存檢查點與匯入事件的 SQLite 檔案路徑；未設定時使用 PERSISTENT_CACHE_PATH 的共用快取
+- GUARDRAIL_PERSIST_DAYS：匯入的事件與檢查點在磁碟上保留的天數（預設 400）
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from aws_executor import get_executor, iter_pages
+from guardrail_store import get_event_store
+from persistent_cache import PersistentCache, persistent_cache
+
+LOOKBACK_DAYS = int(os.getenv("GUARDRAIL_INGEST_LOOKBACK_DAYS", 7))
+GUARDRAIL_CHECKPOINT_PATH = os.getenv("GUARDRAIL_CHECKPOINT_PATH", "")
+PERSIST_TTL = float(os.getenv("GUARDRAIL_PERSIST_DAYS", 400)) * 86400
+PERSIST_NAMESPACE = "guardrail_ingest"
+PERSIST_VERSION = 1
+# 一次匯入最久的秒數；持有 lease 的 worker 異常結束時，其他 worker 最多等這麼久
+INGEST_LEASE_TTL = 900
+EVENT_SOURCE = "bedrock.amazonaws.com"
+INTERVENED_ACTIONS = {"GUARDRAIL_INTERVENED", "INTERVENED"}
+
+
+class MemoryCheckpointStore:
+    """保存在記憶體的檢查點（預設），與記憶體內的事件儲存同生命週期"""
+
+    def __init__(self):
+        self._checkpoint = {}
+
+    def load(self):
+        return json.loads(json.dumps(self._checkpoint))
+
+    def save(self, checkpoint, events=()):
+        # 事件已在記憶體內的事件儲存
+        self._checkpoint = json.loads(json.dumps(checkpoint))
+
+    def lease(self):
+        return contextlib.nullcontext()
+
+
+class CheckpointStore:
+    """
+    以 JSON 檔保存檢查點，寫入時先寫暫存檔再 rename，避免寫到一半的檔案。
+    只適用於同樣會持久化的事件儲存，否則重新啟動後會跳過已不存在的事件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save(self, checkpoint, events=()):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.path)
+
+    def lease(self):
+        return contextlib.nullcontext()
+
+
+class PersistentCheckpointStore:
+    """
+    把檢查點與匯入的事件一起寫進 PersistentCache：同一個 namespace、同一個資料版本、同一個 transaction，
+    磁碟上的檢查點不會超前磁碟上的事件。load 先把目前事件儲存還沒有的事件區塊（上一個 process 或
+    其他 worker 寫入的）載入，再回傳檢查點。
+    """
+
+    def __init__(self, cache, store=None, namespace=PERSIST_NAMESPACE):
+        self.cache = cache
+        self.namespace = namespace
+        self._store = store
+        self._lock = threading.Lock()
+        self._loaded_store = None
+        self._loaded_through = None  # 已載入目前事件儲存的最後一個事件區塊 key
+
+    @property
+    def store(self):
+        return self._store if self._store is not None else get_event_store()
+
+    def load(self):
+        with self._lock:
+            store = self.store
+            if self._loaded_store is not store:
+                # 新的事件儲存（新 process 或 set_event_store）：從頭載入
+                self._loaded_store, self._loaded_through = store, None
+            chunks = self.cache.get_range(self.namespace, "events:", "events;", PERSIST_VERSION)
+            for key, events, _ in chunks:
+                if self._loaded_through is None or key > self._loaded_through:
+                    store.ingest(events)
+                    self._loaded_through = key
+            entry = self.cache.get(self.namespace, "checkpoint", PERSIST_VERSION)
+            return entry[0] if entry else {}
+
+    def save(self, checkpoint, events=()):
+        with self._lock:
+            items = []
+            key = None
+            if events:
+                # key 依寫入時間遞增，load 依序載入
+                key = f"events:{time.time_ns():020d}"
+                items.append((key, list(events), PERSIST_TTL))
+            items.append(("checkpoint", checkpoint, PERSIST_TTL))
+            self.cache.put_many(self.namespace, items, PERSIST_VERSION)
+            if key is not None and self._loaded_store is self.store:
+                # 這些事件已經寫入目前的事件儲存
+                self._loaded_through = key
+
+    def lease(self):
+        # 同一時間只有一個 worker 匯入，其他 worker 等它寫完，再從它的檢查點接著匯入
+        return self.cache.lease(f"{self.namespace}:run", ttl=INGEST_LEASE_TTL)
+
+
+def default_checkpoint_store():
+    """GUARDRAIL_CHECKPOINT_PATH 或共用的持久化快取；都未設定時回傳 None，使用記憶體檢查點"""
+    if GUARDRAIL_CHECKPOINT_PATH:
+        return PersistentCheckpointStore(PersistentCache(GUARDRAIL_CHECKPOINT_PATH))
+    if persistent_cache is not None:
+        return PersistentCheckpointStore(persistent_cache)
+    return None
+
+
+def _iso(dt):
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+def _from_iso(value):
+    return datetime.fromisoformat(value)
+
+
+def _first_assessment_reason(response):
+    """從 guardrail assessments 取出第一個觸發的政策類型作為介入原因"""
+    for assessment in response.get("assessments") or []:
+        for policy, detail in assessment.items():
+            if not isinstance(detail, dict):
+                continue
+            for items in detail.values():
+                if isinstance(items, list) and items:
+                    item = items[0]
+                    return str(item.get("type") or item.get("name") or policy)
+            return policy
+    return None
+
+
+def parse_guardrail_event(record):
+    """
+    將 CloudTrail lookup_events 的一筆紀錄轉成 guardrail 事件 dict；
+    非 guardrail 介入事件回傳 None。
+    """
+    detail = json.loads(record.get("CloudTrailEvent") or "{}")
+    request = detail.get("requestParameters") or {}
+    response = detail.get("responseElements") or {}
+    additional = detail.get("additionalEventData") or {}
+
+    action = response.get("action") or additional.get("guardrailAction")
+    stop_reason = response.get("stopReason")
+    if action not in INTERVENED_ACTIONS and stop_reason != "guardrail_intervened":
+        return None
+
+    identity = detail.get("userIdentity") or {}
+    return {
+        "id": record["EventId"],
+        "user": record.get("Username") or identity.get("arn") or "unknown",
+        "resource": request.get("modelId") or request.get("guardrailIdentifier") or "unknown",
+        "timestamp": record["EventTime"],
+        "reason": _first_assessment_reason(response) or "guardrail_intervened",
+    }
+
+
+class CloudTrailIngestor:
+    def __init__(self, client, store=None, checkpoints=None, lookback_days=LOOKBACK_DAYS):
+        self.client = client
+        self._store = store
+        self._checkpoints = checkpoints
+        self._memory_checkpoints = None
+        self._memory_checkpoints_store = None
+        self.lookback_days = lookback_days
+        self.last_run = None
+        self._lock = None
+
+    @property
+    def store(self):
+        # 未指定時使用目前的事件儲存（可能已被 set_event_store 替換）
+        return self._store if self._store is not None else get_event_store()
+
+    @property
+    def checkpoints(self):
+        # 未指定時使用記憶體檢查點，事件儲存被替換時一併重置
+        if self._checkpoints is not None:
+            return self._checkpoints
+        store = self.store
+        if self._memory_checkpoints_store is not store:
+            self._memory_checkpoints = MemoryCheckpointStore()
+            self._memory_checkpoints_store = store
+        return self._memory_checkpoints
+
+    async def _call(self, fn, *args):
+        """檢查點可能在磁碟上，在共用 thread pool 上讀寫，不阻塞 event loop"""
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), fn, *args)
+
+    async def restore(self):
+        """啟動時載入持久化的事件與檢查點，回傳檢查點"""
+        return await self._call(self.checkpoints.load)
+
+    async def _ingest_window(self, start_time, end_time, skip_ids, stats, written):
+        """
+        匯入 [start_time, end_time] 內的事件，讀完整個區間後一次寫入。回傳 (最新事件時間, 該時間的事件 IDs)；
+        失敗時先寫入已解析的事件，並把已處理到的最舊位置記在 stats，供記錄缺口。
+        """
+        newest_time, newest_ids = None, set()
+        oldest_time, oldest_ids = None, set()
+        events = []
+        paginator = self.client.get_paginator("lookup_events")
+        pages = paginator.paginate(
+            LookupAttributes=[{"AttributeKey": "EventSource", "AttributeValue": EVENT_SOURCE}],
+            StartTime=start_time,
+            EndTime=end_time,
+        )
+        try:
+            async for page in iter_pages("cloudtrail", pages):
+                stats["pages"] += 1
+                for record in page.get("Events", []):
+                    stats["scanned"] += 1
+                    event_time = record["EventTime"]
+                    if record["EventId"] not in skip_ids:
+                        if newest_time is None or event_time > newest_time:
+                            newest_time, newest_ids = event_time, set()
+                        if event_time == newest_time:
+                            newest_ids.add(record["EventId"])
+                        event = parse_guardrail_event(record)
+                        if event is not None:
+                            events.append(event)
+                    # 已略過（先前寫入過）的事件也算已處理，記錄缺口時一併排除
+                    if oldest_time is None or event_time < oldest_time:
+                        oldest_time, oldest_ids = event_time, set()
+                    if event_time == oldest_time:
+                        oldest_ids.add(record["EventId"])
+        except BaseException:
+            # 已解析的事件先寫入，並記錄處理到的最舊位置，下次從這裡補完缺口
+            if events:
+                stats["ingested"] += self.store.ingest(events)
+                written.extend(events)
+            stats["resume_from"] = (oldest_time, oldest_ids)
+            stats["newest"] = (newest_time, newest_ids)
+            raise
+        if events:
+            # 由新到舊讀取，反轉後依時間遞增寫入
+            events.reverse()
+            stats["ingested"] += self.store.ingest(events)
+            written.extend(events)
+        return newest_time, newest_ids
+
+    async def run(self):
+        """執行一次增量匯入，回傳統計資料"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            async with self.checkpoints.lease():
+                return await self._run()
+
+    async def _run(self):
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        checkpoint = await self._call(self.checkpoints.load)
+        stats = {"pages": 0, "scanned": 0, "ingested": 0}
+
+        if checkpoint.get("last_event_time"):
+            high_water = _from_iso(checkpoint["last_event_time"])
+            high_water_ids = set(checkpoint.get("last_event_ids", []))
+        else:
+            high_water = now - timedelta(days=self.lookback_days)
+            high_water_ids = set()
+
+        pending = checkpoint.get("pending")
+        windows = []
+        if pending:
+            # 上次中途失敗：先補完 [high_water, 失敗時處理到的最舊時間]
+            target = None
+            if pending.get("target_time"):
+                target = (_from_iso(pending["target_time"]), set(pending["target_ids"]))
+            windows.append((_from_iso(pending["until"]), set(pending["until_ids"]), target))
+        windows.append((now, set(), None))
+
+        for end_time, extra_skip_ids, target in windows:
+            stats.pop("resume_from", None)
+            stats.pop("newest", None)
+            # 這個區間寫入事件儲存的事件，與檢查點一起持久化
+            written = []
+            try:
+                newest_time, newest_ids = await self._ingest_window(
+                    high_water, end_time, high_water_ids | extra_skip_ids, stats, written
+                )
+            except BaseException:
+                await self._save_pending(high_water, high_water_ids, stats, target, written)
+                raise
+            if target is not None:
+                newest_time, newest_ids = target
+            if newest_time is not None and newest_time >= high_water:
+                if newest_time == high_water:
+                    newest_ids |= high_water_ids
+                high_water, high_water_ids = newest_time, newest_ids
+            await self._call(self.checkpoints.save, {
+                "last_event_time": _iso(high_water),
+                "last_event_ids": sorted(high_water_ids),
+            }, written)
+
+        elapsed = time.perf_counter() - started
+        self.last_run = {
+            "started_at": _iso(now),
+            "seconds": round(elapsed, 3),
+            "pages": stats["pages"],
+            "scanned": stats["scanned"],
+            "ingested": stats["ingested"],
+            "events_per_second": round(stats["scanned"] / elapsed, 1) if elapsed > 0 else None,
+            "checkpoint": _iso(high_water),
+        }
+        return self.last_run
+
+    async def _save_pending(self, high_water, high_water_ids, stats, target, written):
+        resume = stats.get("resume_from")
+        if not resume or resume[0] is None:
+            # 還沒有任何事件寫入，下次從原本的檢查點重新開始即可
+            return
+        if target is None:
+            target = stats.get("newest")
+        checkpoint = {
+            "last_event_time": _iso(high_water),
+            "last_event_ids": sorted(high_water_ids),
+            "pending": {
+                "until": _iso(resume[0]),
+                "until_ids": sorted(resume[1]),
+                "target_time": _iso(target[0]) if target and target[0] else None,
+                "target_ids": sorted(target[1]) if target else [],
+            },
+        }
+        await self._call(self.checkpoints.save, checkpoint, written)
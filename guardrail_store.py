@@ -0,0 +1,257 @@
+"""
+Guardrail 介入事件儲存
+
+事件在寫入時就解析 timestamp，以欄位式（columnar）陣列保存：
+時間為依序排列的 epoch 秒數，user / resource / reason 以字典編碼成整數。
+同時維護各欄位與每日的累計計數，以及每日各欄位的計數：group-by 與 trend 查詢只需
+O(天數 × 群組數)，只有區間頭尾不足一天的部分才逐筆計算，時間區間以二分搜尋定位。
+
+GuardrailEventStore 定義儲存介面，可替換成其他實作（例如資料庫）。
+"""
+
+import bisect
+import functools
+import heapq
+import itertools
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+FIELDS = ("user", "resource", "reason")
+SECONDS_PER_DAY = 86400
+# 合併每日計數（Python 迴圈）每個項目的成本約為逐筆計數（Counter 的 C 實作）每筆的幾倍；
+# 每日群組數接近每日事件數時（例如幾乎每個 user 每天只有一筆），直接逐筆計數反而較快
+DAY_COUNTS_COST = 4
+
+
+def parse_timestamp(value):
+    """將 ISO 8601 字串、datetime 或 epoch 秒數轉成 epoch 秒數（UTC）"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+@functools.lru_cache(maxsize=1024)
+def format_day(day_number):
+    return datetime.fromtimestamp(day_number * SECONDS_PER_DAY, timezone.utc).strftime("%Y-%m-%d")
+
+
+def format_timestamp(epoch):
+    """epoch 秒數 -> TIMESTAMP_FORMAT；日期部分有快取，匯出大量事件時不必每筆建立 datetime"""
+    day, seconds = divmod(epoch, SECONDS_PER_DAY)
+    return f"{format_day(day)}T{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}Z"
+
+
+class GuardrailEventStore(ABC):
+    """事件儲存介面"""
+
+    @abstractmethod
+    def ingest(self, events):
+        """寫入事件（dict：id / user / resource / timestamp / reason），回傳寫入筆數"""
+
+    @abstractmethod
+    def count_by(self, field, start=None, end=None):
+        """依 user / resource / reason 統計，可限制時間區間 [start, end)（epoch 秒數）"""
+
+    @abstractmethod
+    def count_by_day(self, start, end=None):
+        """[start, end) 區間內每日（UTC）的事件數"""
+
+    @abstractmethod
+    def iter_events(self, start=None, end=None, user=None, resource=None):
+        """依時間排序逐筆產生事件 dict"""
+
+    @abstractmethod
+    def __len__(self):
+        """已儲存的事件數"""
+
+
+class _Dictionary:
+    """字串 <-> 整數代碼"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class ColumnarEventStore(GuardrailEventStore):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ts = array("q")
+        self._ids = []
+        self._columns = {field: array("I") for field in FIELDS}
+        self._dicts = {field: _Dictionary() for field in FIELDS}
+        self._counts = {field: Counter() for field in FIELDS}  # 代碼 -> 次數
+        self._day_counts = Counter()  # 自 epoch 起算的日數 -> 次數
+        self._day_field_counts = {field: {} for field in FIELDS}  # 日數 -> Counter(代碼 -> 次數)
+
+    def __len__(self):
+        return len(self._ts)
+
+    def ingest(self, events):
+        dicts = self._dicts
+        with self._lock:
+            rows = [
+                (
+                    parse_timestamp(event["timestamp"]),
+                    str(event["id"]),
+                    dicts["user"].encode(event["user"]),
+                    dicts["resource"].encode(event["resource"]),
+                    dicts["reason"].encode(event["reason"]),
+                )
+                for event in events
+            ]
+            if not rows:
+                return 0
+            rows.sort(key=lambda row: row[0])
+
+            if self._ts and rows[0][0] < self._ts[-1]:
+                self._merge(rows)
+            else:
+                self._append(rows)
+            # rows 已依時間排序，同一天的事件相鄰
+            for day, day_rows in itertools.groupby(rows, key=lambda row: row[0] // SECONDS_PER_DAY):
+                day_rows = list(day_rows)
+                self._day_counts[day] += len(day_rows)
+                for position, field in enumerate(FIELDS, start=2):
+                    self._day_field_counts[field].setdefault(day, Counter()).update(row[position] for row in day_rows)
+            self._counts["user"].update(row[2] for row in rows)
+            self._counts["resource"].update(row[3] for row in rows)
+            self._counts["reason"].update(row[4] for row in rows)
+        return len(rows)
+
+    def _append(self, rows):
+        self._ts.extend(row[0] for row in rows)
+        self._ids.extend(row[1] for row in rows)
+        self._columns["user"].extend(row[2] for row in rows)
+        self._columns["resource"].extend(row[3] for row in rows)
+        self._columns["reason"].extend(row[4] for row in rows)
+
+    def _merge(self, rows):
+        """
+        晚到的事件：只有與新事件時間範圍重疊的部分需要合併排序，之前與之後的部分以 C 層級的切片複製。
+        換成新的陣列而不是就地修改，進行中的 iter_events 仍讀取舊的陣列
+        """
+        first = bisect.bisect_right(self._ts, rows[0][0])
+        last = bisect.bisect_right(self._ts, rows[-1][0], first)
+        columns = [self._ts, self._ids, *(self._columns[field] for field in FIELDS)]
+        overlap = zip(*(column[first:last] for column in columns))
+        merged = list(heapq.merge(overlap, rows, key=lambda row: row[0]))
+        rebuilt = []
+        for position, column in enumerate(columns):
+            values = column[:first]
+            values.extend(row[position] for row in merged)
+            values.extend(column[last:])
+            rebuilt.append(values)
+        self._ts, self._ids = rebuilt[0], rebuilt[1]
+        self._columns = dict(zip(FIELDS, rebuilt[2:]))
+
+    def _range(self, start, end):
+        lo = 0 if start is None else bisect.bisect_left(self._ts, start)
+        hi = len(self._ts) if end is None else bisect.bisect_left(self._ts, end)
+        return lo, max(lo, hi)
+
+    def count_by(self, field, start=None, end=None):
+        values = self._dicts[field].values
+        with self._lock:
+            if start is None and end is None:
+                counts = self._counts[field]
+            else:
+                counts = self._count_range(field, start, end)
+            return {values[code]: count for code, count in counts.items()}
+
+    def _count_range(self, field, start, end):
+        """
+        完整的日子加總每日計數，只有頭尾兩天的事件逐筆計算；
+        每日計數的項目總數（群組數）換算後不少於事件數時，整段逐筆計算
+        """
+        lo, hi = self._range(start, end)
+        if lo >= hi:
+            return Counter()
+        column = self._columns[field]
+        first_day = self._ts[lo] // SECONDS_PER_DAY
+        last_day = self._ts[hi - 1] // SECONDS_PER_DAY
+        if first_day == last_day:
+            return Counter(column[lo:hi])
+        head_end = bisect.bisect_left(self._ts, (first_day + 1) * SECONDS_PER_DAY, lo, hi)
+        tail_start = bisect.bisect_left(self._ts, last_day * SECONDS_PER_DAY, lo, hi)
+        day_counts = self._day_field_counts[field]
+        days = [day_counts[day] for day in range(first_day + 1, last_day) if day in day_counts]
+        if sum(map(len, days)) * DAY_COUNTS_COST >= tail_start - head_end:
+            return Counter(column[lo:hi])
+        counts = Counter(column[lo:head_end])
+        counts.update(column[tail_start:hi])
+        for day in days:
+            counts.update(day)
+        return counts
+
+    def count_by_day(self, start, end=None):
+        with self._lock:
+            end = end if end is not None else (self._ts[-1] + 1 if self._ts else start)
+            result = {}
+            first_day = start // SECONDS_PER_DAY
+            last_day = (end - 1) // SECONDS_PER_DAY
+            if end <= start:
+                return result
+            for day in range(first_day, last_day + 1):
+                day_start = day * SECONDS_PER_DAY
+                day_end = day_start + SECONDS_PER_DAY
+                if day_start >= start and day_end <= end:
+                    count = self._day_counts.get(day, 0)
+                else:
+                    # 區間頭尾不足一天的部分以二分搜尋計算
+                    lo, hi = self._range(max(start, day_start), min(end, day_end))
+                    count = hi - lo
+                if count:
+                    result[format_day(day)] = count
+            return result
+
+    def iter_events(self, start=None, end=None, user=None, resource=None):
+        with self._lock:
+            lo, hi = self._range(start, end)
+            # 取得目前欄位的參考；之後的寫入只會附加在尾端或換成新的陣列，不影響這次讀取
+            timestamps, ids = self._ts, self._ids
+            users, resources, reasons = (self._columns[field] for field in FIELDS)
+        user_code = self._dicts["user"].codes.get(user, -1) if user is not None else None
+        resource_code = self._dicts["resource"].codes.get(resource, -1) if resource is not None else None
+        user_values, resource_values, reason_values = (self._dicts[field].values for field in FIELDS)
+        for i in range(lo, hi):
+            if user_code is not None and users[i] != user_code:
+                continue
+            if resource_code is not None and resources[i] != resource_code:
+                continue
+            yield {
+                "id": ids[i],
+                "user": user_values[users[i]],
+                "resource": resource_values[resources[i]],
+                "timestamp": format_timestamp(timestamps[i]),
+                "reason": reason_values[reasons[i]],
+            }
+
+
+_event_store = ColumnarEventStore()
+
+
+def get_event_store():
+    return _event_store
+
+
+def set_event_store(store):
+    """替換目前使用的事件儲存實作"""
+    global _event_store
+    _event_store = store
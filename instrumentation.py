@@ -0,0 +1,294 @@
+"""
+Prometheus 格式的執行期指標
+
+- PrometheusMiddleware：ASGI middleware，依路由樣板（例如 /ec2/cpu-utilization/{instance_id}）
+  記錄請求數、延遲 histogram 與進行中的請求數；
+- instrument_aws：在 aws_clients 的 client registry 註冊 botocore event hooks，
+  依 AWS 服務 / operation 記錄呼叫延遲、重試、throttle 與進行中的呼叫數；
+- register_cache / register_collector：抓取 /metrics 時才讀取的快取命中率等資料。
+
+熱路徑上只有 perf_counter、bisect 與一次上鎖的計數，每個請求的額外成本為數微秒。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+THROTTLE_CODES = frozenset({
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottledException",
+    "TooManyRequestsException", "RequestLimitExceeded", "RequestThrottled", "SlowDown",
+    "ProvisionedThroughputExceededException", "BandwidthLimitExceeded", "LimitExceededException",
+})
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if isinstance(value, int) or (float(value).is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            series = list(self._series.items())
+        for labels, value in series:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, labels, value):
+        with self._lock:
+            self._series[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # 各 bucket 的（非累積）次數、+Inf 次數，最後一格為總和
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        bounds = [f'le="{bound!r}"' for bound in self.buckets] + ['le="+Inf"']
+        for labels, values in series:
+            cumulative = 0
+            for le, count in zip(bounds, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """collect() 回傳 [(name, kind, help, [({label: value}, 數值)])]，於抓取時呼叫"""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+http_requests = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route template, method and status code.", ("route", "method", "status")
+)
+http_latency = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("route", "method")
+)
+http_in_flight = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served.")
+
+aws_calls = REGISTRY.counter(
+    "aws_api_calls_total", "AWS API calls by service, operation and outcome.", ("service", "operation", "outcome")
+)
+aws_latency = REGISTRY.histogram(
+    "aws_api_call_duration_seconds", "AWS API call latency including retries.", ("service", "operation")
+)
+aws_retries = REGISTRY.counter(
+    "aws_api_retries_total", "Retried AWS API attempts.", ("service", "operation")
+)
+aws_throttles = REGISTRY.counter(
+    "aws_api_throttles_total", "AWS API attempts rejected with a throttling error.", ("service", "operation")
+)
+aws_in_flight = REGISTRY.gauge("aws_api_calls_in_flight", "AWS API calls currently in progress.", ("service",))
+
+
+class PrometheusMiddleware:
+    """純 ASGI middleware（不經過 BaseHTTPMiddleware，避免額外的 task 與串流包裝）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            # 路由比對後 FastAPI 會在 scope 放入 route，使用樣板路徑避免 label 數量爆增
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_requests.inc((route_path, method, str(status)))
+            http_latency.observe((route_path, method), elapsed)
+
+
+def _error_code(parsed):
+    return ((parsed or {}).get("Error") or {}).get("Code")
+
+
+def _before_call(model, context, **kwargs):
+    service = model.service_model.service_name
+    context["instrumentation"] = (time.perf_counter(), service, model.name)
+    aws_in_flight.inc((service,))
+
+
+def _finish(context, outcome, retries):
+    started, service, operation = context.pop("instrumentation")
+    aws_in_flight.dec((service,))
+    labels = (service, operation)
+    aws_latency.observe(labels, time.perf_counter() - started)
+    aws_calls.inc((service, operation, outcome))
+    if retries:
+        aws_retries.inc(labels, retries)
+
+
+def _after_call(parsed, context, **kwargs):
+    if "instrumentation" not in context:
+        return
+    metadata = (parsed or {}).get("ResponseMetadata") or {}
+    code = _error_code(parsed)
+    outcome = "success" if code is None else ("throttled" if code in THROTTLE_CODES else "error")
+    _finish(context, outcome, metadata.get("RetryAttempts", 0))
+
+
+def _after_call_error(exception, context, **kwargs):
+    if "instrumentation" not in context:
+        return
+    metadata = (getattr(exception, "response", None) or {}).get("ResponseMetadata") or {}
+    _finish(context, "error", metadata.get("RetryAttempts", 0))
+
+
+def _needs_retry(response, operation, **kwargs):
+    # 每次嘗試結束都會觸發；只記錄 throttle，回傳 None 不影響 botocore 的重試判斷
+    if response is not None and _error_code(response[1]) in THROTTLE_CODES:
+        aws_throttles.inc((operation.service_model.service_name, operation.name))
+
+
+def instrument_aws(client_registry):
+    """在 client registry 註冊 botocore hooks，已建立與之後建立的 clients 都會套用"""
+    client_registry.register_event_hook("before-call.*.*", _before_call)
+    client_registry.register_event_hook("after-call.*.*", _after_call)
+    client_registry.register_event_hook("after-call-error.*.*", _after_call_error)
+    client_registry.register_event_hook("needs-retry.*.*", _needs_retry)
+
+
+_caches = []
+
+
+def register_cache(name, hits_and_misses):
+    """hits_and_misses() 回傳 (命中次數, 未命中次數)，輸出為 cache_* 指標中 cache=name 的 series"""
+    _caches.append((name, hits_and_misses))
+
+
+def _collect_caches():
+    hits, misses, ratios = [], [], []
+    for name, hits_and_misses in _caches:
+        hit, miss = hits_and_misses()
+        labels = {"cache": name}
+        hits.append((labels, hit))
+        misses.append((labels, miss))
+        ratios.append((labels, hit / (hit + miss) if hit + miss else None))
+    return [
+        ("cache_hits_total", "counter", "Cache hits.", hits),
+        ("cache_misses_total", "counter", "Cache misses.", misses),
+        ("cache_hit_ratio", "gauge", "Cache hit ratio since start.", ratios),
+    ]
+
+
+REGISTRY.register_collector(_collect_caches)
+
+
+def register_collector(collect):
+    REGISTRY.register_collector(collect)
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,248 @@
+"""
+背景盤點快照：定期把 EC2 / App Runner 的資源狀態載入記憶體並建立索引
+
+各 router 以 `snapshot.register(...)` 註冊資料來源（async fetch 函式）與索引，
+背景工作依設定的間隔重新抓取，與上一版比較後只更新有變動的項目。
+端點可用 `max_staleness` 決定是否接受快照資料，讀取不需呼叫 AWS。
+
+環境變數：
+- INVENTORY_SNAPSHOT_ENABLED：設為 1 / true 時啟用背景更新（預設關閉）
+- INVENTORY_SNAPSHOT_INTERVAL：更新間隔秒數（預設 60）
+- INVENTORY_PERSIST_TTL：啟用持久化快取（PERSISTENT_CACHE_PATH）時，快照在磁碟上保留的秒數（預設 3600）
+
+啟用持久化快取時，快照會寫入磁碟：新啟動的 worker 先載入磁碟上的快照，
+各 worker 以 lease 輪流更新，其他 worker 直接讀取寫入的結果，不重複呼叫 AWS。
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from persistent_cache import persistent_cache
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ENABLED = os.getenv("INVENTORY_SNAPSHOT_ENABLED", "").lower() in ("1", "true", "yes")
+SNAPSHOT_INTERVAL = float(os.getenv("INVENTORY_SNAPSHOT_INTERVAL", 60))
+PERSIST_TTL = float(os.getenv("INVENTORY_PERSIST_TTL", 3600))
+PERSIST_NAMESPACE = "inventory"
+
+
+class IndexedCollection:
+    """
+    以 ID 為主鍵的資料集合，另外維護次要索引。
+
+    indexes：{索引名稱: 函式(item) -> 可迭代的索引值}，例如依 state 或 (tag key, value)。
+    """
+
+    def __init__(self, indexes=None):
+        self._index_funcs = indexes or {}
+        self.items = {}
+        self._indexes = {name: {} for name in self._index_funcs}
+
+    def _index_add(self, item_id, item):
+        for name, func in self._index_funcs.items():
+            for value in func(item):
+                self._indexes[name].setdefault(value, set()).add(item_id)
+
+    def _index_remove(self, item_id, item):
+        for name, func in self._index_funcs.items():
+            index = self._indexes[name]
+            for value in func(item):
+                ids = index.get(value)
+                if ids is not None:
+                    ids.discard(item_id)
+                    if not ids:
+                        del index[value]
+
+    def apply(self, new_items):
+        """以新的完整資料取代目前內容，只更新有變動的項目，回傳變動數量"""
+        added = changed = removed = 0
+        for item_id in list(self.items):
+            if item_id not in new_items:
+                self._index_remove(item_id, self.items.pop(item_id))
+                removed += 1
+        for item_id, item in new_items.items():
+            old = self.items.get(item_id)
+            if old is None:
+                added += 1
+            elif old != item:
+                changed += 1
+                self._index_remove(item_id, old)
+            else:
+                continue
+            self.items[item_id] = item
+            self._index_add(item_id, item)
+        return {"added": added, "changed": changed, "removed": removed}
+
+    def lookup(self, index_name, values):
+        """回傳索引值屬於 values 其中之一的 ID 集合"""
+        index = self._indexes[index_name]
+        ids = set()
+        for value in values:
+            ids |= index.get(value, set())
+        return ids
+
+    def query(self, **criteria):
+        """
+        依多個索引取交集，例如 query(state=["running"], tag=[("env", "prod")])；
+        值為 None 或空的條件會被忽略，結果依 ID 排序。
+        """
+        ids = None
+        for name, values in criteria.items():
+            if not values:
+                continue
+            matched = self.lookup(name, values)
+            ids = matched if ids is None else ids & matched
+        if ids is None:
+            ids = self.items.keys()
+        return [self.items[item_id] for item_id in sorted(ids)]
+
+
+class _Source:
+    def __init__(self, fetch, indexes, version):
+        self.fetch = fetch
+        self.version = version
+        self.collection = IndexedCollection(indexes)
+        self.refreshed_at = None
+        self.refresh_ms = None
+        self.last_delta = None
+        self.last_error = None
+        self.persisted_loads = 0
+
+
+class InventorySnapshot:
+    def __init__(self, interval=SNAPSHOT_INTERVAL, clock=time.time, persistent=None):
+        self.interval = interval
+        self._clock = clock
+        self.persistent = persistent
+        self._sources = {}
+        self._task = None
+
+    def register(self, name, fetch, indexes=None, version=1):
+        """
+        註冊資料來源。fetch 為 async 函式，參數為目前的集合（供增量比對），
+        回傳 {id: item} 的完整資料。version 為資料格式版本，變更 item 結構時遞增，
+        磁碟上舊版本的快照就不會被載入。
+        """
+        self._sources[name] = _Source(fetch, indexes, version)
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def age(self, name):
+        """資料距今秒數；尚未載入時回傳 None"""
+        source = self._sources.get(name)
+        if source is None or source.refreshed_at is None:
+            return None
+        return self._clock() - source.refreshed_at
+
+    def fresh(self, name, max_staleness):
+        """快照資料是否可在 max_staleness 秒內使用"""
+        if max_staleness is None:
+            return False
+        age = self.age(name)
+        return age is not None and age <= max_staleness
+
+    def collection(self, name):
+        return self._sources[name].collection
+
+    async def _fetch(self, name):
+        source = self._sources[name]
+        started = time.perf_counter()
+        try:
+            items = await source.fetch(source.collection)
+        except Exception as e:
+            source.last_error = str(e)
+            logger.warning("Inventory snapshot refresh failed for %s: %s", name, e)
+            return False
+        source.last_delta = source.collection.apply(items)
+        source.refreshed_at = self._clock()
+        source.refresh_ms = round((time.perf_counter() - started) * 1000, 3)
+        source.last_error = None
+        return True
+
+    async def load_persisted(self, name=None):
+        """從磁碟載入比記憶體中更新的快照，回傳有載入的來源名稱"""
+        if self.persistent is None:
+            return []
+        loaded = []
+        for source_name in [name] if name else list(self._sources):
+            source = self._sources[source_name]
+            entry = await self.persistent.call(
+                self.persistent.get, PERSIST_NAMESPACE, source_name, source.version
+            )
+            if entry is None:
+                continue
+            items, stored_at = entry
+            if source.refreshed_at is not None and stored_at <= source.refreshed_at:
+                continue
+            source.last_delta = source.collection.apply(items)
+            source.refreshed_at = stored_at
+            source.persisted_loads += 1
+            loaded.append(source_name)
+        return loaded
+
+    async def refresh(self, name):
+        if self.persistent is None:
+            await self._fetch(name)
+            return
+        # 其他 worker 在這個間隔內已經更新過，直接使用它寫入的快照
+        await self.load_persisted(name)
+        age = self.age(name)
+        if age is not None and age < self.interval:
+            return
+        async with self.persistent.lease(f"{PERSIST_NAMESPACE}:{name}", ttl=max(self.interval, 60), wait=False) as acquired:
+            if not acquired:
+                # 另一個 worker 正在更新，下一輪再從磁碟讀取結果
+                return
+            if await self._fetch(name):
+                source = self._sources[name]
+                await self.persistent.call(
+                    self.persistent.put, PERSIST_NAMESPACE, name, source.collection.items, PERSIST_TTL, source.version
+                )
+
+    async def refresh_all(self):
+        await asyncio.gather(*[self.refresh(name) for name in self._sources])
+
+    async def _run(self):
+        while True:
+            await self.refresh_all()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "enabled": SNAPSHOT_ENABLED,
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "persistent": self.persistent is not None,
+            "sources": {
+                name: {
+                    "items": len(source.collection.items),
+                    "age_seconds": round(self.age(name), 3) if source.refreshed_at else None,
+                    "refresh_ms": source.refresh_ms,
+                    "last_delta": source.last_delta,
+                    "last_error": source.last_error,
+                    "persisted_loads": source.persisted_loads,
+                }
+                for name, source in self._sources.items()
+            },
+        }
+
+
+snapshot = InventorySnapshot(persistent=persistent_cache)
@@ -2,17 +2,45 @@
 Project: cjc101-starscout
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from aws_clients import client_pool, mark_ready, startup_stats
+from aws_executor import shutdown_executor
+from instrumentation import PrometheusMiddleware, instrument_aws, register_cache, register_collector, render
+from inventory_snapshot import SNAPSHOT_ENABLED, snapshot
+from metrics_engine import metrics_engine
+from persistent_cache import persistent_cache
+from rate_limiter import rate_limiter
 from ec2_monitor import router as ec2_router
-from billing_helper import router as billing_router
-from apprunner_monitor import router as apprunner_router
-from bedrock_guardrail import router as bedrock_router
+from billing_helper import cost_cache, router as billing_router
+from apprunner_monitor import restart_jobs, router as apprunner_router
+from bedrock_guardrail import cloudtrail_ingestor, router as bedrock_router
+
+@asynccontextmanager
+async def lifespan(app):
+    if persistent_cache is not None:
+        # 先載入磁碟上的快照，重啟後的第一個請求就能使用
+        await persistent_cache.call(persistent_cache.purge)
+        await snapshot.load_persisted()
+    # 持久化的 Guardrail 事件與 CloudTrail 檢查點（未設定時為空）
+    await cloudtrail_ingestor.restore()
+    if SNAPSHOT_ENABLED:
+        snapshot.start()
+    mark_ready()
+    yield
+    await snapshot.stop()
+    await restart_jobs.shutdown()
+    shutdown_executor()
 
 app = FastAPI(
     title="CJC101-StarScout AWS Multi-Scenario Monitoring API",
     description="API to monitor AWS EC2, Billing, App Runner, and Bedrock Guardrail for project cjc101-starscout",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
+app.add_middleware(PrometheusMiddleware)
+instrument_aws(client_pool)
 
 # 掛載不同情境的路由
 app.include_router(ec2_router, prefix="/ec2", tags=["EC2 Monitoring"])
@@ -24,3 +52,79 @@ app.include_router(bedrock_router, prefix="/bedrock", tags=["Bedrock Guardrail"]
 async def root():
     return {"message": "Welcome to cjc101-starscout AWS Multi-Scenario Monitoring API"}
 
+
+@app.get("/startup-stats")
+async def get_startup_stats():
+    """啟動時間、記憶體用量與已建立的 AWS clients"""
+    return startup_stats()
+
+
+@app.get("/snapshot-stats")
+async def get_snapshot_stats():
+    """背景盤點快照的狀態：各資料來源的筆數、資料新舊與最近一次的變動量"""
+    return snapshot.stats()
+
+
+@app.get("/metrics-cache-stats")
+async def get_metrics_cache_stats():
+    """CloudWatch metrics 查詢引擎的快取狀態：series 數、bucket 命中率與上游呼叫次數"""
+    return metrics_engine.stats()
+
+
+@app.get("/rate-limit-stats")
+async def get_rate_limit_stats():
+    """各 AWS API 的 client 端速率限制：規則、放行與排隊次數、累計等待時間"""
+    return rate_limiter.stats()
+
+
+@app.get("/persistent-cache-stats")
+async def get_persistent_cache_stats():
+    """持久化快取（SQLite）的筆數、檔案大小與命中率；未啟用時回傳 enabled = false"""
+    if persistent_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await persistent_cache.call(persistent_cache.stats)}
+
+
+def _metrics_engine_buckets():
+    stats = metrics_engine.stats()
+    fetched = stats["buckets_fetched"]
+    return max(stats["buckets_served"] - fetched, 0), fetched
+
+
+def _snapshot_samples():
+    sources = snapshot.stats()["sources"]
+    return [
+        ("inventory_snapshot_age_seconds", "gauge", "Age of each inventory snapshot source.",
+         [({"source": name}, source.get("age_seconds")) for name, source in sources.items()]),
+    ]
+
+
+def _rate_limit_samples():
+    buckets = rate_limiter.stats()["buckets"]
+    samples = {"queued": [], "wait_seconds": []}
+    for key, bucket in buckets.items():
+        name, _, region = key.partition("@")
+        service, _, operation = name.partition(".")
+        labels = {"service": service, "operation": operation, "region": region}
+        samples["queued"].append((labels, bucket["queued"]))
+        samples["wait_seconds"].append((labels, bucket["wait_seconds"]))
+    return [
+        ("aws_rate_limit_queued_total", "counter", "AWS API calls delayed by the client-side rate limiter.",
+         samples["queued"]),
+        ("aws_rate_limit_wait_seconds_total", "counter", "Time AWS API calls spent queued by the rate limiter.",
+         samples["wait_seconds"]),
+    ]
+
+
+register_cache("cost_query", lambda: (cost_cache.hits + cost_cache.coalesced, cost_cache.misses))
+register_cache("metrics_buckets", _metrics_engine_buckets)
+if persistent_cache is not None:
+    register_cache("persistent", lambda: (persistent_cache.hits, persistent_cache.misses))
+register_collector(_snapshot_samples)
+register_collector(_rate_limit_samples)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text format 的執行期指標：各路由與各 AWS API 的延遲、重試、throttle 與快取命中率"""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,74 @@
+"""
+CloudWatch GetMetricData 批次查詢
+
+把多個 (namespace, metric, dimensions, stat) 查詢合併成 get_metric_data 呼叫，
+每次最多 500 個 metric，並處理 NextToken 分頁，回傳依時間排序的精簡 time series。
+"""
+
+import asyncio
+
+from aws_executor import run_aws
+
+MAX_QUERIES_PER_CALL = 500
+
+
+def metric_query(query_id, namespace, metric_name, dimensions, stat, period, unit=None):
+    """建立一筆 MetricDataQuery；query_id 需符合 ^[a-z][a-zA-Z0-9_]*$"""
+    metric_stat = {
+        "Metric": {
+            "Namespace": namespace,
+            "MetricName": metric_name,
+            "Dimensions": [{"Name": name, "Value": value} for name, value in dimensions],
+        },
+        "Period": period,
+        "Stat": stat,
+    }
+    if unit:
+        metric_stat["Unit"] = unit
+    return {"Id": query_id, "MetricStat": metric_stat, "ReturnData": True}
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def _fetch_chunk(client, queries, start_time, end_time, counter):
+    series = {q["Id"]: {} for q in queries}
+    token = None
+    while True:
+        params = {
+            "MetricDataQueries": queries,
+            "StartTime": start_time,
+            "EndTime": end_time,
+            "ScanBy": "TimestampAscending",
+        }
+        if token:
+            params["NextToken"] = token
+        response = await run_aws("cloudwatch", client.get_metric_data, **params)
+        counter["calls"] += 1
+        for result in response.get("MetricDataResults", []):
+            points = series.setdefault(result["Id"], {})
+            points.update(zip(result.get("Timestamps", []), result.get("Values", [])))
+        token = response.get("NextToken")
+        if not token:
+            return series
+
+
+async def get_metric_data_batched(client, queries, start_time, end_time):
+    """
+    執行多筆 MetricDataQuery，回傳 ({query id: (timestamps, values)}, 上游呼叫次數)。
+
+    查詢會切成每批 500 筆並同時送出（受 aws_executor 的 cloudwatch 併發上限控制）。
+    """
+    counter = {"calls": 0}
+    chunks = await asyncio.gather(*[
+        _fetch_chunk(client, chunk, start_time, end_time, counter)
+        for chunk in chunked(list(queries), MAX_QUERIES_PER_CALL)
+    ])
+    results = {}
+    for series in chunks:
+        for query_id, points in series.items():
+            timestamps = sorted(points)
+            results[query_id] = (timestamps, [points[ts] for ts in timestamps])
+    return results, counter["calls"]
@@ -0,0 +1,265 @@
+"""
+共用的 CloudWatch metrics 查詢引擎
+
+各 router 以 (namespace, metric, dimensions, stat) + 時間窗查詢，引擎負責：
+- 把時間窗對齊到 period 邊界，並把同一時間範圍的查詢合併成 get_metric_data 批次呼叫；
+- 快取已結束（不會再變動）的 bucket，滑動時間窗只需要抓最新的幾個 bucket；
+- 尚未結束的 bucket 短暫快取（預設 60 秒），密集輪詢的 dashboard 幾乎不產生上游呼叫；
+- max_points：datapoint 過多時改用較大的 period（由 CloudWatch 彙總，即降採樣）。
+
+環境變數：
+- METRICS_SETTLE_SECONDS：bucket 結束後多久視為資料不再變動（預設 600）
+- METRICS_OPEN_TTL：尚未結束的 bucket 快取秒數（預設 60）
+- METRICS_MAX_SERIES：快取的 time series 數量上限（LRU，預設 5000）
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional, Tuple
+
+from aws_clients import cloudwatch_client
+from metric_batch import get_metric_data_batched, metric_query
+
+SETTLE_SECONDS = float(os.getenv("METRICS_SETTLE_SECONDS", 600))
+OPEN_TTL = float(os.getenv("METRICS_OPEN_TTL", 60))
+MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", 5000))
+MAX_BUCKETS_PER_SERIES = 20160  # 60 秒 period 兩週
+
+# CloudWatch 依資料年齡提供的最小 period：(超過幾秒前, 最小 period)
+RETENTION_PERIODS = [(63 * 86400, 3600), (15 * 86400, 300)]
+
+
+class MetricSpec(NamedTuple):
+    namespace: str
+    metric_name: str
+    dimensions: Tuple[Tuple[str, str], ...]
+    stat: str
+    unit: Optional[str] = None
+
+
+class MetricWindow(NamedTuple):
+    """查詢結果：buckets 為各 bucket 起點（epoch 秒），values 與 specs 順序對應，缺資料為 None"""
+    period: int
+    buckets: list
+    values: list
+    upstream_calls: int
+
+    def timestamps(self):
+        return [datetime.fromtimestamp(bucket, timezone.utc).isoformat() for bucket in self.buckets]
+
+
+def resolve_period(start, end, period=60, max_points=None, now=None):
+    """依資料年齡與 max_points 決定實際 period（60 秒的倍數）"""
+    now = time.time() if now is None else now
+    period = max(60, int(math.ceil(period / 60)) * 60)
+    for age, min_period in RETENTION_PERIODS:
+        if start < now - age:
+            period = max(period, min_period)
+            break
+    if max_points and (end - start) / period > max_points:
+        period = int(math.ceil((end - start) / max_points / period)) * period
+    return period
+
+
+def _epoch(ts):
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.timestamp())
+
+
+class _SeriesCache:
+    """單一 (spec, period) 的快取：連續的已結束區間 [lo, hi) 與最近一次抓取的未結束 bucket"""
+
+    __slots__ = ("lo", "hi", "closed", "open_at", "open_lo", "open_hi", "open")
+
+    def __init__(self):
+        self.lo = self.hi = None
+        self.closed = {}
+        self.open_at = None
+        self.open_lo = self.open_hi = None
+        self.open = {}
+
+    def _open_covers(self, start, end, now, open_ttl):
+        return (
+            self.open_at is not None and now - self.open_at <= open_ttl
+            and self.open_lo <= start and end <= self.open_hi
+        )
+
+    def missing(self, start, end, closed_limit, now, open_ttl):
+        """回傳需要向 CloudWatch 抓取的 [start, end)，不需要時回傳 None"""
+        spans = []
+        open_start = max(start, closed_limit)
+        need_open = open_start < end and not self._open_covers(open_start, end, now, open_ttl)
+        if need_open:
+            spans.append((open_start, end))
+        closed_end = min(end, closed_limit)
+        if start < closed_end:
+            if self.lo is None or closed_end < self.lo or start > self.hi:
+                spans.append((start, closed_end))
+            else:
+                if start < self.lo:
+                    spans.append((start, self.lo))
+                # 剛結束的 bucket 若還在未過期的未結束快取內先沿用；
+                # 需要重新抓未結束的 bucket 時一併抓取，轉為已結束
+                if self.hi < closed_end and (need_open or not self._open_covers(self.hi, closed_end, now, open_ttl)):
+                    spans.append((self.hi, closed_end))
+        if not spans:
+            return None
+        return min(s for s, _ in spans), max(e for _, e in spans)
+
+    def store(self, start, end, points, closed_limit, now):
+        closed_end = min(end, closed_limit)
+        if start < closed_end:
+            closed_points = {b: v for b, v in points.items() if b < closed_end}
+            if self.lo is None or closed_end < self.lo or start > self.hi:
+                self.lo, self.hi, self.closed = start, closed_end, closed_points
+            else:
+                self.lo, self.hi = min(self.lo, start), max(self.hi, closed_end)
+                self.closed.update(closed_points)
+        open_start = max(start, closed_limit)
+        if open_start < end:
+            self.open_at, self.open_lo, self.open_hi = now, open_start, end
+            self.open = {b: v for b, v in points.items() if b >= open_start}
+
+    def trim(self, period):
+        # 只保留最新的 MAX_BUCKETS_PER_SERIES 個已結束 bucket
+        if self.lo is not None and (self.hi - self.lo) // period > MAX_BUCKETS_PER_SERIES:
+            self.lo = self.hi - MAX_BUCKETS_PER_SERIES * period
+            self.closed = {b: v for b, v in self.closed.items() if b >= self.lo}
+
+    def read(self, buckets):
+        lo, hi = (self.lo, self.hi) if self.lo is not None else (0, 0)
+        return [self.closed.get(b) if lo <= b < hi else self.open.get(b) for b in buckets]
+
+
+class MetricsEngine:
+    def __init__(self, client, settle_seconds=SETTLE_SECONDS, open_ttl=OPEN_TTL, max_series=MAX_SERIES,
+                 clock=time.time):
+        self.client = client
+        self.settle_seconds = settle_seconds
+        self.open_ttl = open_ttl
+        self.max_series = max_series
+        self._clock = clock
+        self._series = OrderedDict()
+        self._inflight = {}
+        self._counters = {
+            "queries": 0, "fetches": 0, "upstream_calls": 0,
+            "buckets_served": 0, "buckets_fetched": 0, "evictions": 0,
+        }
+
+    def _series_cache(self, key):
+        cache = self._series.get(key)
+        if cache is None:
+            cache = self._series[key] = _SeriesCache()
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+                self._counters["evictions"] += 1
+        else:
+            self._series.move_to_end(key)
+        return cache
+
+    async def query(self, specs, start, end, period=60, max_points=None):
+        """
+        查詢 specs 在 [start, end)（epoch 秒或 datetime）的 time series。
+
+        時間窗會對齊到 period 邊界（結束時間往後取整，長度不變）；
+        同一次查詢中需要補抓的 series 依抓取範圍分組，每組一次批次 get_metric_data。
+        """
+        if isinstance(start, datetime):
+            start = start.timestamp()
+        if isinstance(end, datetime):
+            end = end.timestamp()
+        now = self._clock()
+        period = resolve_period(start, end, period, max_points, now)
+        aligned_end = int(math.ceil(end / period)) * period
+        aligned_start = aligned_end - int(math.ceil((end - start) / period)) * period
+        closed_limit = int((now - self.settle_seconds) // period) * period
+
+        specs = [MetricSpec(spec[0], spec[1], tuple(map(tuple, spec[2])), *spec[3:]) for spec in specs]
+        keys = [(spec, period) for spec in specs]
+        # 查詢期間持有各 series 的快取物件：series 數超過 max_series 時，LRU 會淘汰本次查詢
+        # 先前取得的 series，但寫入與最後讀取都使用這裡的參照，結果不會因淘汰而變成空的
+        caches = {key: self._series_cache(key) for key in dict.fromkeys(keys)}
+        self._counters["queries"] += 1
+        calls = 0
+
+        while True:
+            groups = {}
+            waits = set()
+            for key, cache in caches.items():
+                if key in self._inflight:
+                    waits.add(self._inflight[key])
+                    continue
+                span = cache.missing(aligned_start, aligned_end, closed_limit, now, self.open_ttl)
+                if span is not None:
+                    groups.setdefault(span, []).append(key)
+            if not waits:
+                break
+            # 其他請求正在抓同一個 series，等它完成後重新判斷是否還缺資料
+            await asyncio.gather(*waits, return_exceptions=True)
+
+        if groups:
+            future = asyncio.get_running_loop().create_future()
+            for group in groups.values():
+                for key in group:
+                    self._inflight[key] = future
+            try:
+                results = await asyncio.gather(*[
+                    self._fetch(span, group, caches, period, closed_limit, now) for span, group in groups.items()
+                ])
+                calls = sum(results)
+            finally:
+                for group in groups.values():
+                    for key in group:
+                        self._inflight.pop(key, None)
+                future.set_result(None)
+
+        buckets = list(range(aligned_start, aligned_end, period))
+        values = [caches[key].read(buckets) for key in keys]
+        self._counters["buckets_served"] += len(buckets) * len(keys)
+        return MetricWindow(period, buckets, values, calls)
+
+    async def _fetch(self, span, keys, caches, period, closed_limit, now):
+        start, end = span
+        queries = [
+            metric_query(f"q{i}", spec.namespace, spec.metric_name, spec.dimensions, spec.stat, period, spec.unit)
+            for i, (spec, _) in enumerate(keys)
+        ]
+        results, calls = await get_metric_data_batched(
+            self.client,
+            queries,
+            datetime.fromtimestamp(start, timezone.utc),
+            datetime.fromtimestamp(end, timezone.utc),
+        )
+        for i, key in enumerate(keys):
+            timestamps, values = results.get(f"q{i}", ([], []))
+            points = {_epoch(ts): value for ts, value in zip(timestamps, values)}
+            cache = caches[key]
+            cache.store(start, end, points, closed_limit, now)
+            cache.trim(period)
+        self._counters["fetches"] += 1
+        self._counters["upstream_calls"] += calls
+        self._counters["buckets_fetched"] += (end - start) // period * len(keys)
+        return calls
+
+    def clear(self):
+        self._series.clear()
+
+    def stats(self):
+        served = self._counters["buckets_served"]
+        return {
+            "series": len(self._series),
+            "max_series": self.max_series,
+            "cached_buckets": sum(len(c.closed) for c in self._series.values()),
+            "settle_seconds": self.settle_seconds,
+            "open_ttl": self.open_ttl,
+            **self._counters,
+            "bucket_hit_ratio": round(max(0.0, 1 - self._counters["buckets_fetched"] / served), 4) if served else None,
+        }
+
+
+metrics_engine = MetricsEngine(cloudwatch_client)
@@ -0,0 +1,205 @@
+"""
+選用的持久化快取（SQLite）
+
+把每日成本與盤點快照存到本機磁碟，同一台主機上的所有 uvicorn workers 共用：
+- 容器重啟或新 worker 啟動時直接讀取磁碟上的資料，不必重新呼叫 Cost Explorer / 掃描 EC2；
+- 跨 process 的 lease：同一份資料同時只有一個 worker 向 AWS 查詢，其他 worker 等結果寫入後讀取。
+
+每筆資料有 TTL 與資料格式版本（version），版本不符視為不存在；
+資料表結構版本存在 PRAGMA user_version，不符時重建。
+值以 pickle 序列化，檔案只應放在本機、由本服務寫入的目錄。
+
+環境變數：
+- PERSISTENT_CACHE_PATH：SQLite 檔案路徑；未設定時停用（預設停用）
+"""
+
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from aws_executor import get_executor
+
+PERSISTENT_CACHE_PATH = os.getenv("PERSISTENT_CACHE_PATH", "")
+SCHEMA_VERSION = 1
+
+
+class PersistentCache:
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lease_waits = 0
+        self._init_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 每個 thread 各自一個連線；WAL 模式讓多個 process 可同時讀、一個寫
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS entries")
+                conn.execute("DROP TABLE IF EXISTS leases")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, version INTEGER NOT NULL,"
+                " value BLOB NOT NULL, stored_at REAL NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                " name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get(self, namespace, key, version):
+        """回傳 (value, stored_at)；不存在、過期或版本不符時回傳 None"""
+        row = self._connect().execute(
+            "SELECT value, stored_at FROM entries"
+            " WHERE namespace = ? AND key = ? AND version = ? AND expires_at > ?",
+            (namespace, key, version, self._clock()),
+        ).fetchone()
+        self._count(row is not None, row is None)
+        return (pickle.loads(row[0]), row[1]) if row else None
+
+    def get_range(self, namespace, start_key, end_key, version):
+        """回傳 key 介於 [start_key, end_key) 的 [(key, value, stored_at)]，依 key 排序"""
+        rows = self._connect().execute(
+            "SELECT key, value, stored_at FROM entries"
+            " WHERE namespace = ? AND key >= ? AND key < ? AND version = ? AND expires_at > ?"
+            " ORDER BY key",
+            (namespace, start_key, end_key, version, self._clock()),
+        ).fetchall()
+        self._count(bool(rows), not rows)
+        return [(key, pickle.loads(value), stored_at) for key, value, stored_at in rows]
+
+    def put_many(self, namespace, items, version):
+        """寫入 [(key, value, ttl)]，同一個 transaction"""
+        now = self._clock()
+        rows = [
+            (namespace, key, version, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now, now + ttl)
+            for key, value, ttl in items
+        ]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.writes += len(rows)
+
+    def put(self, namespace, key, value, ttl, version):
+        self.put_many(namespace, [(key, value, ttl)], version)
+
+    def delete(self, namespace, key=None):
+        if key is None:
+            self._connect().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        else:
+            self._connect().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def delete_prefix(self, prefix):
+        """刪除 namespace 以 prefix 開頭的所有資料"""
+        return self._connect().execute(
+            "DELETE FROM entries WHERE substr(namespace, 1, ?) = ?", (len(prefix), prefix)
+        ).rowcount
+
+    def purge(self):
+        """刪除過期的資料與 lease"""
+        now = self._clock()
+        conn = self._connect()
+        deleted = conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,)).rowcount
+        conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+        return deleted
+
+    def try_acquire(self, name, owner, ttl):
+        """取得 lease；已被其他 owner 持有且未過期時回傳 False"""
+        now = self._clock()
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+            " WHERE leases.expires_at <= ? OR leases.owner = excluded.owner",
+            (name, owner, now + ttl, now),
+        )
+        row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == owner
+
+    def release(self, name, owner):
+        self._connect().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    async def call(self, fn, *args):
+        """在共用 thread pool 上執行 SQLite 操作，不阻塞 event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), fn, *args)
+
+    @asynccontextmanager
+    async def lease(self, name, ttl=60, wait=True, poll_interval=0.1):
+        """
+        跨 process 的 lease。wait=True 時等到取得為止（持有者異常結束時最多等 ttl 秒），
+        yield 是否取得；wait=False 時取不到立即 yield False。
+        """
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        acquired = await self.call(self.try_acquire, name, owner, ttl)
+        if not acquired and wait:
+            with self._lock:
+                self.lease_waits += 1
+            while not acquired:
+                await asyncio.sleep(poll_interval)
+                acquired = await self.call(self.try_acquire, name, owner, ttl)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                await self.call(self.release, name, owner)
+
+    def stats(self):
+        conn = self._connect()
+        namespaces = dict(conn.execute(
+            "SELECT namespace, COUNT(*) FROM entries WHERE expires_at > ? GROUP BY namespace", (self._clock(),)
+        ).fetchall())
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "schema_version": SCHEMA_VERSION,
+            "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "entries": namespaces,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "lease_waits": self.lease_waits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+persistent_cache = PersistentCache(PERSISTENT_CACHE_PATH) if PERSISTENT_CACHE_PATH else None
@@ -0,0 +1,95 @@
+"""
+TTL + LRU 的非同步查詢快取，並合併同時進行的相同查詢（request coalescing）
+
+同一個 key 同時有多個請求時，只會有一個實際的上游呼叫，其他請求等待同一個結果；
+上游呼叫失敗時不會寫入快取，錯誤會傳給所有等待中的請求。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class AsyncTTLCache:
+    def __init__(self, max_entries=256, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value, ttl):
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_fetch(self, key, fetch, ttl, refresh=False):
+        """
+        取得快取值；未命中時呼叫 `fetch()`（回傳 awaitable）並以 `ttl` 秒寫入快取。
+
+        refresh=True 時略過既有快取強制重新查詢，但仍會與進行中的相同查詢合併。
+        """
+        if refresh:
+            self.refreshes += 1
+        else:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        task = asyncio.ensure_future(fetch())
+        self._inflight[key] = task
+
+        def _on_done(done):
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+            if not done.cancelled() and done.exception() is None:
+                self._store(key, done.result(), ttl)
+
+        task.add_done_callback(_on_done)
+        # shield：發起者被取消時，上游呼叫仍會完成並寫入快取，其他等待者不受影響
+        return await asyncio.shield(task)
+
+    def invalidate(self, key=None):
+        """移除單一 key，或未指定時清空整個快取"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,187 @@
+"""
+各 AWS API 的 client 端 token bucket 限流
+
+AWS 對每個 API 各有請求速率上限，超過時回傳 ThrottlingException；
+同時大量的 dashboard 請求會觸發 throttle、重試、再 throttle。這裡在送出前先排隊：
+每個 (服務, operation) 一個 token bucket，token 不足的呼叫等到輪到自己才送出，而不是失敗。
+
+排隊有兩個入口：
+- run_aws：在 event loop 上 `await acquire_async`，等待時不佔用 thread；
+  取得後在 thread 上標記「已放行」，該次 boto3 呼叫的 before-call hook 不再等待；
+- botocore before-call hook：未經 run_aws 的呼叫（例如 paginator 的後續頁面）在 thread 上等待。
+
+以預約方式實作：token 可以預支成負數，等待時間 = 欠的 token / 速率，因此呼叫依到達順序放行。
+AWS 的速率上限以 region 為單位，因此每個 region 各自一組 bucket（規則相同）。
+
+環境變數：
+- AWS_API_RATE_LIMITS：例如 "ce=5,cloudwatch.GetMetricData=50,ec2.DescribeInstances=20:40"；
+  "服務=速率" 套用到該服務的每個 operation（各自一個 bucket），"服務.Operation" 優先；
+  ":burst" 為 bucket 容量（預設等於速率）。未列出的 API 不限流。
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+DEFAULT_RATE_LIMITS = "ce=5,cloudwatch.GetMetricData=50"
+
+
+def parse_rate_limits(raw):
+    """解析 "ce=5,cloudwatch.GetMetricData=50:100"，回傳 {(服務, operation 或 None): (速率, 容量)}"""
+    rules = {}
+    for item in (raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.partition("=")
+        service, _, operation = name.strip().partition(".")
+        rate, _, burst = value.partition(":")
+        try:
+            rate = float(rate)
+            burst = float(burst) if burst else max(rate, 1.0)
+        except ValueError:
+            raise RuntimeError(f"Invalid AWS_API_RATE_LIMITS entry: {item!r}")
+        if rate <= 0 or burst < 1:
+            raise RuntimeError(f"Invalid AWS_API_RATE_LIMITS entry: {item!r}")
+        rules[(service, operation or None)] = (rate, burst)
+    return rules
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.queued = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def reserve(self):
+        """預約一個 token，回傳需要等待的秒數"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            self.admitted += 1
+            if self._tokens >= 0:
+                return 0.0
+            wait = -self._tokens / self.rate
+            self.queued += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            return wait
+
+    def cancel(self):
+        """取消尚未使用的預約（例如等待中的 task 被取消）"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+            self.admitted -= 1
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+        }
+
+
+class RateLimiter:
+    def __init__(self, rules, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.configure(rules)
+
+    def configure(self, rules):
+        """替換限流規則；既有的 bucket 與統計一併清除"""
+        with self._lock:
+            self._rules = dict(rules)
+            self._services = {service for service, _ in self._rules}
+            self._buckets = {}
+
+    def bucket(self, service, operation, region=None):
+        """回傳 (服務, operation, region) 的 bucket；沒有對應規則時回傳 None"""
+        key = (service, operation, region)
+        bucket = self._buckets.get(key)
+        if bucket is not None or service not in self._services:
+            return bucket
+        rule = self._rules.get((service, operation)) or self._rules.get((service, None))
+        if rule is None:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(*rule, clock=self._clock)
+        return bucket
+
+    async def acquire_async(self, service, operation, region=None):
+        """在 event loop 上排隊，回傳是否經過限流（True 時呼叫端應以 admitted() 執行）"""
+        bucket = self.bucket(service, operation, region)
+        if bucket is None:
+            return False
+        wait = bucket.reserve()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                bucket.cancel()
+                raise
+        return True
+
+    def admitted(self, fn, *args, **kwargs):
+        """在 thread 上執行已放行的呼叫，該次 before-call hook 不再排隊"""
+        self._local.admitted = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._local.admitted = False
+
+    def before_call(self, model, context=None, **kwargs):
+        """botocore before-call hook：未經 run_aws 放行的呼叫在 thread 上等待"""
+        if getattr(self._local, "admitted", False):
+            # 放行只對第一個 API 呼叫有效，同一個函式裡的後續呼叫仍需排隊
+            self._local.admitted = False
+            return
+        region = (context or {}).get("client_region")
+        bucket = self.bucket(model.service_model.service_name, model.name, region)
+        if bucket is not None:
+            wait = bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+
+    def stats(self):
+        return {
+            "rules": {
+                f"{service}.{operation}" if operation else service: {"rate": rate, "burst": burst}
+                for (service, operation), (rate, burst) in self._rules.items()
+            },
+            "buckets": {
+                f"{service}.{operation}@{region}" if region else f"{service}.{operation}": bucket.stats()
+                for (service, operation, region), bucket in list(self._buckets.items())
+            },
+        }
+
+
+def client_operation(fn):
+    """若 fn 是 boto3 client 的方法，回傳 (服務, operation, region)，否則回傳 None"""
+    client = getattr(fn, "__self__", None)
+    meta = getattr(client, "meta", None)
+    mapping = getattr(meta, "method_to_api_mapping", None)
+    if not mapping:
+        return None
+    operation = mapping.get(getattr(fn, "__name__", None))
+    if operation is None:
+        return None
+    return meta.service_model.service_name, operation, meta.region_name
+
+
+rate_limiter = RateLimiter(parse_rate_limits(os.getenv("AWS_API_RATE_LIMITS", DEFAULT_RATE_LIMITS)))